@@ -35,6 +35,7 @@
 #------------------------------------------------------------------------
 import copy
 import io
+import json
 import os
 import shutil
 import sys
@@ -103,6 +104,13 @@ class AncestralCollapsibleTreeReport(Report):
 
         self.map = {}
 
+        # Caches, indexed by person handle, of the person JSON fields and
+        # of the (father handle, mother handle) birth parents
+        self.people = {}
+        self.parents = {}
+        # Cache of the ancestor subtrees, indexed by (handle, generation)
+        self.subtrees = {}
+
         menu = options.menu
         self.max_gen = menu.get_option_by_name('maxgen').get_value()
         self.male_bg = menu.get_option_by_name('male_bg').get_value()
@@ -130,15 +138,6 @@ class AncestralCollapsibleTreeReport(Report):
         if name_format != 0:
             self._name_display.set_default_format(name_format)
 
-    def pad_str(self, num_spaces):
-        """
-        Utility method to retrieve string with specific number of spaces
-        """
-        pad_str = ""
-        for i in range(0, num_spaces):
-            pad_str = pad_str + " "
-        return pad_str
-
     def get_gender_str(self, person):
         """
         Return gender string of male/female/unknown
@@ -150,30 +149,16 @@ class AncestralCollapsibleTreeReport(Report):
         else:
             return "unknown"
 
-    def json_filter(self, person_handle, generation=1):
+    def get_person_fields(self, person_handle):
         """
-        Recursable JSON generation method. Processing each parent in a
-        recursive nature
+        Return the JSON encoded fields (name, gender, born, died, gramps_id)
+        of a person. The fields are computed once per person.
         """
-        # check for end of the current recursion level. This happens
-        # if the person handle is None, or if the max_gen is hit
-        if not person_handle or generation > self.max_gen:
-            return
+        if person_handle in self.people:
+            return self.people[person_handle]
 
-        # retrieve the Person instance from the database from the
-        # passed person_handle and find the parents from the list.
-        # Since this report is for natural parents (birth parents),
-        # we have to handle that parents may not
         person = self.database.get_person_from_handle(person_handle)
-
-        gen_pad = (generation-1) * 2
-
         name = self._name_display.display(person)
-        self.json_fp.write('%s{\n' % (self.pad_str(gen_pad)))
-        self.json_fp.write('%s"name": "%s",\n' %
-            (self.pad_str(gen_pad+1), name.replace('"', "'")))
-        self.json_fp.write('%s"gender": "%s",\n' %
-            (self.pad_str(gen_pad+1), self.get_gender_str(person)))
 
         # Get Birth/Death dates if they exist
         birth_year = 0
@@ -190,16 +175,32 @@ class AncestralCollapsibleTreeReport(Report):
             if death_event:
                 death_year = death_event.get_date_object().get_year()
 
-        self.json_fp.write('%s"born": "%s",\n' %
-            (self.pad_str(gen_pad+1),
-            str(birth_year) if birth_year != 0 else ""))
-        self.json_fp.write('%s"died": "%s",\n' %
-            (self.pad_str(gen_pad+1),
-            str(death_year) if death_year != 0 else ""))
-
-        self.json_fp.write('%s"gramps_id": "%s"' %
-            (self.pad_str(gen_pad+1), str(person.get_gramps_id())))
+        fields = [
+            ("name", name.replace('"', "'")),
+            ("gender", self.get_gender_str(person)),
+            ("born", str(birth_year) if birth_year != 0 else ""),
+            ("died", str(death_year) if death_year != 0 else ""),
+            ("gramps_id", str(person.get_gramps_id())),
+            ]
+        self.people[person_handle] = ",".join(
+            "%s:%s" % (json.dumps(key), json.dumps(value, ensure_ascii=False))
+            for (key, value) in fields)
+        self.parents[person_handle] = self.find_parent_handles(person)
+        return self.people[person_handle]
+
+    def get_parent_handles(self, person_handle):
+        """
+        Retrieve father and mother handles for a person, if they exist
+        """
+        if person_handle not in self.parents:
+            self.get_person_fields(person_handle)
+        return self.parents[person_handle]
 
+    def find_parent_handles(self, person):
+        """
+        Find the birth father and mother handles of a person
+        """
+        person_handle = person.get_handle()
         father_handle = None
         mother_handle = None
         for family_handle in person.get_parent_family_handle_list():
@@ -225,29 +226,48 @@ class AncestralCollapsibleTreeReport(Report):
                    ref[0].get_mother_relation() == ChildRefType.BIRTH:
                     mother_handle = family.get_mother_handle()
 
-        # Recursively call the function. It is okay if the handle is None,
-        # since routine handles a handle of None
-        if (not father_handle and not mother_handle) or \
-            generation == self.max_gen:
-            self.json_fp.write('\n')
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-        else:
-            self.json_fp.write(',\n')
-            self.json_fp.write('%s"children": [\n' %
-                (self.pad_str(gen_pad+1)))
-
-            self.json_filter(father_handle, generation+1)
+        return (father_handle, mother_handle)
 
-            if father_handle and mother_handle:
-                self.json_fp.write(',\n')
-            elif mother_handle:
-                self.json_fp.write('\n')
-
-            self.json_filter(mother_handle, generation+1)
-            self.json_fp.write('\n')
+    def json_filter(self, person_handle, generation=1):
+        """
+        Recursable ancestor tree generation method. Processing each parent
+        in a recursive nature.
 
-            self.json_fp.write('%s]\n' % (self.pad_str(gen_pad+1)))
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
+        Return the tree of a person as (JSON fields, list of parent trees),
+        or None if there is no person. The tree of an ancestor that appears
+        several times in the pedigree is built once for each generation.
+        """
+        # check for end of the current recursion level. This happens
+        # if the person handle is None, or if the max_gen is hit
+        if not person_handle or generation > self.max_gen:
+            return None
+
+        key = (person_handle, generation)
+        if key not in self.subtrees:
+            fields = self.get_person_fields(person_handle)
+            children = []
+            if generation < self.max_gen:
+                for parent_handle in self.get_parent_handles(person_handle):
+                    if parent_handle:
+                        children.append(
+                            self.json_filter(parent_handle, generation+1))
+            self.subtrees[key] = (fields, children)
+        return self.subtrees[key]
+
+    def write_json(self, tree):
+        """
+        Stream an ancestor tree, as built by json_filter, to the JSON file
+        """
+        (fields, children) = tree
+        self.json_fp.write('{' + fields)
+        if children:
+            self.json_fp.write(',"children":[')
+            for (i, child) in enumerate(children):
+                if i:
+                    self.json_fp.write(',')
+                self.write_json(child)
+            self.json_fp.write(']')
+        self.json_fp.write('}')
 
     def write_report(self):
         """
@@ -773,7 +793,8 @@ class AncestralCollapsibleTreeReport(Report):
 
                 # Call json_folter to build the json file of people in the
                 # database that match the ancestry.
-                self.json_filter(self.center_person.get_handle(), 1)
+                self.write_json(
+                    self.json_filter(self.center_person.get_handle(), 1))
 
         except IOError as msg:
             ErrorDialog(_("Failed writing %s: %s") % (self.destjson, str(msg)))
@@ -35,6 +35,7 @@
 #------------------------------------------------------------------------
 import copy
 import io
+import json
 import os
 import shutil
 import sys
@@ -101,6 +102,16 @@ class AncestralFanChartReport(Report):
 
         self.map = {}
 
+        # Caches, indexed by person handle, of the person display data,
+        # of the (father handle, mother handle) birth parents, and of the
+        # number of ancestor generations
+        self.people = {}
+        self.parents = {}
+        self.depths = {}
+        # Cache of the ancestor subtrees, indexed by
+        # (handle or gender for the empty ancestors, generation, family side)
+        self.subtrees = {}
+
         menu = options.menu
         self.max_ancestor = 1
         self.max_gen = menu.get_option_by_name('maxgen').get_value()
@@ -126,15 +137,6 @@ class AncestralFanChartReport(Report):
         if name_format != 0:
             self._name_display.set_default_format(name_format)
 
-    def pad_str(self, num_spaces):
-        """
-        Utility method to retrieve string with specific number of spaces
-        """
-        pad_str = ""
-        for i in range(0, num_spaces):
-            pad_str = pad_str + " "
-        return pad_str
-
     def get_gender_str(self, person):
         """
         Return gender string of male/female/unknown
@@ -146,12 +148,54 @@ class AncestralFanChartReport(Report):
         else:
             return "unknown"
 
+    def get_person_data(self, person_handle):
+        """
+        Return the display data (name, gender, born, died, gramps_id) of
+        a person. The data is computed once per person.
+        """
+        if person_handle in self.people:
+            return self.people[person_handle]
+
+        person = self.database.get_person_from_handle(person_handle)
+        name = self._name_display.display(person)
+
+        # Get Birth/Death dates if they exist
+        birth_year = 0
+        birth_ref = person.get_birth_ref()
+        if birth_ref and birth_ref.ref:
+            birth_event = self.database.get_event_from_handle(birth_ref.ref)
+            if birth_event:
+                birth_year = birth_event.get_date_object().get_year()
+
+        death_year = 0
+        death_ref = person.get_death_ref()
+        if death_ref and death_ref.ref:
+            death_event = self.database.get_event_from_handle(death_ref.ref)
+            if death_event:
+                death_year = death_event.get_date_object().get_year()
+
+        self.people[person_handle] = (
+            name.replace('"', "'"),
+            self.get_gender_str(person),
+            str(birth_year) if birth_year != 0 else "",
+            str(death_year) if death_year != 0 else "",
+            str(person.get_gramps_id()))
+        self.parents[person_handle] = self.find_parent_handles(person)
+        return self.people[person_handle]
+
     def get_parent_handles(self, person_handle):
         """
         Retrieve father and mother handles for a person, if they exist
         """
-        person = self.database.get_person_from_handle(person_handle)
+        if person_handle not in self.parents:
+            self.get_person_data(person_handle)
+        return self.parents[person_handle]
 
+    def find_parent_handles(self, person):
+        """
+        Find the birth father and mother handles of a person
+        """
+        person_handle = person.get_handle()
         father_handle = None
         mother_handle = None
         for family_handle in person.get_parent_family_handle_list():
@@ -179,181 +223,115 @@ class AncestralFanChartReport(Report):
 
         return (father_handle, mother_handle)
 
-
     def calc_max_ancestor(self, person_handle, generation=1):
         """
         Recursable filter on ancestors to calculate the maximum ancestor
         level for a person
         """
-        if not person_handle:
-            return
-
-        if generation > self.max_ancestor:
-            self.max_ancestor = generation
-
-        # Get parent handles if they exist
-        father_handle, mother_handle = self.get_parent_handles(person_handle)
-
-        if father_handle:
-            self.calc_max_ancestor(father_handle, generation+1)
-
-        if mother_handle:
-            self.calc_max_ancestor(mother_handle, generation+1)
+        self.max_ancestor = max(self.max_ancestor,
+                                generation - 1 + self.get_depth(person_handle))
 
-    def dummy_filter(self, gender, generation=1):
+    def get_depth(self, person_handle):
+        """
+        Return the number of generations of the ancestors of a person,
+        including the person. The depth is computed once per person.
+        """
+        if not person_handle:
+            return 0
+        if person_handle not in self.depths:
+            # Guard against a person being their own ancestor
+            self.depths[person_handle] = 1
+            self.depths[person_handle] = 1 + max(
+                self.get_depth(parent_handle)
+                for parent_handle in self.get_parent_handles(person_handle))
+        return self.depths[person_handle]
+
+    def get_fields(self, data, generation, fam_side):
+        """
+        Return the JSON encoded fields of a person, from its display data
+        """
+        (name, gender, born, died, gramps_id) = data
+        fields = [
+            ("name", name),
+            ("gender", gender),
+            ("born", born),
+            ("died", died),
+            ("generation", str(generation)),
+            ]
+        if generation == self.max_ancestor or generation == self.max_gen:
+            fields.append(("colour",
+                self.pat_bg if fam_side == "paternal" else self.mat_bg))
+        fields.append(("gramps_id", gramps_id))
+        return ",".join(
+            "%s:%s" % (json.dumps(key), json.dumps(value, ensure_ascii=False))
+            for (key, value) in fields)
+
+    def dummy_filter(self, gender, generation=1, fam_side=None):
         """
         Generate empty entries for this person to ensure all ancestor
         levels are equal.
         """
+        key = (gender, generation, fam_side)
+        if key not in self.subtrees:
+            fields = self.get_fields(("", gender, "", "", ""),
+                                     generation, fam_side)
+            children = []
+            if generation < self.max_gen and generation < self.max_ancestor:
+                # Need to generate some empty ancestors to satisfy
+                # max_ancestor
+                children = [
+                    self.dummy_filter("male", generation+1, fam_side),
+                    self.dummy_filter("female", generation+1, fam_side)]
+            self.subtrees[key] = (fields, children)
+        return self.subtrees[key]
+
+    def json_filter(self, person_handle, generation=1, fam_side=None):
+        """
+        Recursable ancestor tree generation method. Processing each parent
+        in a recursive nature.
 
-        gen_pad = (generation-1) * 2
-        self.json_fp.write('%s{\n' % (self.pad_str(gen_pad)))
-        self.json_fp.write('%s"name": "",\n' %
-            (self.pad_str(gen_pad+1)))
-        self.json_fp.write('%s"gender": "%s",\n' %
-            (self.pad_str(gen_pad+1), gender))
-        self.json_fp.write('%s"born": "",\n' %
-            (self.pad_str(gen_pad+1)))
-        self.json_fp.write('%s"died": "",\n' %
-            (self.pad_str(gen_pad+1)))
-        self.json_fp.write('%s"generation": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(generation)))
-
-        if generation == self.max_ancestor or generation == self.max_gen:
-            self.json_fp.write('%s"colour": "%s",\n' %
-                (self.pad_str(gen_pad+1),
-                self.pat_bg if self.fam_side == "paternal" else self.mat_bg))
-
-        self.json_fp.write('%s"gramps_id": ""' %
-            (self.pad_str(gen_pad+1)))
-
-        if generation == self.max_gen or generation == self.max_ancestor:
-            # No more levels required so close this person out.
-            self.json_fp.write('\n')
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-        elif generation < self.max_ancestor:
-            # Need to generate some empty ancestors to satisfy max_ancestor
-            self.json_fp.write(',\n')
-            self.json_fp.write('%s"children": [\n' %
-                (self.pad_str(gen_pad+1)))
-            self.dummy_filter("male", generation+1)
-            self.json_fp.write(',\n')
-            self.dummy_filter("female", generation+1)
-            self.json_fp.write('\n')
-            self.json_fp.write('%s]\n' % (self.pad_str(gen_pad+1)))
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-
-    def json_filter(self, person_handle, generation=1):
+        Return the tree of a person as (JSON fields, list of parent trees).
+        The tree of an ancestor that appears several times in the pedigree
+        is built once for each generation.
         """
-        Recursable JSON generation method. Processing each parent in a
-        recursive nature
+        key = (person_handle, generation, fam_side)
+        if key not in self.subtrees:
+            fields = self.get_fields(self.get_person_data(person_handle),
+                                     generation, fam_side)
+            children = []
+            if generation < self.max_gen and generation < self.max_ancestor:
+                # Get parent handles if they exist. Missing parents are
+                # replaced by empty ancestors
+                father_handle, mother_handle = \
+                    self.get_parent_handles(person_handle)
+                for (parent_handle, gender, side) in (
+                        (father_handle, "male", "paternal"),
+                        (mother_handle, "female", "maternal")):
+                    if generation > 1:
+                        side = fam_side
+                    if parent_handle:
+                        children.append(
+                            self.json_filter(parent_handle, generation+1, side))
+                    else:
+                        children.append(
+                            self.dummy_filter(gender, generation+1, side))
+            self.subtrees[key] = (fields, children)
+        return self.subtrees[key]
+
+    def write_json(self, tree):
         """
-        # check for end of the current recursion level. This happens
-        # if the person handle is None, or if the max_gen is hit
-        if not person_handle or generation > self.max_gen:
-            return
-
-        # retrieve the Person instance from the database from the
-        # passed person_handle and find the parents from the list.
-        # Since this report is for natural parents (birth parents),
-        # we have to handle that parents may not
-        person = self.database.get_person_from_handle(person_handle)
-
-        gen_pad = (generation-1) * 2
-
-        name = self._name_display.display(person)
-        self.json_fp.write('%s{\n' % (self.pad_str(gen_pad)))
-        self.json_fp.write('%s"name": "%s",\n' %
-            (self.pad_str(gen_pad+1), name.replace('"', "'")))
-        self.json_fp.write('%s"gender": "%s",\n' %
-            (self.pad_str(gen_pad+1), self.get_gender_str(person)))
-
-        # Get Birth/Death dates if they exist
-        birth_year = 0
-        birth_ref = person.get_birth_ref()
-        if birth_ref and birth_ref.ref:
-            birth_event = self.database.get_event_from_handle(birth_ref.ref)
-            if birth_event:
-                birth_year = birth_event.get_date_object().get_year()
-
-        death_year = 0
-        death_ref = person.get_death_ref()
-        if death_ref and death_ref.ref:
-            death_event = self.database.get_event_from_handle(death_ref.ref)
-            if death_event:
-                death_year = death_event.get_date_object().get_year()
-
-        self.json_fp.write('%s"born": "%s",\n' %
-            (self.pad_str(gen_pad+1),
-            str(birth_year) if birth_year != 0 else ""))
-        self.json_fp.write('%s"died": "%s",\n' %
-            (self.pad_str(gen_pad+1),
-            str(death_year) if death_year != 0 else ""))
-
-        self.json_fp.write('%s"generation": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(generation)))
-
-        if generation == self.max_ancestor or generation == self.max_gen:
-            self.json_fp.write('%s"colour": "%s",\n' %
-                (self.pad_str(gen_pad+1),
-                self.pat_bg if self.fam_side == "paternal" else self.mat_bg))
-
-        self.json_fp.write('%s"gramps_id": "%s"' %
-            (self.pad_str(gen_pad+1), str(person.get_gramps_id())))
-
-        # Get parent handles if they exist
-        father_handle, mother_handle = self.get_parent_handles(person_handle)
-
-        # Recursively call the function. It is okay if the handle is None,
-        # since routine handles a handle of None
-        if (not father_handle and not mother_handle):
-            if generation == self.max_gen or generation == self.max_ancestor:
-                # No more levels required so close this person out.
-                self.json_fp.write('\n')
-                self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-            elif generation < self.max_ancestor:
-                # Need to generate some empty ancestors to satisfy max_ancestor
-                self.json_fp.write(',\n')
-                self.json_fp.write('%s"children": [\n' %
-                    (self.pad_str(gen_pad+1)))
-                if generation == 1:
-                    self.fam_side = "paternal"
-                self.dummy_filter("male", generation+1)
-                self.json_fp.write(',\n')
-                if generation == 1:
-                    self.fam_side = "maternal"
-                self.dummy_filter("female", generation+1)
-                self.json_fp.write('\n')
-                self.json_fp.write('%s]\n' % (self.pad_str(gen_pad+1)))
-                self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-        elif generation < self.max_gen and generation < self.max_ancestor:
-            self.json_fp.write(',\n')
-            self.json_fp.write('%s"children": [\n' %
-                (self.pad_str(gen_pad+1)))
-
-            if generation == 1:
-                self.fam_side = "paternal"
-            if father_handle:
-                self.json_filter(father_handle, generation+1)
-            else:
-                self.dummy_filter("male", generation+1)
-
-            self.json_fp.write(',\n')
-
-            if generation == 1:
-                self.fam_side = "maternal"
-            if mother_handle:
-                self.json_filter(mother_handle, generation+1)
-            else:
-                self.dummy_filter("female", generation+1)
-            self.json_fp.write('\n')
-
-            self.json_fp.write('%s]\n' % (self.pad_str(gen_pad+1)))
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
-        else:
-            # No more levels required so close this person out.
-            self.json_fp.write('\n')
-            self.json_fp.write('%s}' % (self.pad_str(gen_pad)))
+        Stream an ancestor tree, as built by json_filter, to the JSON file
+        """
+        (fields, children) = tree
+        self.json_fp.write('{' + fields)
+        if children:
+            self.json_fp.write(',"children":[')
+            for (i, child) in enumerate(children):
+                if i:
+                    self.json_fp.write(',')
+                self.write_json(child)
+            self.json_fp.write(']')
+        self.json_fp.write('}')
 
     def write_report(self):
         """
@@ -659,8 +637,10 @@ class AncestralFanChartReport(Report):
                 self.calc_max_ancestor(self.center_person.get_handle(), 1)
 
                 # Generate json file of ancestors
-                self.json_fp.write('[\n')
-                self.json_filter(self.center_person.get_handle(), 1)
+                self.json_fp.write('[')
+                self.write_json(
+                    self.json_filter(self.center_person.get_handle(), 1,
+                                     self.fam_side))
                 self.json_fp.write(']')
 
 
@@ -37,6 +37,7 @@ from functools import partial
 from gi.repository.Gtk import ResponseType
 import copy
 import io
+import json
 import os
 import re
 import shutil
@@ -268,7 +269,6 @@ class Printinfo():
         self.compute_age = compute_age
         self.verbose = verbose
         self.inc_photo = inc_photo
-        self.json_fp = None
         self.dest_prefix = None
         self.hrefs = hrefs
         self.href_prefix = href_prefix
@@ -283,6 +283,10 @@ class Printinfo():
         # List of unique HREF's
         self.href_dict = {}
 
+        # People and families already loaded from the database
+        self.people = {}
+        self.families = {}
+
         if rep_date:
             empty_date = EMPTY_ENTRY
         else:
@@ -309,8 +313,23 @@ class Printinfo():
     def set_dest_prefix(self, dest_prefix):
         self.dest_prefix = dest_prefix
 
-    def set_json_fp(self, json_fp):
-        self.json_fp = json_fp
+    def get_person(self, person_handle):
+        """
+        Return a person, loading it from the database once
+        """
+        if person_handle not in self.people:
+            self.people[person_handle] = \
+                self.database.get_person_from_handle(person_handle)
+        return self.people[person_handle]
+
+    def get_family(self, family_handle):
+        """
+        Return a family, loading it from the database once
+        """
+        if family_handle not in self.families:
+            self.families[family_handle] = \
+                self.database.get_family_from_handle(family_handle)
+        return self.families[family_handle]
 
     def get_date_place(self,event):
         if event:
@@ -333,7 +352,10 @@ class Printinfo():
         return ""
 
     def dump_biography(self, person, level):
-        gen_pad = (level-1) * 2
+        """
+        Return the image and biography fields of a person
+        """
+        fields = []
 
         # Person ID will be used for image reference to person image
         if self.inc_photo:
@@ -357,8 +379,7 @@ class Printinfo():
                         image_file = os.path.join(self.dest_path, "images",
                                                   self.dest_prefix,
                                                   person.gramps_id + ".jpg")
-                        self.json_fp.write('%s"image_ref": "%s",\n' %
-                            (self.pad_str(gen_pad+1), str(image_ref)))
+                        fields.append(("image_ref", str(image_ref)))
                         # Copy media file to images directory
                         # Ensure image directory exists:
                         if not os.path.exists(image_path):
@@ -407,17 +428,17 @@ class Printinfo():
         if text:
             bio_str = bio_str + text.replace('"', "'")
 
-        self.json_fp.write('%s"biography": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(bio_str)))
+        fields.append(("biography", str(bio_str)))
+        return fields
 
     def get_marriage_string(self, person):
         is_first = True
         mar_string = ""
         for family_handle in person.get_family_handle_list():
-            family = self.database.get_family_from_handle(family_handle)
+            family = self.get_family(family_handle)
             spouse_handle = ReportUtils.find_spouse(person, family)
             if spouse_handle:
-                spouse = self.database.get_person_from_handle(spouse_handle)
+                spouse = self.get_person(spouse_handle)
                 if spouse:
                     name = self._name_display.display_formal(spouse)
                 else:
@@ -433,17 +454,17 @@ class Printinfo():
         family_handle = person.get_main_parents_family_handle()
         text = None
         if family_handle:
-            family = self.database.get_family_from_handle(family_handle)
+            family = self.get_family(family_handle)
             mother_handle = family.get_mother_handle()
             father_handle = family.get_father_handle()
             if mother_handle:
-                mother = self.database.get_person_from_handle(mother_handle)
+                mother = self.get_person(mother_handle)
                 mother_name = \
                     self._name_display.display_name(mother.get_primary_name())
             else:
                 mother_name = ""
             if father_handle:
-                father = self.database.get_person_from_handle(father_handle)
+                father = self.get_person(father_handle)
                 father_name = \
                     self._name_display.display_name(father.get_primary_name())
             else:
@@ -453,44 +474,31 @@ class Printinfo():
         return text
 
     def dump_string(self, person, level, family=None):
-        gen_pad = (level-1) * 2
-
+        """
+        Return the events, biography and gender fields of a person
+        """
         born = self.get_date_place(get_birth_or_fallback(self.database, person))
         died = self.get_date_place(get_death_or_fallback(self.database, person))
 
-        self.json_fp.write('%s"born": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(born)))
-        self.json_fp.write('%s"died": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(died)))
+        fields = [("born", str(born)), ("died", str(died))]
 
         if family and self.showmarriage:
             marriage = self.get_date_place(
                 get_marriage_or_fallback(self.database,
                                                               family))
-            self.json_fp.write('%s"marriage": "%s",\n' %
-                (self.pad_str(gen_pad+1), str(marriage)))
+            fields.append(("marriage", str(marriage)))
 
         if family and self.showdivorce:
             divorce = self.get_date_place(
                 get_divorce_or_fallback(self.database, family))
-            self.json_fp.write('%s"divorce": "%s",\n' %
-                (self.pad_str(gen_pad+1), str(divorce)))
+            fields.append(("divorce", str(divorce)))
 
         # Only write out buigraphy information if showing of tooltips selected
         if self.showbio:
-            self.dump_biography(person, level)
-
-        self.json_fp.write('%s"gender": "%s"' %
-            (self.pad_str(gen_pad+1), self.get_gender_str(person)))
+            fields.extend(self.dump_biography(person, level))
 
-    def pad_str(self, num_spaces):
-        """
-        Utility method to retrieve string with specific number of spaces
-        """
-        pad_str = ""
-        for i in range(0, num_spaces):
-            pad_str = pad_str + " "
-        return pad_str
+        fields.append(("gender", self.get_gender_str(person)))
+        return fields
 
     def get_gender_str(self, person):
         """
@@ -614,70 +622,93 @@ class Printinfo():
         return href
 
     def print_person(self, level, person):
+        """
+        Return the display number and the fields of a descendant
+        """
         display_num = self.numbering.number(level)
         name = self._name_display.display(person)
-        gen_pad = (level-1) * 2
 
-        self.json_fp.write('%s"display_num": "%s",\n' %
-            (self.pad_str(gen_pad+1), str(display_num)))
-        self.json_fp.write('%s"name": "%s",\n' %
-            (self.pad_str(gen_pad+1), name.replace('"', "'")))
+        fields = [
+            ("display_num", str(display_num)),
+            ("name", name.replace('"', "'")),
+            ]
         if self.generate_href(person, level):
-            self.json_fp.write('%s"href": "%s",\n' %
-                (self.pad_str(gen_pad+1),
-                 self.generate_href_link(name.replace('"', "'"))))
-        self.json_fp.write('%s"spouse": "%s",\n' %
-            (self.pad_str(gen_pad+1), "false"))
-        self.dump_string(person, level)
-        return display_num
-
-    def print_spouse(self, level, spouse_handle, family_handle):
-        #Currently print_spouses is the same for all numbering systems.
-        gen_pad = (level-1) * 2
+            fields.append(("href",
+                self.generate_href_link(name.replace('"', "'"))))
+        fields.append(("spouse", "false"))
+        fields.extend(self.dump_string(person, level))
+        return display_num, fields
 
+    def print_spouse(self, level, spouse_handle, family):
+        """
+        Return the fields of the spouse of a descendant
+        """
+        #Currently print_spouses is the same for all numbering systems.
         if spouse_handle:
-            spouse = self.database.get_person_from_handle(spouse_handle)
+            spouse = self.get_person(spouse_handle)
             name = self._name_display.display(spouse)
 
-            self.json_fp.write('%s"display_num": "%s",\n' %
-                (self.pad_str(gen_pad+1), "sp."))
-            self.json_fp.write('%s"name": "%s",\n' %
-                (self.pad_str(gen_pad+1), name.replace('"', "'")))
+            fields = [
+                ("display_num", "sp."),
+                ("name", name.replace('"', "'")),
+                ]
             if self.generate_href(spouse, level, spouse=True):
-                self.json_fp.write('%s"href": "%s",\n' %
-                    (self.pad_str(gen_pad+1),
+                fields.append(("href",
                     self.generate_href_link(name.replace('"', "'"))))
-            self.json_fp.write('%s"spouse": "%s",\n' %
-                (self.pad_str(gen_pad+1), "true"))
-            self.dump_string(spouse, level, family_handle)
+            fields.append(("spouse", "true"))
+            fields.extend(self.dump_string(spouse, level, family))
         else:
             name = "Unknown"
-            self.json_fp.write('%s"display_num": "%s",\n' %
-                (self.pad_str(gen_pad+1), "sp."))
-            self.json_fp.write('%s"name": "%s",\n' %
-                (self.pad_str(gen_pad+1), name.replace('"', "'")))
+            fields = [
+                ("display_num", "sp."),
+                ("name", name.replace('"', "'")),
+                ]
             if self.generate_href(None, level, spouse=True):
-                self.json_fp.write('%s"href": "%s",\n' %
-                    (self.pad_str(gen_pad+1),
+                fields.append(("href",
                     self.generate_href_link(name.replace('"', "'"))))
-            self.json_fp.write('%s"spouse": "%s"\n' %
-                (self.pad_str(gen_pad+1), "true"))
+            fields.append(("spouse", "true"))
+        return fields
 
     def print_reference(self, level, person, display_num):
+        """
+        Return the fields of a reference to a spouse already in the tree
+        """
         #Person and their family have already been printed so
         #print reference here
+        fields = []
         if person:
-            gen_pad = (level-1) * 2
             sp_name = self._name_display.display(person)
             name = _("See %(reference)s : %(spouse)s" %
                     {'reference': display_num, 'spouse': sp_name})
-            self.json_fp.write('%s{\n' % (self.pad_str(gen_pad)))
-            self.json_fp.write('%s"display_num": "%s",\n' %
-                (self.pad_str(gen_pad+1), "sp."))
-            self.json_fp.write('%s"name": "%s",\n' %
-                (self.pad_str(gen_pad+1), name.replace('"', "'")))
-            self.json_fp.write('%s"spouse": "%s"\n' %
-                (self.pad_str(gen_pad+1), "true"))
+            fields = [
+                ("display_num", "sp."),
+                ("name", name.replace('"', "'")),
+                ("spouse", "true"),
+                ]
+        return fields
+
+#------------------------------------------------------------------------
+#
+# DescendantNode
+#
+#------------------------------------------------------------------------
+class DescendantNode(object):
+    """
+    A descendant (or a spouse) in the tree built by RecurseDown
+
+    handle:   The person (or family) handle
+    fields:   The JSON encoded display fields
+    children: The list of the families of a descendant, or of the children
+              of a family. None if there are none
+    """
+    __slots__ = ('handle', 'fields', 'children')
+
+    def __init__(self, handle, fields):
+        self.handle = handle
+        self.fields = ",".join(
+            "%s:%s" % (json.dumps(key), json.dumps(value, ensure_ascii=False))
+            for (key, value) in fields)
+        self.children = None
 
 #------------------------------------------------------------------------
 #
@@ -687,7 +718,10 @@ class Printinfo():
 class RecurseDown():
     """
     A simple object to recurse from a person down through their descendants
-    
+
+    The descendants are walked once, to build a tree of DescendantNode,
+    which is then written as JSON.
+
     The arguments are:
     
     max_generations: The max number of generations
@@ -707,63 +741,23 @@ class RecurseDown():
         self.title = title
         self.numbering = numbering
         self.person_printed = {}
-        self.person_counted = {}
-        self.person_count = 0
+        self.node_count = 0
 
-    def pad_str(self, num_spaces):
+    def build(self, person):
         """
-        Utility method to retrieve string with specific number of spaces
+        Build the descendant tree of a person
         """
-        pad_str = ""
-        for i in range(0, num_spaces):
-            pad_str = pad_str + " "
-        return pad_str
-
-    def recurse_count(self, level, person, curdepth):
-        self.person_count = self.person_count + 1
-        display_num = self.numbering.number(level)
-        if curdepth is None:
-            ref_str = display_num
-        else:
-            ref_str = curdepth + " " + display_num
-
-        family_num = 0
-        for family_handle in person.get_family_handle_list():
-            family = self.database.get_family_from_handle(family_handle)
-            family_num += 1
-
-            spouse_handle = ReportUtils.find_spouse(person, family)
-
-            if not self.dups and spouse_handle in self.person_counted:
-                # Just print a reference
-                continue
-            else:
-                self.person_count = self.person_count + 1
-                if spouse_handle:
-                    spouse_num = _("%s sp." % (ref_str))
-                    self.person_counted[spouse_handle] = spouse_num
-
-                if level >= self.max_generations:
-                    continue
-
-                childlist = family.get_child_ref_list()[:]
-                first_child = True
-                for child_ref in childlist:
-                    child = self.database.get_person_from_handle(child_ref.ref)
-                    self.recurse_count(level+1, child, ref_str)
+        self.user.begin_progress(self.title, _("Generating report..."), 0)
+        tree = self.recurse(1, person, None)
+        self.user.end_progress()
+        return tree
 
     def recurse(self, level, person, curdepth):
-        gen_pad = (level-1) * 2
         person_handle = person.get_handle()
-        self.objPrint.json_fp.write('%s{\n' % (self.pad_str(gen_pad)))
-        display_num = self.objPrint.print_person(level, person)
-        if level == 1:
-            if self.person_count == 0:
-                self.person_count = 100
-            self.user.begin_progress(self.title, _("Generating report..."),
-                                     self.person_count)
-        else:
-            self.user.step_progress()
+        display_num, fields = self.objPrint.print_person(level, person)
+        node = DescendantNode(person_handle, fields)
+        self.node_count = self.node_count + 1
+        self.user.step_progress()
 
         if curdepth is None:
             ref_str = display_num
@@ -774,36 +768,25 @@ class RecurseDown():
             self.person_printed[person_handle] = ref_str
 
         if len(person.get_family_handle_list()) > 0:
-            self.objPrint.json_fp.write(',\n%s"children": [\n' %
-                (self.pad_str(gen_pad)))
+            node.children = []
 
-        family_num = 0
         for family_handle in person.get_family_handle_list():
-            family = self.database.get_family_from_handle(family_handle)
-            family_num += 1
+            family = self.objPrint.get_family(family_handle)
 
             spouse_handle = ReportUtils.find_spouse(person, family)
 
             if not self.dups and spouse_handle in self.person_printed:
                 # Just print a reference
-                spouse = self.database.get_person_from_handle(spouse_handle)
-                if family_num > 1:
-                    self.objPrint.json_fp.write(',%s{\n' %
-                        (self.pad_str(gen_pad)))
-                else:
-                    self.objPrint.json_fp.write('%s{\n' %
-                        (self.pad_str(gen_pad)))
-                self.objPrint.print_reference(level, spouse,
-                    self.person_printed[spouse_handle])
-                self.objPrint.json_fp.write('%s}\n' % (self.pad_str(gen_pad)))
+                spouse = self.objPrint.get_person(spouse_handle)
+                node.children.append(DescendantNode(family_handle,
+                    self.objPrint.print_reference(level, spouse,
+                        self.person_printed[spouse_handle])))
+                self.node_count = self.node_count + 1
             else:
-                if family_num > 1:
-                    self.objPrint.json_fp.write(',%s{\n' %
-                        (self.pad_str(gen_pad)))
-                else:
-                    self.objPrint.json_fp.write('%s{\n' %
-                        (self.pad_str(gen_pad)))
-                self.objPrint.print_spouse(level, spouse_handle, family)
+                family_node = DescendantNode(family_handle,
+                    self.objPrint.print_spouse(level, spouse_handle, family))
+                node.children.append(family_node)
+                self.node_count = self.node_count + 1
                 self.user.step_progress()
 
                 if spouse_handle:
@@ -811,36 +794,37 @@ class RecurseDown():
                     self.person_printed[spouse_handle] = spouse_num
 
                 if level >= self.max_generations:
-                    self.objPrint.json_fp.write('%s}\n' %
-                        (self.pad_str(gen_pad)))
                     continue
 
-                childlist = family.get_child_ref_list()[:]
-                first_child = True
-                for child_ref in childlist:
-                    if first_child:
-                        first_child = False
-                        self.objPrint.json_fp.write(',\n%s"children": [\n' %
-                            (self.pad_str(gen_pad+1)))
-                    else:
-                        self.objPrint.json_fp.write(',')
-                    child = self.database.get_person_from_handle(child_ref.ref)
-                    self.recurse(level+1, child, ref_str)
-
-                if not first_child:
-                    self.objPrint.json_fp.write('\n%s]\n' %
-                        (self.pad_str(gen_pad+1)))
+                for child_ref in family.get_child_ref_list():
+                    child = self.objPrint.get_person(child_ref.ref)
+                    if family_node.children is None:
+                        family_node.children = []
+                    family_node.children.append(
+                        self.recurse(level+1, child, ref_str))
 
-                self.objPrint.json_fp.write('%s}\n' % (self.pad_str(gen_pad)))
-
-        if len(person.get_family_handle_list()) > 0:
-            self.objPrint.json_fp.write('%s]\n%s}\n' %
-                (self.pad_str(gen_pad), self.pad_str(gen_pad)))
-        else:
-            self.objPrint.json_fp.write('\n%s}\n' % (self.pad_str(gen_pad)))
+        return node
 
-        if level == 1:
-            self.user.end_progress()
+    def write(self, json_fp, tree):
+        """
+        Write the descendant tree as JSON
+        """
+        self.user.begin_progress(self.title, _("Writing report..."),
+                                 self.node_count)
+        self.write_node(json_fp, tree)
+        self.user.end_progress()
+
+    def write_node(self, json_fp, node):
+        json_fp.write('{' + node.fields)
+        if node.children is not None:
+            json_fp.write(',"children":[')
+            for (i, child) in enumerate(node.children):
+                if i:
+                    json_fp.write(',')
+                self.write_node(json_fp, child)
+            json_fp.write(']')
+        json_fp.write('}')
+        self.user.step_progress()
 
 #------------------------------------------------------------------------
 #
@@ -1671,17 +1655,13 @@ class DescendantIndentedTreeReport(Report):
         # Genearte json data file to be used
         try:
             with io.open(self.destjson, 'w', encoding='utf8') as self.json_fp:
-                generation = 1
-                self.objPrint.set_json_fp(self.json_fp)
                 self.objPrint.set_dest_prefix(self.destprefix)
                 recurse = RecurseDown(self.max_gen, self.database,
                                       self.objPrint, self.dups, self.marrs,
                                       self.divs, self.user, self.title,
                                       self.num_obj)
-                recurse.recurse_count(generation, self.center_person, None)
-                if self.numbering == "Record":
-                    self.num_obj.reset()
-                recurse.recurse(generation, self.center_person, None)
+                tree = recurse.build(self.center_person)
+                recurse.write(self.json_fp, tree)
 
         except IOError as msg:
             ErrorDialog(_("Failed writing %s: %s") % (self.destjson, str(msg)))
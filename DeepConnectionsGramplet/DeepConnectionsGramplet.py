@@ -26,6 +26,7 @@
 # Python modules
 #
 #------------------------------------------------------------------------
+from collections import deque
 from gi.repository import Gtk
 
 #------------------------------------------------------------------------
@@ -55,6 +56,7 @@ class DeepConnectionsGramplet(Gramplet):
     """
     def init(self):
         self.selected_handles = set()
+        self.mentions = None
         self.relationship_calc = get_relationship_calculator()
         self.set_tooltip(_("Double-click name for details"))
         self.set_text(_("No Family Tree loaded."))
@@ -77,26 +79,49 @@ class DeepConnectionsGramplet(Gramplet):
         self.gui.get_container_widget().add_with_viewport(vbox)
         vbox.show_all()
 
-    def get_links_from_notes(self, obj, path, relation, person_handle):
+    def db_changed(self):
+        """
+        Drop the note mention index when the notes change.
+        """
+        self.mentions = None
+        self.dbstate.db.connect('note-add', self.notes_changed)
+        self.dbstate.db.connect('note-update', self.notes_changed)
+        self.dbstate.db.connect('note-delete', self.notes_changed)
+
+    def notes_changed(self, handles):
+        self.mentions = None
+
+    def build_mentions(self):
+        """
+        Index the people mentioned in each note, and the notes mentioning
+        each person, with one pass over the notes.
+        """
+        self.mentions = {}
+        self.mentioned_in = {}
+        for note in self.dbstate.db.iter_notes():
+            for link in note.get_links():
+                if (link[0] == "gramps" and link[1] == "Person" and
+                        link[2] == "handle"):
+                    self.mentions.setdefault(note.handle, []).append(link[3])
+                    self.mentioned_in.setdefault(link[3], []).append(note.handle)
+
+    def get_links_from_notes(self, obj, relation, person_handle):
         """
         Get anyone mentioned in any note attached to this object.
         """
+        if self.mentions is None:
+            self.build_mentions()
         retval = []
-        note_list = obj.get_note_list()
-        for note_handle in note_list:
-            note = self.dbstate.db.get_note_from_handle(note_handle)
-            if note:
-                links = note.get_links()
-                for link in links:
-                    if link[0] == "gramps" and link[1] == "Person":
-                        relation = _("mentioned in note")
-                        if link[2] == "handle":
-                            retval += [(link[3], (path, (relation, person_handle)))]
+        for note_handle in obj.get_note_list():
+            for handle in self.mentions.get(note_handle, []):
+                relation = _("mentioned in note")
+                retval += [(handle, (relation, person_handle))]
         return retval
 
-    def get_relatives(self, person_handle, path):
+    def get_relatives(self, person_handle):
         """
-        Gets all of the relations of person_handle.
+        Gets all of the relations of person_handle, as (handle, step)
+        pairs, where step is (relation_text, person_handle, [p1, [p2]]).
         """
         retval = []
         person = self.dbstate.db.get_person_from_handle(person_handle)
@@ -108,14 +133,14 @@ class DeepConnectionsGramplet(Gramplet):
                 children = family.get_child_ref_list()
                 husband = family.get_father_handle()
                 wife = family.get_mother_handle()
-                retval.extend((child_ref.ref, (path, (_("child"), person_handle,
-                                                      husband, wife)))
+                retval.extend((child_ref.ref, (_("child"), person_handle,
+                                               husband, wife))
                               for child_ref in children)
                 if husband and husband != person_handle:
-                    retval += [(husband, (path, (_("husband"), person_handle)))]
+                    retval += [(husband, (_("husband"), person_handle))]
                 if wife and wife != person_handle:
-                    retval += [(wife, (path, (_("wife"), person_handle)))]
-                retval += self.get_links_from_notes(family, path, _("Note on Family"), person_handle)
+                    retval += [(wife, (_("wife"), person_handle))]
+                retval += self.get_links_from_notes(family, _("Note on Family"), person_handle)
 
         parent_family_list = person.get_parent_family_handle_list()
         for family_handle in parent_family_list:
@@ -124,25 +149,110 @@ class DeepConnectionsGramplet(Gramplet):
                 children = family.get_child_ref_list()
                 husband = family.get_father_handle()
                 wife = family.get_mother_handle()
-                retval.extend((child_ref.ref, (path,
-                                    (_("sibling"), person_handle, husband, wife)))
+                retval.extend((child_ref.ref,
+                               (_("sibling"), person_handle, husband, wife))
                               for child_ref in children if child_ref.ref != person_handle)
                 if husband and husband != person_handle:
-                    retval += [(husband,
-                                (path, (_("father"), person_handle, wife)))]
+                    retval += [(husband, (_("father"), person_handle, wife))]
                 if wife and wife != person_handle:
-                    retval += [(wife,
-                                (path, (_("mother"), person_handle, husband)))]
-                retval += self.get_links_from_notes(family, path, _("Note on Parent Family"), person_handle)
+                    retval += [(wife, (_("mother"), person_handle, husband))]
+                retval += self.get_links_from_notes(family, _("Note on Parent Family"), person_handle)
         assoc_list = person.get_person_ref_list()
         for assoc in assoc_list:
             relation = _("%s (association)") % assoc.get_relation()
             assoc_handle = assoc.get_reference_handle()
-            retval += [(assoc_handle, (path, (relation, person_handle)))]
+            retval += [(assoc_handle, (relation, person_handle))]
 
-        retval += self.get_links_from_notes(person, path, _("Note on Person"), person_handle)
+        retval += self.get_links_from_notes(person, _("Note on Person"), person_handle)
         return retval
 
+    def get_predecessors(self, person_handle):
+        """
+        Gets the handles of everyone who has person_handle among their
+        relatives; the reverse of get_relatives.
+        """
+        db = self.dbstate.db
+        retval = set()
+        person = db.get_person_from_handle(person_handle)
+        if person is None: return retval
+        # family relations work both ways:
+        for family_handle in (person.get_family_handle_list() +
+                              person.get_parent_family_handle_list()):
+            family = db.get_family_from_handle(family_handle)
+            if family:
+                retval.update(self.get_members(family))
+        # associations made by other people:
+        for (class_name, handle) in db.find_backlink_handles(person_handle, ['Person']):
+            other = db.get_person_from_handle(handle)
+            if other and any(assoc.ref == person_handle
+                             for assoc in other.get_person_ref_list()):
+                retval.add(handle)
+        # notes mentioning this person:
+        if self.mentions is None:
+            self.build_mentions()
+        for note_handle in self.mentioned_in.get(person_handle, []):
+            for (class_name, handle) in db.find_backlink_handles(note_handle, ['Person', 'Family']):
+                if class_name == 'Person':
+                    other = db.get_person_from_handle(handle)
+                    if other and note_handle in other.get_note_list():
+                        retval.add(handle)
+                else:
+                    family = db.get_family_from_handle(handle)
+                    if family and note_handle in family.get_note_list():
+                        retval.update(self.get_members(family))
+        retval.discard(None)
+        retval.discard(person_handle)
+        return retval
+
+    def get_members(self, family):
+        """
+        Gets the handles of the parents and children of a family.
+        """
+        return ([family.get_father_handle(), family.get_mother_handle()] +
+                [child_ref.ref for child_ref in family.get_child_ref_list()])
+
+    def get_step(self, person_handle, relative_handle):
+        """
+        Gets the step from person_handle to one of their relatives.
+        """
+        for (handle, step) in self.get_relatives(person_handle):
+            if handle == relative_handle:
+                return step
+        return None
+
+    def join_path(self, handle, step, other_handle):
+        """
+        Build the path from the home person through the forward search to
+        handle, then along step to other_handle and through the backward
+        search to the active person. Returns None if the path loops, has
+        already been found by way of another meeting point, or can't be
+        followed forward from other_handle (with inconsistent data, such as
+        a family listing a child who doesn't list that family).
+        """
+        steps = []
+        current = handle
+        while self.forward[current] is not None:
+            (previous, previous_step) = self.forward[current]
+            steps.insert(0, previous_step)
+            current = previous
+        steps.append(step)
+        current = other_handle
+        while self.backward[current] is not None:
+            following = self.backward[current]
+            following_step = self.get_step(current, following)
+            if following_step is None:
+                return None
+            steps.append(following_step)
+            current = following
+        handles = tuple(current_step[1] for current_step in steps) + (current,)
+        if len(set(handles)) != len(handles) or handles in self.found:
+            return None
+        self.found.add(handles)
+        path = (None, (_("self"), steps[0][1], []))
+        for current_step in steps:
+            path = (path, current_step)
+        return path
+
     def active_changed(self, handle):
         """
         Update the gramplet on active person change.
@@ -193,9 +303,6 @@ class DeepConnectionsGramplet(Gramplet):
         if active_person == None:
             self.set_text(_("No Active Person set."))
             return
-        self.cache = set()
-        self.queue = [(self.default_person.handle,
-                       (None, (_("self"), self.default_person.handle, [])))]
         default_name = self.default_person.get_primary_name()
         active_name = active_person.get_primary_name()
         self.set_text("")
@@ -207,35 +314,68 @@ class DeepConnectionsGramplet(Gramplet):
         yield True
         relationship = self.relationship_calc.get_one_relationship(
             self.dbstate.db, self.default_person, active_person)
-        while self.queue:
-            current_handle, current_path = self.queue.pop(0)
-            if current_handle == active_person.handle:
-                self.total_relations_found += 1
-                self.append_text(_("Found relation #%d: \n   ") % self.total_relations_found)
-
-                self.link(name_displayer.display_name(active_name), "Person", active_person.handle)
-                if relationship:
-                    self.append_text(" [%s]" % relationship)
-                self.selected_handles.clear()
-                self.selected_handles.add(active_person.handle)
-                self.pretty_print(current_path)
-                self.append_text("\n")
-                if self.default_person.handle != active_person.handle:
-                    self.append_text(_("Paused.\nPress Continue to search for additional relations.\n"))
-                    self.pause()
-                    yield False
-                else:
-                    break
-            elif current_handle in self.cache:
-                continue
-            self.cache.add(current_handle)
-            relatives = self.get_relatives(current_handle, current_path)
-            for items in relatives:
-                person_handle = items[0]
-                path = items[1]
-                if person_handle is not None: # and person_handle not in self.cache:
-                    self.queue.append((person_handle, path))
+        if self.default_person.handle == active_person.handle:
+            self.show_relation(active_person, relationship,
+                               (None, (_("self"), active_person.handle, [])))
+            self.append_text(_("\nSearch completed. %d relations found.") % self.total_relations_found)
+            yield False
+            return
+        # Search out from both people at once, keeping a pointer back to
+        # where each person was reached from, until the searches meet:
+        self.forward = {self.default_person.handle: None}
+        self.backward = {active_person.handle: None}
+        forward_queue = deque([self.default_person.handle])
+        backward_queue = deque([active_person.handle])
+        joined = set()
+        self.found = set()
+        while forward_queue or backward_queue:
+            paths = []
+            if forward_queue and (not backward_queue or
+                                  len(forward_queue) <= len(backward_queue)):
+                current_handle = forward_queue.popleft()
+                for (person_handle, step) in self.get_relatives(current_handle):
+                    if person_handle is None:
+                        continue
+                    if person_handle not in self.forward:
+                        self.forward[person_handle] = (current_handle, step)
+                        forward_queue.append(person_handle)
+                    if (person_handle in self.backward and
+                            (current_handle, person_handle) not in joined):
+                        joined.add((current_handle, person_handle))
+                        paths.append(self.join_path(current_handle, step, person_handle))
+            else:
+                current_handle = backward_queue.popleft()
+                for person_handle in self.get_predecessors(current_handle):
+                    if person_handle not in self.backward:
+                        self.backward[person_handle] = current_handle
+                        backward_queue.append(person_handle)
+                    if (person_handle in self.forward and
+                            (person_handle, current_handle) not in joined):
+                        joined.add((person_handle, current_handle))
+                        step = self.get_step(person_handle, current_handle)
+                        paths.append(self.join_path(person_handle, step, current_handle))
+            for path in paths:
+                if path is None:
+                    continue
+                self.show_relation(active_person, relationship, path)
+                self.append_text(_("Paused.\nPress Continue to search for additional relations.\n"))
+                self.pause()
+                yield False
             yield True
         self.append_text(_("\nSearch completed. %d relations found.") % self.total_relations_found)
         yield False
 
+    def show_relation(self, active_person, relationship, path):
+        """
+        Show a relation found between the home and active people.
+        """
+        self.total_relations_found += 1
+        self.append_text(_("Found relation #%d: \n   ") % self.total_relations_found)
+        active_name = active_person.get_primary_name()
+        self.link(name_displayer.display_name(active_name), "Person", active_person.handle)
+        if relationship:
+            self.append_text(" [%s]" % relationship)
+        self.selected_handles.clear()
+        self.selected_handles.add(active_person.handle)
+        self.pretty_print(path)
+        self.append_text("\n")
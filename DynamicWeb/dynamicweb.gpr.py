@@ -14,7 +14,7 @@ register(REPORT,
 	id = 'DynamicWeb',
 	name = _("Dynamic Web Report"),
 	description =  _("Produces dynamic web pages for the database"),
-	version = '0.0.44',
+	version = '0.0.48',
 	gramps_target_version = "5.0",
 	status = STABLE,
 	fname = 'dynamicweb.py',
@@ -48,6 +48,10 @@ The generated pages use lots of Javascript:
    Highcharts: www.highcharts.com
  - The web pages have the following structure:
     - dwr_db_*.js: Generated files that contain the Gramps data. Theses files are generated by the methods "DynamicWebReport._export_***"
+      When the option "shard_size" is set, each table is split into several files "dwr_db_*_<n>.js",
+      listed in the manifest "dwr_db_manifest.js". See L{DynamicWebReport.write_table}
+      When the option "incremental" is set, only the files whose records changed since the previous
+      report generation are regenerated. The build state is stored in "dwr_db_build.json".
     - *.html: Generated HTML files.
       See the list of HTML pages given in L{PAGES_NAMES}
       Some files (not listed in in L{PAGES_NAMES}) are generated by L{DynamicWebReport._export_pages}
@@ -112,8 +116,11 @@ import copy
 import time, datetime
 import shutil
 import codecs
+import filecmp
+import hashlib
 import tarfile
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 if sys.version_info[0] < 3:
     from cStringIO import StringIO
     string_types = basestring
@@ -402,6 +409,15 @@ BKREF_CLASS = 0
 BKREF_HANDLE = 1
 BKREF_REFOBJ = 2
 
+MEDIA_THREADS = 8 #: Number of threads used to copy the media files and the thumbnails
+
+# Results of the media files copy
+MEDIA_COPIED = 0
+MEDIA_SKIPPED = 1
+MEDIA_FAILED = 2
+
+BUILD_STATE_FILE = "dwr_db_build.json" #: File where the incremental build state is stored, see L{DynamicWebReport.write_table}
+
 
 _html_dbl_quotes = re.compile(r'([^"]*) " ([^"]*) " (.*)', re.VERBOSE)
 _html_sng_quotes = re.compile(r"([^']*) ' ([^']*) ' (.*)", re.VERBOSE)
@@ -440,6 +456,25 @@ def script_escape(text):
     )
 
 
+class _DigestFile(object):
+    """
+    File wrapper that computes the SHA1 digest of the text written
+    """
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def write(self, txt):
+        self.sha1.update(txt.encode("UTF-8"))
+        self.f.write(txt)
+
+    def close(self):
+        self.f.close()
+
+    def hexdigest(self):
+        return(self.sha1.hexdigest())
+
+
 def html_text(html):
     """Get the string corresponding to an L{Html} object"""
     if (isinstance(html, string_types)): return(html.strip())
@@ -612,6 +647,8 @@ class DynamicWebReport(Report):
         self.encoding = self.options['encoding']
         self.copyright = self.options['copyright']
         self.inc_gendex = self.options['inc_gendex']
+        self.shard_size = self.options['shard_size']
+        self.incremental = self.options['incremental']
         self.sourceauthor = self.options['sourceauthor']
         self.template = self.options['template']
         self.inc_pageconf = self.options['inc_pageconf']
@@ -689,6 +726,10 @@ class DynamicWebReport(Report):
         #: List of thumbnails already created
         self.thumbnail_created = set()
 
+        #: Media files copies, as a list of (destination path, future result of L{copy_media_file})
+        self.media_jobs = []
+        self.warn_dir = True
+
         #################################################
         # Pass 1 Build the lists of objects to be output
 
@@ -700,6 +741,9 @@ class DynamicWebReport(Report):
 
         with self.user.progress(_("Dynamic Web Site Report"), _("Exporting family tree data ..."), 11) as step:
             self.created_files = []
+            self.shards = {}
+            self.read_build_state()
+            self.media_pool = ThreadPoolExecutor(max_workers = MEDIA_THREADS)
             # Create directories
             for dirname in ["thumb"] + (["image"] if (self.copy_media) else []):
                 dirpath = os.path.join(self.target_path, dirname)
@@ -721,11 +765,14 @@ class DynamicWebReport(Report):
             self._export_media()
             step()
             self._export_surnames()
+            if (self.shard_size): self._export_manifest()
+            if (self.incremental): self.write_build_state()
             step()
             # self._export_statistics()
             step()
             # Generate HTML files
             self._export_pages()
+            self.wait_media_files()
             step()
             # Create GENDEX file
             self.build_gendex()
@@ -740,8 +787,7 @@ class DynamicWebReport(Report):
         Export individuals data in Javascript file
         The individuals data is stored in the Javascript Array "I"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'I' is sorted by person name\n"
             "// 'I' gives for individual:\n"
@@ -798,12 +844,10 @@ class DynamicWebReport(Report):
             "//       [index (in table 'F'), relation to father, relation to mother, notes, list of citations]\n"
             "//   - assoc: A list of associations in the form:\n"
             "//       [person index (in table 'I'), relationship, notes, list of citations (in table 'C')]\n"
-            "//   - change_time: last record modification date\n"
-            "I = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         person_list = list(self.obj_dict[Person].keys())
         person_list.sort(key = lambda x: self.obj_dict[Person][x][OBJDICT_INDEX])
-        for person_handle in person_list:
+        def row(person_handle):
             jdata = {}
             person = self.database.get_person_from_handle(person_handle)
             jdata['gid'] = self.obj_dict[Person][person_handle][OBJDICT_GID]
@@ -851,9 +895,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(person.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_indi.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_indi.js", "I", header, person_list, row, Person)
 
 
     def get_name_data(self, person):
@@ -949,8 +992,7 @@ class DynamicWebReport(Report):
         Export families data in Javascript file
         The families data is stored in the Javascript Array "F"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'F' is sorted by family full name\n"
             "// 'F' gives for each family:\n"
@@ -988,12 +1030,10 @@ class DynamicWebReport(Report):
             "//   - spou: A list of spouses index (in table 'I')\n"
             "//   - chil: A list of child in the form:\n"
             "//       [index (in table 'I'), relation to father, relation to mother, notes, list of citations]\n"
-            "//   - change_time: last record modification date\n"
-            "F = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         family_list = list(self.obj_dict[Family].keys())
         family_list.sort(key = lambda x: self.obj_dict[Family][x][OBJDICT_INDEX])
-        for family_handle in family_list:
+        def row(family_handle):
             family = self.database.get_family_from_handle(family_handle)
             jdata = {}
             jdata['gid'] = self.obj_dict[Family][family_handle][OBJDICT_GID]
@@ -1022,9 +1062,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(family.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_fam.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_fam.js", "F", header, family_list, row, Family)
 
 
     def _data_events(self, object):
@@ -1157,8 +1196,7 @@ class DynamicWebReport(Report):
         Export sources data in Javascript file
         The sources data is stored in the Javascript Array "S"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'S' is sorted by source title\n"
             "// 'S' gives for each source:\n"
@@ -1183,13 +1221,11 @@ class DynamicWebReport(Report):
             "//       - note: notes of the repository reference\n"
             "//   - attr: The list of the sources attributes in the form:\n"
             "//       [attribute, value, note, list of citations]\n"
-            "//   - change_time: last record modification date\n"
-            "S = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         source_list = list(self.obj_dict[Source])
         if (not self.inc_sources): source_list = []
         source_list.sort(key = lambda x: self.obj_dict[Source][x][OBJDICT_INDEX])
-        for source_handle in source_list:
+        def row(source_handle):
             source = self.database.get_source_from_handle(source_handle)
             jdata = {}
             jdata['gid'] = self.obj_dict[Source][source_handle][OBJDICT_GID]
@@ -1222,9 +1258,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(source.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_sour.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_sour.js", "S", header, source_list, row, Source)
 
 
     def _export_citations(self):
@@ -1232,8 +1267,7 @@ class DynamicWebReport(Report):
         Export citations data in Javascript file
         The citations data is stored in the Javascript Array "C"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'C' gives for each source citation:\n"
             "//   - gid: Gramps ID\n"
@@ -1255,13 +1289,11 @@ class DynamicWebReport(Report):
             "//   - bkp: A list of the place index (in table 'P') referencing this citation\n"
             "//     (including the media references referencing this citation)\n"
             "//   - bkr: A list of the repository index (in table 'R') referencing this citation\n"
-            "//   - change_time: last record modification date\n"
-            "C = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         citation_list = list(self.obj_dict[Citation])
         if (not self.inc_sources): citation_list = []
         citation_list.sort(key = lambda x: self.obj_dict[Citation][x][OBJDICT_INDEX])
-        for citation_handle in citation_list:
+        def row(citation_handle):
             citation = self.database.get_citation_from_handle(citation_handle)
             source_handle = citation.get_reference_handle()
             jdata = {}
@@ -1294,9 +1326,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(citation.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_cita.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_cita.js", "C", header, citation_list, row, Citation)
 
 
     def _export_repositories(self):
@@ -1304,8 +1335,7 @@ class DynamicWebReport(Report):
         Export repositories data in Javascript file
         The repositories data is stored in the Javascript Array "R"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'R' is sorted by repository name\n"
             "// 'R' gives for each repository:\n"
@@ -1327,13 +1357,11 @@ class DynamicWebReport(Report):
             "//       - media_type: media type\n"
             "//       - call_number: call number\n"
             "//       - note: notes of the repository reference\n"
-            "//   - change_time: last record modification date\n"
-            "R = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         repo_list = list(self.obj_dict[Repository])
         if (not self.inc_repositories): repo_list = []
         repo_list.sort(key = lambda x: self.obj_dict[Repository][x][OBJDICT_INDEX])
-        for repo_handle in repo_list:
+        def row(repo_handle):
             repo = self.database.get_repository_from_handle(repo_handle)
             jdata = {}
             jdata['gid'] = self.obj_dict[Repository][repo_handle][OBJDICT_GID]
@@ -1352,9 +1380,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(repo.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_repo.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_repo.js", "R", header, repo_list, row, Repository)
 
 
     def _export_media(self):
@@ -1362,8 +1389,7 @@ class DynamicWebReport(Report):
         Export media data in Javascript file
         The media data is stored in the Javascript Array "M"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'M' is sorted by media title\n"
             "// 'M' gives for each media object:\n"
@@ -1403,13 +1429,11 @@ class DynamicWebReport(Report):
             "//       - rect: [x1, y1, x2, y2] of the media reference\n"
             "//       - note: notes of the media reference\n"
             "//       - cita: list of the media reference source citations index (in table 'C')\n"
-            "//   - change_time: last record modification date\n"
-            "M = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         media_list = list(self.obj_dict[Media])
         if (not self.inc_gallery): media_list = []
         media_list.sort(key = lambda x: self.obj_dict[Media][x][OBJDICT_INDEX])
-        for media_handle in media_list:
+        def row(media_handle):
             media = self.database.get_media_from_handle(media_handle)
             jdata = {}
             jdata['gid'] = self.obj_dict[Media][media_handle][OBJDICT_GID]
@@ -1439,9 +1463,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(media.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_media.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_media.js", "M", header, media_list, row, Media)
 
 
     def _export_places(self):
@@ -1449,8 +1472,7 @@ class DynamicWebReport(Report):
         Export places data in Javascript file
         The places data is stored in the Javascript Array "P"
         """
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'P' is sorted by place name\n"
             "// 'P' gives for each media object:\n"
@@ -1484,20 +1506,17 @@ class DynamicWebReport(Report):
             "//     (including the persons directly referencing this place)\n"
             "//   - bkf: A list of the family index (in table 'F') for events referencing this place\n"
             "//   - bkp: A list of the places index (in table 'P') for places enclosed by this place (empty for version 4.0 and below)\n"
-            "//   - change_time: last record modification date\n"
-            "P = ")
-        jdatas = []
+            "//   - change_time: last record modification date\n")
         place_list = list(self.obj_dict[Place])
         place_list.sort(key = lambda x: self.obj_dict[Place][x][OBJDICT_INDEX])
-        for place_handle in place_list:
+        def row(place_handle):
             place = self.database.get_place_from_handle(place_handle)
             jdata = {}
             jdata['gid'] = self.obj_dict[Place][place_handle][OBJDICT_GID]
             place_name = report_utils.place_name(self.database, place_handle)
             jdata['name'] = place_name
             if (not self.inc_places):
-                jdatas.append(jdata)
-                continue
+                return(jdata)
             if DWR_VERSION_410:
                 jdata['type'] = str(place.get_type())
             else:
@@ -1583,9 +1602,8 @@ class DynamicWebReport(Report):
             # Last change date
             jdata['change_time'] = format_time(place.get_change_time())
             #
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_place.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_place.js", "P", header, place_list, row, Place)
 
 
     def get_notes_text(self, object):
@@ -1844,17 +1862,17 @@ class DynamicWebReport(Report):
             region = None
         handle = media.get_handle()
         tname = handle + (("-%d,%d-%d,%d.png" % region) if region else ".png")
-        if (media.get_mime_type()):
-            from_path = get_thumbnail_path(
-                media_path_full(self.database, media.get_path()),
-                media.get_mime_type(),
-                region)
-            if not os.path.isfile(from_path):
-                from_path = os.path.join(IMAGE_DIR, "document.png")
-        else:
-            from_path = os.path.join(IMAGE_DIR, "document.png")
+        media_path = media_path_full(self.database, media.get_path())
+        mime_type = media.get_mime_type()
+        def thumbnail_path():
+            # Build the thumbnail in the Gramps thumbnails cache (in the media pipeline thread)
+            if (mime_type):
+                from_path = get_thumbnail_path(media_path, mime_type, region)
+                if os.path.isfile(from_path):
+                    return(from_path)
+            return(os.path.join(IMAGE_DIR, "document.png"))
         if (tname not in self.thumbnail_created):
-            self.copy_file(from_path, tname, "thumb")
+            self.submit_copy(thumbnail_path, os.path.join(self.target_path, "thumb", tname))
             self.thumbnail_created.add(tname)
         web_path = "thumb/" + tname
         return(web_path)
@@ -1954,17 +1972,15 @@ class DynamicWebReport(Report):
         surns_keys = list(surnames.keys())
         surns_keys.sort(key = SORT_KEY)
         # Generate the file
-        sw = StringIO()
-        sw.write(
+        header = (
             "// This file is generated\n\n"
             "// 'SN' is sorted by surname\n"
             "// 'SN' gives for each surname:\n"
             "//  - surname: the surname\n"
             "//  - letter: the surname first letter\n"
             "//  - persons: the list of persion index (in table 'I') with this surname\n"
-            "\nSN = ")
-        jdatas = []
-        for s in surns_keys:
+            "\n")
+        def row(s):
             # Sort persons
             jdata = {}
             jdata['surname'] = s
@@ -1972,9 +1988,8 @@ class DynamicWebReport(Report):
             surnames[s].sort(key = lambda x: sortnames[x])
             tab = [self.obj_dict[Person][x][OBJDICT_INDEX] for x in surnames[s]]
             jdata['persons'] = tab
-            jdatas.append(jdata)
-        json.dump(jdatas, sw, sort_keys = True, indent = 4)
-        self.update_file("dwr_db_surns.js", sw.getvalue())
+            return(jdata)
+        self.write_table("dwr_db_surns.js", "SN", header, surns_keys, row)
 
 
     def _data_families_index(self, person):
@@ -2133,6 +2148,9 @@ class DynamicWebReport(Report):
         # Note: other scripts and stylesheets are dynamically loaded in "dwr_start.js"
         # "dwr_start.js" is loaded in all pages uncontitionally (see L{write_header})
         dbscripts = ["dwr_db_indi.js", "dwr_db_fam.js", "dwr_db_sour.js", "dwr_db_cita.js", "dwr_db_media.js", "dwr_db_place.js", "dwr_db_repo.js", "dwr_db_surns.js"] #: list of the scripts to embed in the HTML
+        if (self.shard_size):
+            # The shards are loaded by the manifest script
+            dbscripts = ["dwr_db_manifest.js"]
         chartscripts = [
             "data/highcharts/highcharts.js",
             "data/highcharts/highcharts-more.js",
@@ -2725,23 +2743,264 @@ class DynamicWebReport(Report):
         @param txt: file contents
         @param encoding: encoding as passed to Python function codecs.open
         """
+        self.write_file(fout, lambda fw: fw.write(txt), encoding)
+
+
+    def write_file(self, fout, write, encoding = None, digest = None):
+        """
+        Stream the contents of a file to the disk.
+        The contents are written in a temporary file, which is compared chunk by chunk with the existing file.
+        The file is not overwritten if the file exists and already contains the same data
+        @param fout: output file name
+        @param write: function called with the opened file, that writes the file contents
+        @param encoding: encoding as passed to Python function codecs.open
+        @param digest: SHA1 digest of the existing file contents if known.
+            The existing file is not read back when the new contents have the same digest
+        @return: SHA1 digest of the file contents
+        """
         if (encoding is None): encoding = self.encoding
         f = os.path.join(self.target_path, fout)
+        f_temp = f + ".temp"
         self.created_files.append(f)
+        fw = _DigestFile(codecs.open(f_temp, "w", encoding = encoding, errors="xmlcharrefreplace"))
+        try:
+            write(fw)
+        finally:
+            fw.close()
         if (os.path.exists(f)):
             try:
-                fr = codecs.open(f, "r", encoding = encoding, errors="xmlcharrefreplace")
-                txtr = fr.read()
-                fr.close()
-                if (txtr == txt):
+                if (fw.hexdigest() == digest or filecmp.cmp(f, f_temp, shallow = False)):
+                    os.remove(f_temp)
                     log.info("File \"%s\" not overwritten (identical)" % fout)
-                    return
+                    return(fw.hexdigest())
             except:
                 pass
-        fw = codecs.open(f, "w", encoding = encoding, errors="xmlcharrefreplace")
-        fw.write(txt)
-        fw.close()
+            os.remove(f)
+        os.rename(f_temp, f)
         log.info("File \"%s\" generated" % fout)
+        return(fw.hexdigest())
+
+
+    def write_table(self, fout, name, header, keys, row, obj_class = None):
+        """
+        Write a data table in a Javascript file.
+        If L{self.shard_size} is not zero, the table is split into files of L{self.shard_size} records,
+        named "<table file>_<shard number>.js". Each shard is a call to the Javascript function "dwrShard",
+        and the shards are listed in the manifest file (see L{_export_manifest})
+
+        For incremental builds (see L{self.incremental}), the records of a file (or of a shard) are
+        not regenerated when the file was generated by the previous build from the same records,
+        see L{get_shard_key} and L{BUILD_STATE_FILE}
+        @param fout: output file name
+        @param name: name of the Javascript Array
+        @param header: Javascript comments describing the table
+        @param keys: list of the table records keys (handles of the objects of class L{obj_class})
+        @param row: function that returns the record for a key
+        @param obj_class: class of the objects in the table, None if the records are not Gramps objects.
+            The tables without class are always regenerated
+        """
+        base = fout[:-len(".js")]
+        if (not self.shard_size):
+            shards = [(fout, keys)]
+        else:
+            shards = [
+                ("%s_%i.js" % (base, n), keys[start:start + self.shard_size])
+                for (n, start) in enumerate(range(0, len(keys), self.shard_size))
+            ]
+        for (n, (fshard, shard_keys)) in enumerate(shards):
+            key = None
+            state = None
+            if (self.incremental and obj_class is not None):
+                key = self.get_shard_key(fshard, obj_class, shard_keys)
+                state = self.build_state.get(fshard)
+            if (state is not None and state['key'] == key and all(
+                os.path.exists(os.path.join(self.target_path, f)) for f in state['files'])):
+                # Reuse the file, and the media files created with it
+                self.created_files.extend(os.path.join(self.target_path, f) for f in state['files'])
+                log.info("File \"%s\" not regenerated (unchanged records)" % fshard)
+            else:
+                if (not self.shard_size):
+                    def write(fw):
+                        fw.write(header + name + " = ")
+                        json.dump([row(k) for k in shard_keys], fw, sort_keys = True, indent = 4)
+                else:
+                    def write(fw):
+                        fw.write(header + "\ndwrShard(\"%s\", %i, " % (name, n))
+                        json.dump([row(k) for k in shard_keys], fw, sort_keys = True, separators = (",", ":"))
+                        fw.write(");\n")
+                first = len(self.created_files)
+                digest = self.write_file(fshard, write, digest = state and state['hash'])
+                state = {
+                    'key': key,
+                    'hash': digest,
+                    'files': [os.path.relpath(f, self.target_path) for f in self.created_files[first:]],
+                }
+            self.new_build_state[fshard] = state
+        if (self.shard_size):
+            # Remove the shards left by a previous export of a larger table
+            n = len(shards)
+            while (os.path.exists(os.path.join(self.target_path, "%s_%i.js" % (base, n)))):
+                os.remove(os.path.join(self.target_path, "%s_%i.js" % (base, n)))
+                n += 1
+            self.shards[name] = {
+                'file': base,
+                'size': self.shard_size,
+                'length': len(keys),
+                'count': len(shards),
+            }
+
+
+    def get_shard_key(self, fout, obj_class, handles):
+        """
+        Compute the key of a data file (or shard) for incremental builds.
+        The key is a digest of the change times and of the L{self.obj_dict} entries of:
+         - the objects in the file,
+         - the objects they reference,
+         - the objects that reference them (see L{self.bkref_dict}),
+         - the objects referenced by the events they reference, as the events are embedded in the records
+           (for example the birth place of a person),
+         - the places enclosing any of these places, as the place names include the enclosing places.
+        The key changes when any of these objects is modified, or when their index in the tables is changed
+        @param fout: output file name
+        @param obj_class: class of the objects in the file
+        @param handles: handles of the objects in the file
+        """
+        if (self.bkref_inverse is None):
+            # Objects referenced by each object, from the back references
+            self.bkref_inverse = defaultdict(set)
+            for (ref_class, bkrefs) in self.bkref_dict.items():
+                for (ref_handle, bkref_list) in bkrefs.items():
+                    for bkref in bkref_list:
+                        self.bkref_inverse[(bkref[BKREF_CLASS].__name__, bkref[BKREF_HANDLE])].add((ref_class.__name__, ref_handle))
+        sha1 = hashlib.sha1(fout.encode("UTF-8"))
+        for handle in handles:
+            obj = self.database.method("get_%s_from_handle", obj_class.__name__)(handle)
+            refs = set(obj.get_referenced_handles_recursively())
+            refs.update(self.bkref_inverse[(obj_class.__name__, handle)])
+            refs.update(
+                (bkref[BKREF_CLASS].__name__, bkref[BKREF_HANDLE])
+                for bkref in self.bkref_dict[obj_class].get(handle, ()))
+            for (class_name, ref_handle) in list(refs):
+                if (class_name == "Event"):
+                    refs.update(self.get_references(class_name, ref_handle))
+            places = [ref_handle for (class_name, ref_handle) in refs if (class_name == "Place")]
+            if (obj_class == Place): places.append(handle)
+            for place_handle in places:
+                refs.update(("Place", ref_handle) for ref_handle in self.get_enclosing_places(place_handle))
+            deps = [(obj_class.__name__, handle, obj.get_change_time())]
+            deps.extend(
+                (class_name, ref_handle, self.get_change_time(class_name, ref_handle))
+                for (class_name, ref_handle) in sorted(refs))
+            for (class_name, ref_handle, change) in deps:
+                entry = self.obj_dict[self.class_by_name[class_name]].get(ref_handle) if (class_name in self.class_by_name) else None
+                sha1.update(json.dumps([class_name, ref_handle, change, entry]).encode("UTF-8"))
+        return(sha1.hexdigest())
+
+
+    def get_change_time(self, class_name, handle):
+        """
+        Return the change time of a Gramps object (0 if the object does not exist)
+        The change times are cached during the report generation
+        """
+        key = (class_name, handle)
+        if (key not in self.change_times):
+            obj = self.database.method("get_%s_from_handle", class_name)(handle)
+            self.change_times[key] = obj.get_change_time() if obj else 0
+        return(self.change_times[key])
+
+
+    def get_references(self, class_name, handle):
+        """
+        Return the (class name, handle) of the objects referenced by a Gramps object
+        The references are cached during the report generation
+        """
+        key = (class_name, handle)
+        if (key not in self.references):
+            obj = self.database.method("get_%s_from_handle", class_name)(handle)
+            self.references[key] = obj.get_referenced_handles_recursively() if obj else []
+        return(self.references[key])
+
+
+    def get_enclosing_places(self, place_handle):
+        """
+        Return the handles of the places enclosing a place, directly or not
+        """
+        enclosing = set()
+        todo = [place_handle]
+        while (todo):
+            for (class_name, ref_handle) in self.get_references("Place", todo.pop()):
+                if (class_name == "Place" and ref_handle not in enclosing and ref_handle != place_handle):
+                    enclosing.add(ref_handle)
+                    todo.append(ref_handle)
+        return(enclosing)
+
+
+    def read_build_state(self):
+        """
+        Initialize the incremental build, see L{write_table}
+        The state of the previous build is read from L{BUILD_STATE_FILE}.
+        It is discarded when the report options or the report code are not the same
+        """
+        self.build_state = {}
+        self.new_build_state = {}
+        self.change_times = {}
+        self.references = {}
+        self.bkref_inverse = None
+        self.class_by_name = dict((obj_class.__name__, obj_class) for obj_class in self.obj_dict.keys())
+        if (not self.incremental): return
+        self.build_options = hashlib.sha1(json.dumps([
+            sorted((key, str(value)) for (key, value) in self.options.items()),
+            self.database.get_save_path(),
+            os.path.getmtime(__file__),
+            # Privacy of living people depends on the current date
+            Today().get_year(),
+        ]).encode("UTF-8")).hexdigest()
+        f = os.path.join(self.target_path, BUILD_STATE_FILE)
+        if (not os.path.exists(f)): return
+        try:
+            fr = codecs.open(f, "r", encoding = "UTF-8")
+            state = json.load(fr)
+            fr.close()
+        except:
+            log.warning(_("Unable to read the incremental build state \"%(path)s\"") % {"path": f})
+            return
+        if (state.get('options') == self.build_options):
+            self.build_state = state['files']
+
+
+    def write_build_state(self):
+        """
+        Save the incremental build state in L{BUILD_STATE_FILE}, see L{write_table}
+        The build state file is not part of the web site
+        """
+        state = {
+            'options': self.build_options,
+            'files': self.new_build_state,
+        }
+        fw = codecs.open(os.path.join(self.target_path, BUILD_STATE_FILE), "w", encoding = "UTF-8")
+        json.dump(state, fw, sort_keys = True, indent = 1)
+        fw.close()
+
+
+    def _export_manifest(self):
+        """
+        Export the list of the data tables shards in Javascript file
+        The manifest is stored in the Javascript Object "DWR_SHARDS"
+        """
+        sw = StringIO()
+        sw.write(
+            "// This file is generated\n\n"
+            "// 'DWR_SHARDS' gives for each data table (indexed by table name):\n"
+            "//   - file: The shard files name, without the shard number and extension\n"
+            "//   - size: The number of records in each shard\n"
+            "//   - length: The total number of records in the table\n"
+            "//   - count: The number of shards\n"
+            "// The records are loaded from the shards when they are used, see 'dwrLoadShards' in 'dwr_start.js'\n"
+            "DWR_SHARDS = ")
+        json.dump(self.shards, sw, sort_keys = True, indent = 4)
+        sw.write(";\n\ndwrLoadShards();\n")
+        self.update_file("dwr_db_manifest.js", sw.getvalue())
+
 
     def copy_file(self, from_fname, to_fname, to_dir=""):
         """
@@ -2754,38 +3013,12 @@ class DynamicWebReport(Report):
         'to_dir' is the relative path name in the destination root. It will
         be prepended before 'to_fname'.
 
-        The file is not copied if the contents of 'from_fname' 'to_fname' are identical
+        The file is copied in background by the media pipeline, see L{copy_media_file}
         """
         # log.debug("copying '%s' to '%s/%s'" % (from_fname, to_dir, to_fname))
         dest = os.path.join(self.target_path, to_dir, to_fname)
-        destdir = os.path.dirname(dest)
-        if not os.path.isdir(destdir):
-            os.makedirs(destdir)
-
         if from_fname != dest:
-            try:
-                dest_temp = dest + ".temp"
-                shutil.copyfile(from_fname, dest_temp)
-                self.created_files.append(dest)
-                if (os.path.exists(dest)):
-                    fr = codecs.open(dest, "rb")
-                    old_bytes = fr.read()
-                    fr.close()
-                    fr = codecs.open(dest_temp, "rb")
-                    new_bytes = fr.read()
-                    fr.close()
-                    if (old_bytes == new_bytes):
-                        os.remove(dest_temp)
-                        log.info("File \"%s\" not overwritten (identical)" % dest)
-                        return
-                    os.remove(dest)
-                os.rename(dest_temp, dest)
-                mtime = os.stat(from_fname).st_mtime
-                os.utime(dest, (mtime, mtime))
-                log.info("File \"%s\" generated" % dest)
-            except:
-                log.warning(_("Copying error: %(error)s") % {"error": sys.exc_info()[1]})
-                log.error(_("Impossible to copy \"%(src)s\" to \"%(dst)s\"") % {"src": from_fname, "dst": to_fname})
+            self.submit_copy(lambda: from_fname, dest)
         elif self.warn_dir:
             self.user.warn(
                 _("Possible destination error") + "\n" +
@@ -2798,6 +3031,81 @@ class DynamicWebReport(Report):
             self.warn_dir = False
 
 
+    def submit_copy(self, get_source, dest):
+        """
+        Add a file copy to the media pipeline
+        @param get_source: function that returns the source file path, called in the pipeline thread
+        @param dest: destination file path
+        """
+        destdir = os.path.dirname(dest)
+        if not os.path.isdir(destdir):
+            os.makedirs(destdir)
+        # The file is listed immediately, in order to keep the order of L{self.created_files}
+        self.created_files.append(dest)
+        self.media_jobs.append((dest, self.media_pool.submit(self.copy_media_file, get_source, dest)))
+
+
+    def copy_media_file(self, get_source, dest):
+        """
+        Copy a file, unless the destination is up-to-date.
+        The destination is up-to-date when it has the same size and modification time as the source,
+        or the same size and the same contents (the modification time is then updated).
+        This method is called in the media pipeline threads
+        @param get_source: function that returns the source file path
+        @param dest: destination file path
+        @return: tuple (MEDIA_COPIED, MEDIA_SKIPPED or MEDIA_FAILED, number of bytes copied)
+        """
+        from_fname = None
+        try:
+            from_fname = get_source()
+            src_stat = os.stat(from_fname)
+            if (os.path.exists(dest)):
+                dest_stat = os.stat(dest)
+                if (dest_stat.st_size == src_stat.st_size):
+                    if (dest_stat.st_mtime_ns == src_stat.st_mtime_ns):
+                        log.info("File \"%s\" not overwritten (identical)" % dest)
+                        return((MEDIA_SKIPPED, 0))
+                    if (filecmp.cmp(from_fname, dest, shallow = False)):
+                        os.utime(dest, ns = (src_stat.st_mtime_ns, src_stat.st_mtime_ns))
+                        log.info("File \"%s\" not overwritten (identical)" % dest)
+                        return((MEDIA_SKIPPED, 0))
+            dest_temp = dest + ".temp"
+            shutil.copyfile(from_fname, dest_temp)
+            if (os.path.exists(dest)):
+                os.remove(dest)
+            os.rename(dest_temp, dest)
+            os.utime(dest, ns = (src_stat.st_mtime_ns, src_stat.st_mtime_ns))
+            log.info("File \"%s\" generated" % dest)
+            return((MEDIA_COPIED, src_stat.st_size))
+        except:
+            log.warning(_("Copying error: %(error)s") % {"error": sys.exc_info()[1]})
+            log.error(_("Impossible to copy \"%(src)s\" to \"%(dst)s\"") % {"src": from_fname, "dst": dest})
+            return((MEDIA_FAILED, 0))
+
+
+    def wait_media_files(self):
+        """
+        Wait for the end of the media pipeline, and log the totals
+        The files that could not be copied are removed from L{self.created_files}
+        """
+        counts = [0, 0, 0]
+        nbytes = 0
+        failed = set()
+        for (dest, job) in self.media_jobs:
+            (result, size) = job.result()
+            counts[result] += 1
+            nbytes += size
+            if (result == MEDIA_FAILED): failed.add(dest)
+        self.media_pool.shutdown()
+        self.media_jobs = []
+        if (failed):
+            self.created_files = [f for f in self.created_files if (f not in failed)]
+        log.info(_("Media files: %(copied)i copied, %(skipped)i skipped, %(failed)i failed, %(bytes)i bytes copied") % {
+            'copied': counts[MEDIA_COPIED],
+            'skipped': counts[MEDIA_SKIPPED],
+            'failed': counts[MEDIA_FAILED],
+            'bytes': nbytes})
+
 
     def copy_template_files(self):
         """
@@ -3942,6 +4250,14 @@ class DynamicWebOptions(MenuReportOptions):
         inc_gendex.set_help(_('Whether to include a GENDEX file or not'))
         addopt("inc_gendex", inc_gendex)
 
+        shard_size = NumberOption(_("Records per data file"), 0, 0, 100000)
+        shard_size.set_help(_("The number of records stored in each data file. The pages load only the data files they need. Set to 0 to store each table in a single data file"))
+        addopt("shard_size", shard_size)
+
+        incremental = BooleanOption(_("Incremental build"), False)
+        incremental.set_help(_("Whether to regenerate only the data files whose records changed since the previous report generation in the same destination directory"))
+        addopt("incremental", incremental)
+
         inc_pageconf = BooleanOption(_("Enable page configuration"), False)
         inc_pageconf.set_help(_( "Whether to enable page configuration"))
         addopt('inc_pageconf', inc_pageconf)
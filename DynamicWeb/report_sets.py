@@ -245,6 +245,31 @@ test_list = [
         "pid": "I0044", # Lewis Anderson Zieliński
     },
 },
+{
+    'title': 'Sharded data files test',
+    'environ': {
+        'LANGUAGE': "en_US",
+        'LANG': "en_US.UTF-8",
+    },
+    'options': {
+        "filter": 3, # Ancestors
+        "pid": "I0044", # Lewis Anderson Zieliński
+        "shard_size": 3,
+    },
+},
+{
+    'title': 'Incremental build test',
+    'environ': {
+        'LANGUAGE': "en_US",
+        'LANG': "en_US.UTF-8",
+    },
+    'options': {
+        "filter": 3, # Ancestors
+        "pid": "I0044", # Lewis Anderson Zieliński
+        "shard_size": 3,
+        "incremental": True,
+    },
+},
 ]
 
 
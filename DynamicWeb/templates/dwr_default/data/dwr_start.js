@@ -89,6 +89,79 @@ function loadcssfile(filename)
 }
 
 
+//============================================ data shards
+
+// When the report is generated with the option "shard_size", the tables are split into shards
+// listed in the manifest "dwr_db_manifest.js" (see 'DWR_SHARDS' in the manifest)
+// Each shard calls 'dwrShard' with the table name, the shard number, and the shard records
+
+function dwrLoadShards()
+{
+	// The shards are loaded on demand when the web site is served over HTTP.
+	// Local files cannot be requested synchronously, so all the shards are loaded in that case
+	var lazy = (typeof(Proxy) != 'undefined') &&
+		(window.location.protocol == 'http:' || window.location.protocol == 'https:');
+	for (var name in DWR_SHARDS)
+	{
+		var table = DWR_SHARDS[name];
+		table.data = new Array(table.length);
+		table.loaded = [];
+		if (lazy)
+		{
+			window[name] = dwrLazyTable(name);
+		}
+		else
+		{
+			window[name] = table.data;
+			for (var n = 0; n < table.count; n++) loadjsfile(table.file + '_' + n + '.js');
+		}
+	}
+}
+
+function dwrShard(name, n, records)
+{
+	var table = DWR_SHARDS[name];
+	for (var i = 0; i < records.length; i++) table.data[n * table.size + i] = records[i];
+	table.loaded[n] = true;
+}
+
+function dwrLoadShard(name, n)
+{
+	var table = DWR_SHARDS[name];
+	if (table.loaded[n] || n < 0 || n >= table.count) return;
+	var xhr = new XMLHttpRequest();
+	xhr.open('GET', table.file + '_' + n + '.js', false);
+	xhr.overrideMimeType('text/javascript; charset=UTF-8');
+	xhr.send(null);
+	// Global evaluation of the shard, that calls 'dwrShard'
+	(0, eval)(xhr.responseText);
+	table.loaded[n] = true;
+}
+
+function dwrLazyTable(name)
+{
+	// Array proxy that loads the shard containing a record when the record is accessed
+	var table = DWR_SHARDS[name];
+	function shardOf(prop)
+	{
+		if (typeof(prop) != 'string' || !/^\d+$/.test(prop)) return(-1);
+		return(Math.floor(parseInt(prop) / table.size));
+	}
+	return(new Proxy(table.data, {
+		get: function(data, prop)
+		{
+			dwrLoadShard(name, shardOf(prop));
+			return(data[prop]);
+		},
+		has: function(data, prop)
+		{
+			dwrLoadShard(name, shardOf(prop));
+			return(prop in data);
+		}
+	}));
+}
+
+
 //============================================ tableaux
 
 function cmp(a, b)
@@ -125,12 +125,12 @@ class DynamicWebTests(unittest.TestCase):
             self.html_procedures += "<li>%s<br><a href='%s'>%s</a></li>" % (procedure['what'], p, p)
 
 
-    def do_case(self, test_num, test_set):
+    def do_case(self, test_num, test_set, clean = True):
         test_name = "test_%03i" % test_num
         target = os.path.join(self.results_path, test_name)
 
         # Clean-up reports and tests files
-        if (os.path.exists(target)): shutil.rmtree(target)
+        if (clean and os.path.exists(target)): shutil.rmtree(target)
 
         # Build the report options form the default options + the test set options
         o = copy.deepcopy(default_options)
@@ -284,6 +284,133 @@ class DynamicWebTests(unittest.TestCase):
         # etc.
 
 
+    #-------------------------------------------------------------------------
+    # Sharded data files tests
+    #-------------------------------------------------------------------------
+    def test_shards(self):
+        self.do_case(1, test_list[1])
+        target = os.path.join(self.results_path, "test_001")
+
+        # Check the manifest
+        path = os.path.join(target, "dwr_db_manifest.js")
+        jf = codecs.open(path, "r", encoding = "UTF-8")
+        s = jf.read()
+        s = re.sub(r"^\s*//.*$", "", s, flags = re.MULTILINE) # remove JS comments
+        s = re.sub(r"DWR_SHARDS *= *", "", s)
+        s = re.sub(r";\s*dwrLoadShards\(\);\s*$", "", s)
+        shards = json.loads(s)
+
+        # Check size of exported JSON shards
+        for (name, expected_size) in [
+            ("I", 7),
+            ("F", 5),
+            ("S", 4),
+            ("M", 4),
+            ("R", 3),
+            ("P", 37),
+        ]:
+            self.assertEqual(shards[name]['length'], expected_size,
+                "%s table does not have the expected size (%i instead of %i)" % (name, shards[name]['length'], expected_size))
+            size = 0
+            for n in range(shards[name]['count']):
+                path = os.path.join(target, "%s_%i.js" % (shards[name]['file'], n))
+                jf = codecs.open(path, "r", encoding = "UTF-8")
+                s = jf.read()
+                s = re.sub(r"^\s*//.*$", "", s, flags = re.MULTILINE) # remove JS comments
+                s = re.sub(r"^\s*dwrShard\(\"%s\", %i, (.*)\);\s*$" % (name, n), r"\1", s, flags = re.DOTALL)
+                jdata = json.loads(s)
+                self.assertTrue(len(jdata) <= 3, "%s shard is too large" % path)
+                size += len(jdata)
+            self.assertEqual(size, expected_size,
+                "%s shards do not have the expected size (%i instead of %i)" % (name, size, expected_size))
+
+
+    #-------------------------------------------------------------------------
+    # Incremental build tests
+    #-------------------------------------------------------------------------
+    def test_incremental(self):
+        self.do_case(2, test_list[2])
+        target = os.path.join(self.results_path, "test_002")
+        self.assertTrue(os.path.exists(os.path.join(target, BUILD_STATE_FILE)), "%s was not generated" % BUILD_STATE_FILE)
+        data_files = glob.glob(os.path.join(target, "dwr_db_*.js"))
+        mtimes = dict((f, os.path.getmtime(f)) for f in data_files)
+
+        # Re-export without changes (into the same directory)
+        time.sleep(1)
+        self.do_case(2, test_list[2], clean = False)
+
+        # Check that the data files are not overwritten
+        for f in data_files:
+            self.assertEqual(os.path.getmtime(f), mtimes[f], "%s was overwritten" % f)
+
+        # Rename the birth place of the center person, which is shown two references away in the persons table
+        contents = dict((f, self.read_file(f)) for f in data_files)
+        keys = self.read_build_keys(target)
+        place_name = self.rename_birth_place("I0044", " (renamed)")
+        try:
+            # Re-export incrementally, and export again from scratch
+            time.sleep(1)
+            self.do_case(2, test_list[2], clean = False)
+            self.do_case(3, test_list[2])
+        finally:
+            self.rename_birth_place("I0044", None, place_name)
+
+        # Check that the data files are up to date
+        full_target = os.path.join(self.results_path, "test_003")
+        full_files = glob.glob(os.path.join(full_target, "dwr_db_*.js"))
+        self.assertEqual(
+            sorted(os.path.basename(f) for f in data_files),
+            sorted(os.path.basename(f) for f in full_files))
+        for f in data_files:
+            self.assertEqual(self.read_file(f), self.read_file(os.path.join(full_target, os.path.basename(f))),
+                "%s is not up to date" % f)
+
+        # Check that exactly the data files whose records changed are regenerated
+        new_keys = self.read_build_keys(target)
+        regenerated = sorted(f for f in new_keys if (new_keys[f] != keys.get(f)))
+        changed = sorted(os.path.basename(f) for f in data_files if (self.read_file(f) != contents[f]))
+        self.assertEqual(regenerated, changed)
+        self.assertTrue(any(f.startswith("dwr_db_indi_") for f in changed), "No person shard was changed")
+        self.assertTrue(any(f.startswith("dwr_db_place_") for f in changed), "No place shard was changed")
+
+
+    def read_build_keys(self, target):
+        """
+        Return the key of each data file in the incremental build state
+        """
+        state = json.loads(self.read_file(os.path.join(target, BUILD_STATE_FILE)))
+        return(dict((f, file_state['key']) for (f, file_state) in state['files'].items()))
+
+
+    def read_file(self, path):
+        f = codecs.open(path, "r", encoding = "UTF-8")
+        s = f.read()
+        f.close()
+        return(s)
+
+
+    def rename_birth_place(self, gid, suffix, name = None):
+        """
+        Append suffix to the name of the birth place of person gid, or set the name to name.
+        Return the previous name
+        """
+        from gramps.gen.db.utils import open_database
+        from gramps.gen.db import DbTxn
+        from gramps.gen.utils.db import get_birth_or_fallback
+        db = open_database("dynamicweb_example", force_unlock = True)
+        try:
+            person = db.get_person_from_gramps_id(gid)
+            event = get_birth_or_fallback(db, person)
+            place = db.get_place_from_handle(event.get_place_handle())
+            previous = place.get_name().get_value()
+            place.get_name().set_value(previous + suffix if (name is None) else name)
+            with DbTxn("Rename place", db) as trans:
+                db.commit_place(place, trans)
+        finally:
+            db.close()
+        return(previous)
+
+
 ##############################################################
 
 if __name__ == '__main__':
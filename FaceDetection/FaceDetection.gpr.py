@@ -2,7 +2,7 @@ register(GRAMPLET,
          id="Face Detection",
          name=_("Face Detection"),
          description = _("Gramplet for detecting and assigning faces"),
-         version = '1.0.17',
+         version = '1.0.19',
          gramps_target_version="5.0",
          status = UNSTABLE, # not yet tested with python 3
          fname="FaceDetection.py",
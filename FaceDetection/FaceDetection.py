@@ -23,8 +23,12 @@
 from gramps.gen.plug import Gramplet
 from gramps.gui.widgets import Photo
 from gramps.gen.utils.file import media_path_full
+from gramps.gen.const import HOME_DIR
 from gi.repository import Gtk
+from gi.repository import GdkPixbuf
 import os
+import io
+import json
 import cv
 import Image
 import ImageDraw
@@ -40,6 +44,48 @@ _ = _trans.gettext
 path, filename = os.path.split(__file__)
 HAARCASCADE_PATH = os.path.join(path, 'haarcascade_frontalface_alt.xml')
 
+# Faces found by the Batch Face Detection tool of the Photo Tagging gramplet
+FACE_CACHE_PATH = os.path.join(HOME_DIR, 'facedetection_cache.json')
+
+_cascade = None
+
+def get_cascade():
+    """
+    Return the face classifier, loading it the first time it is used.
+    """
+    global _cascade
+    if _cascade is None:
+        _cascade = cv.Load(HAARCASCADE_PATH)
+    return _cascade
+
+_face_cache = {}
+_face_cache_mtime = None
+
+def cached_faces(checksum, min_face_size):
+    """
+    Return the (x, y, width, height) rectangles of the faces already found in
+    an image with the given minimum face size, or None.  The face cache is
+    only read again when its file has changed.
+    """
+    global _face_cache, _face_cache_mtime
+    if not checksum:
+        return None
+    try:
+        mtime = os.path.getmtime(FACE_CACHE_PATH)
+    except OSError:
+        return None
+    if mtime != _face_cache_mtime:
+        try:
+            with io.open(FACE_CACHE_PATH, 'r', encoding='utf-8') as cache_file:
+                _face_cache = json.load(cache_file)
+        except (IOError, ValueError):
+            _face_cache = {}
+        _face_cache_mtime = mtime
+    entry = _face_cache.get(checksum)
+    if entry and entry['min_size'] == list(min_face_size):
+        return entry['faces']
+    return None
+
 class FaceDetection(Gramplet):
     """
     Interface for detecting and assigning facial areas to a person.
@@ -135,15 +181,22 @@ class FaceDetection(Gramplet):
         media = self.dbstate.db.get_media_from_handle(active_handle)
         self.load_image(media)
         min_face_size = (50,50) # FIXME: get from setting
+        references = self.find_references()
+        faces = cached_faces(media.get_checksum(), min_face_size)
+        if faces is not None:
+            o_width, o_height = [float(t) for t in
+                GdkPixbuf.Pixbuf.get_file_info(self.full_path)[1:]]
+            rects = [(x/o_width, y/o_height, width/o_width, height/o_height)
+                     for (x, y, width, height) in faces]
+            self.draw_rectangles(rects, references)
+            return
         self.cv_image = cv.LoadImage(self.full_path, cv.CV_LOAD_IMAGE_GRAYSCALE)
         o_width, o_height = self.cv_image.width, self.cv_image.height
         cv.EqualizeHist(self.cv_image, self.cv_image)
-        cascade = cv.Load(HAARCASCADE_PATH)
-        faces = cv.HaarDetectObjects(self.cv_image, cascade,
+        faces = cv.HaarDetectObjects(self.cv_image, get_cascade(),
                                      cv.CreateMemStorage(0),
                                      1.2, 2, cv.CV_HAAR_DO_CANNY_PRUNING,
                                      min_face_size)
-        references = self.find_references()
         rects = []
         o_width, o_height = [float(t) for t in (self.cv_image.width, self.cv_image.height)]
         for ((x, y, width, height), neighbors) in faces:
@@ -3,7 +3,7 @@ register(VIEW,
          name  = _("Graph View"),
          category = ("Ancestry", _("Charts")),
          description =  _("Dynamic graph of relations"),
-         version = '1.0.55',
+         version = '1.0.60',
          gramps_target_version = "5.0",
          status = STABLE,
          fname = 'graphview.py',
@@ -33,6 +33,10 @@
 #
 #-------------------------------------------------------------------------
 import os
+import time
+from collections import deque, OrderedDict
+from hashlib import sha1
+from threading import Thread
 from math import log
 from xml.parsers.expat import ExpatError, ParserCreate
 from gramps.gen.const import GRAMPS_LOCALE as glocale
@@ -41,7 +45,7 @@ try:
 except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
-from gi.repository import Gtk, Gdk, GdkPixbuf
+from gi.repository import Gtk, Gdk, GdkPixbuf, GLib
 import string
 from subprocess import Popen, PIPE
 from io import StringIO
@@ -133,6 +137,9 @@ class GraphView(NavigationView):
 
         self.dbstate = dbstate
         self.graph_widget = None
+        # person handle -> (change time, media handle, label) of the node
+        # labels made so far
+        self.label_cache = {}
         self.dbstate.connect('database-changed', self.change_db)
 
         self.additional_uis.append(self.additional_ui())
@@ -141,14 +148,18 @@ class GraphView(NavigationView):
         """
         Set up callbacks for changes to person and family nodes
         """
-        self.callman.add_db_signal('person-update', self.goto_handle)
-        self.callman.add_db_signal('family-update', self.goto_handle)
+        self.callman.add_db_signal('person-update', self.update_handles)
+        self.callman.add_db_signal('family-update', self.update_handles)
+        self.callman.add_db_signal('media-update', self.update_media)
+        self.callman.add_db_signal('event-update', self.update_labels)
+        self.callman.add_db_signal('place-update', self.update_labels)
 
     def change_db(self, db):
         """
         Set up callback for changes to the database
         """
         self._change_db(db)
+        self.label_cache.clear()
         self.graph_view.change_max_zoom()
         if self.active:
             self.graph_widget.clear()
@@ -216,11 +227,33 @@ class GraphView(NavigationView):
         "Go to a named handle"
         if self.active:
             if self.get_active() != "":
-                self.graph_widget.clear()
                 self.graph_widget.populate(self.get_active())
         else:
             self.dirty = True
 
+    def update_handles(self, handles):
+        "Redraw after people or families have changed"
+        for handle in handles:
+            self.label_cache.pop(handle, None)
+        if self.active:
+            if self.get_active() != "":
+                self.graph_widget.refresh(self.get_active())
+        else:
+            self.dirty = True
+
+    def update_media(self, handles):
+        "Redraw after media objects have changed"
+        for (person_handle, (change, media_handle, label)) in list(
+                self.label_cache.items()):
+            if media_handle in handles:
+                del self.label_cache[person_handle]
+        self.update_handles([])
+
+    def update_labels(self, handles):
+        "Redraw after the events or places shown in the labels have changed"
+        self.label_cache.clear()
+        self.update_handles([])
+
     def can_configure(self):
         """
         See :class:`~gui.views.pageview.PageView 
@@ -236,6 +269,7 @@ class GraphView(NavigationView):
             self.show_images = True
         else:
             self.show_images = False
+        self.label_cache.clear()
         self.graph_widget.populate(self.get_active())
 
     def cb_update_show_full_dates(self, client, cnxn_id, entry, data):
@@ -246,6 +280,7 @@ class GraphView(NavigationView):
             self.show_full_dates = True
         else:
             self.show_full_dates = False
+        self.label_cache.clear()
         self.graph_widget.populate(self.get_active())
 
     def cb_update_show_places(self, client, cnxn_id, entry, data):
@@ -256,6 +291,7 @@ class GraphView(NavigationView):
             self.show_places = True
         else:
             self.show_places = False
+        self.label_cache.clear()
         self.graph_widget.populate(self.get_active())
 
     def cb_update_highlight_home_person(self, client, cnxn_id, entry, data):
@@ -377,6 +413,9 @@ class GraphWidget(object):
     """
     Define the canvas that displays the graph along with a zoom control.
     """
+    # how many layouts to keep for reuse
+    SVG_CACHE_SIZE = 20
+
     def __init__(self, view, dbstate, uistate):
         # Variables for drag and scroll
         self._last_x = 0
@@ -386,6 +425,16 @@ class GraphWidget(object):
         self.dbstate = dbstate
         self.uistate = uistate
         self.active_person_handle = None
+        # The Graphviz process still laying out, and a count of the
+        # requests so that older layouts can be dropped
+        self.dot_process = None
+        self.layout_count = 0
+        self.drawn_count = 0
+        self.svg_cache = OrderedDict()
+        # The nodes and links of the graph on show, and the canvas items
+        # drawn for each node
+        self.graph = None
+        self.node_items = {}
 
         scrolled_win = Gtk.ScrolledWindow()
         scrolled_win.set_shadow_type(Gtk.ShadowType.IN)
@@ -411,25 +460,103 @@ class GraphWidget(object):
         self.vbox.pack_start(scrolled_win, True, True, 0)
         self.change_max_zoom()
 
-    def populate(self, active_person):
+    def populate(self, active_person, dot=None):
         """
-        Populate the graph with widgets derived from Graphviz
+        Populate the graph with widgets derived from Graphviz.
+
+        The layout is done by Graphviz in a background thread, and drawn
+        when it finishes; a newer request stops any layout still running.
+        Layouts are cached, so going back to a person draws at once.
         """
-        dot = DotGenerator(self.dbstate, self.view)
+        if dot is None:
+            dot = DotGenerator(self.dbstate, self.view)
+            dot.build_graph(active_person)
         self.active_person_handle = active_person
-        dot.build_graph(active_person)
+        graph = (active_person, dot.nodes, dot.get_topology())
 
         # Build the rest of the widget by parsing SVG data from Graphviz
         dot_data = dot.get_dot().encode('utf8')
+        key = self.get_layout_key(dot_data)
+
+        self.layout_count += 1
+        if self.dot_process and self.dot_process.poll() is None:
+            self.dot_process.kill()
+        self.dot_process = None
+
+        if key in self.svg_cache:
+            self.svg_cache.move_to_end(key)
+            self.draw(self.svg_cache[key], graph)
+            return
+
+        self.uistate.push_message(self.dbstate, _("Laying out graph..."))
         if win():
-            svg_data = Popen(['dot', '-Tsvg'],
-                             creationflags=DETACHED_PROCESS,
-                             stdin=PIPE,
-                             stdout=PIPE,
-                             stderr=PIPE).communicate(input=dot_data)[0]
+            self.dot_process = Popen(['dot', '-Tsvg'],
+                                     creationflags=DETACHED_PROCESS,
+                                     stdin=PIPE,
+                                     stdout=PIPE,
+                                     stderr=PIPE)
         else:
-            svg_data = Popen(['dot', '-Tsvg'], 
-                        stdin=PIPE, stdout=PIPE).communicate(input=dot_data)[0]
+            self.dot_process = Popen(['dot', '-Tsvg'],
+                                     stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        thread = Thread(target=self.run_layout,
+                        args=(self.dot_process, dot_data,
+                              self.layout_count, key, graph))
+        thread.daemon = True
+        thread.start()
+
+    def get_layout_key(self, dot_data):
+        """
+        Key the cached layouts by the DOT text and the view options.
+        """
+        key = sha1(dot_data)
+        for option in ('interface.graphview-highlight-home-person',
+                       'interface.graphview-home-person-color'):
+            key.update(str(self.view._config.get(option)).encode('utf8'))
+        return key.hexdigest()
+
+    def run_layout(self, process, dot_data, count, key, graph):
+        """
+        Run Graphviz on the DOT text. Runs in a background thread, and
+        hands the SVG back to the main thread for drawing.
+        """
+        start = time.perf_counter()
+        try:
+            svg_data = process.communicate(input=dot_data)[0]
+        except OSError:
+            # the process was stopped by a newer request
+            process.wait()
+            svg_data = b''
+        GLib.idle_add(self.layout_done, process.returncode, svg_data,
+                      count, key, graph, time.perf_counter() - start)
+
+    def layout_done(self, returncode, svg_data, count, key, graph, elapsed):
+        """
+        Draw a finished layout, unless it has been overtaken by a newer one.
+        """
+        if returncode == 0:
+            self.svg_cache[key] = svg_data
+            while len(self.svg_cache) > self.SVG_CACHE_SIZE:
+                self.svg_cache.popitem(last=False)
+        if count != self.layout_count:
+            return False
+        self.dot_process = None
+        if returncode != 0:
+            self.uistate.push_message(self.dbstate,
+                                      _("Graphviz failed to lay out the graph"))
+            return False
+        self.draw(svg_data, graph)
+        self.uistate.push_message(self.dbstate,
+                                  _("Graph laid out in %.2f seconds") % elapsed)
+        return False
+
+    def draw(self, svg_data, graph):
+        """
+        Draw the graph from the SVG made by Graphviz.
+        """
+        self.clear()
+        self.graph = graph
+        self.drawn_count = self.layout_count
+        self.node_items = {}
         parser = GraphvizSvgParser(self, self.view)
         parser.parse(svg_data)
         window = self.canvas.get_parent()
@@ -450,6 +577,68 @@ class GraphWidget(object):
         # Update the status bar
         self.view.change_page()
 
+    def refresh(self, active_person):
+        """
+        Bring the graph up to date after people or families have changed.
+        If the same nodes and links are still there, only the text, images
+        and colours of the nodes that changed are updated on the canvas;
+        otherwise the graph is laid out again.
+        """
+        dot = DotGenerator(self.dbstate, self.view)
+        dot.build_graph(active_person)
+        if (self.graph is None or self.graph[0] != active_person or
+                self.graph[2] != dot.get_topology() or
+                self.layout_count != self.drawn_count):
+            self.populate(active_person, dot)
+            return
+        old_nodes = self.graph[1]
+        changed = [node_id for node_id in dot.nodes
+                   if dot.nodes[node_id] != old_nodes[node_id]]
+        for node_id in changed:
+            if not self.update_node(node_id, old_nodes[node_id],
+                                    dot.nodes[node_id]):
+                self.populate(active_person, dot)
+                return
+        self.graph = (active_person, dot.nodes, dot.get_topology())
+
+    def update_node(self, node_id, old, new):
+        """
+        Update the canvas items of a node in place. Returns False if the
+        node has changed too much for that, and needs a new layout.
+        """
+        items = self.node_items.get(node_id)
+        if items is None:
+            return False
+        (old_image, old_lines) = get_label_lines(old[0])
+        (image, lines) = get_label_lines(new[0])
+        if (len(lines) != len(items['text']) or len(old_lines) != len(lines) or
+                bool(old_image) != bool(image) or
+                len(items['image']) != (1 if image else 0) or
+                old[1] != new[1]):
+            return False
+        # The shape keeps the size it was laid out with, so longer text
+        # would spill out of it
+        if any(len(line) > len(old_line)
+               for (line, old_line) in zip(lines, old_lines)):
+            return False
+        for item, line in zip(items['text'], lines):
+            item.set_property('text', line)
+        if image and image != old_image:
+            items['image'][0].set_property(
+                'pixbuf', GdkPixbuf.Pixbuf.new_from_file(image))
+        if old[2:] != new[2:]:
+            (color, style, fill) = new[2:]
+            home_person = self.dbstate.db.get_default_person()
+            highlight = (self.view._config.get(
+                             'interface.graphview-highlight-home-person') and
+                         home_person and home_person.handle == node_id)
+            for item in items['shape']:
+                if color:
+                    item.set_property('stroke_color', color)
+                if fill and not highlight:
+                    item.set_property('fill_color', fill)
+        return True
+
     def change_max_zoom(self):
         """
         Change the maximum value of the zoom.
@@ -775,6 +964,7 @@ class GraphvizSvgParser(object):
                                         fill_color = fill_color,
                                         line_width = line_width,
                                         stroke_color = stroke_color)
+        self.add_node_item('shape', item)
         self.item_hier.append(item)
 
 
@@ -811,6 +1001,7 @@ class GraphvizSvgParser(object):
                                        stroke_color = stroke_color,
                                        line_width = 1)
         self.current_parent().description = 'familynode'
+        self.add_node_item('shape', item)
         self.item_hier.append(item)
 
     def stop_ellipse(self, tag):
@@ -900,6 +1091,7 @@ class GraphvizSvgParser(object):
                                     anchor = self.text_anchor_map[anchor],
                                     use_markup = True,
                                     font = text_font)
+        self.add_node_item('text', item)
 
         # Retain the active person for other use elsewhere
         if self.handle == self.widget.active_person_handle:
@@ -921,6 +1113,7 @@ class GraphvizSvgParser(object):
                                      height = height,
                                      width = width,
                                      pixbuf = pixbuf)
+        self.add_node_item('image', item)
         self.item_hier.append(item)
 
     def stop_image(self, tag):
@@ -959,6 +1152,16 @@ class GraphvizSvgParser(object):
         if self.func:
             self.tlist.append(data)
 
+    def add_node_item(self, kind, item):
+        """
+        Remember the canvas items drawn for each node, so that they can be
+        updated in place.
+        """
+        if self.handle not in self.widget.node_items:
+            self.widget.node_items[self.handle] = {'shape': [], 'text': [],
+                                                   'image': []}
+        self.widget.node_items[self.handle][kind].append(item)
+
     def current_parent(self):
         """
         Returns the Goocanvas object which should be the parent of any new
@@ -987,6 +1190,29 @@ class GraphvizSvgParser(object):
         """
         return self.active_person_item.props.y
 
+#------------------------------------------------------------------------
+#
+# get_label_lines
+#
+#------------------------------------------------------------------------
+def get_label_lines(label):
+    """
+    Split a node label made by DotGenerator into the image it shows, if
+    any, and its lines of text as Graphviz draws them.
+    """
+    if label.startswith('<'):
+        image = None
+        if '<IMG SRC="' in label:
+            image = label.split('<IMG SRC="', 1)[1].split('"', 1)[0]
+        text = label.split('</TR><TR><TD>', 1)[-1]
+        text = text.replace('</TD></TR></TABLE>', '')
+        lines = [line.replace('&#60;', '<').replace('&#62;', '>')
+                 for line in text.split('<BR/>')]
+    else:
+        image = None
+        lines = [line.replace('\\"', '"') for line in label.split('\\n')]
+    return (image, [line for line in lines if line.strip()])
+
 #------------------------------------------------------------------------
 #
 # DotGenerator
@@ -1004,8 +1230,17 @@ class DotGenerator(object):
         self.dbstate = dbstate
         self.database = dbstate.db
         self.dot = StringIO()
+        # what has been added to the graph, to tell whether a new one
+        # needs a new layout
+        self.nodes = {}
+        self.links = set()
+
+        # people and families loaded while building the graph
+        self.persons = {}
+        self.families = {}
 
         self.view = view
+        self.label_cache = view.label_cache
         self.show_images = self.view._config.get(
                                     'interface.graphview-show-images')
         self.show_full_dates = self.view._config.get(
@@ -1088,86 +1323,90 @@ class DotGenerator(object):
         # Close the graphviz dot code with a brace.
         self.write('}\n')
 
-    def find_descendants(self, active_person):
-        "Spider the database from the active person"
-        person = self.database.get_person_from_handle(active_person)
-        person_handles = []
-        self.add_descendant(person, self.descendant_generations, person_handles)
-        return person_handles
-
-    def add_descendant(self, person, num_generations, person_handles):
-        "Include a descendant in the list of people to graph"
-        if not person:
-            return
+    def get_person(self, handle):
+        "Fetch a person, reusing the ones already loaded for this graph"
+        if handle not in self.persons:
+            self.persons[handle] = self.database.get_person_from_handle(handle)
+        return self.persons[handle]
 
-        if num_generations <= 0:
-            return
+    def get_family(self, handle):
+        "Fetch a family, reusing the ones already loaded for this graph"
+        if handle not in self.families:
+            self.families[handle] = self.database.get_family_from_handle(handle)
+        return self.families[handle]
 
-        # Add self
-        if person.handle not in person_handles:
-            person_handles.append(person.handle)
+    def find_descendants(self, active_person):
+        """
+        Spider the database from the active person, a generation at a time.
+        Returns the set of descendants within range along with their
+        spouses.
+        """
+        depth = {}
+        spouses = set()
+        queue = deque([(active_person, self.descendant_generations)])
+        while queue:
+            person_handle, num_generations = queue.popleft()
+            # a person reached by several routes is only followed from the
+            # route with the most generations left to go
+            if num_generations <= depth.get(person_handle, 0):
+                continue
+            person = self.get_person(person_handle)
+            if not person:
+                continue
+            depth[person_handle] = num_generations
 
             for family_handle in person.get_family_handle_list():
-                family = self.database.get_family_from_handle(family_handle)
+                family = self.get_family(family_handle)
 
-                # Add every child recursively
-                for child_ref in family.get_child_ref_list():
-                    self.add_descendant(
-                        self.database.get_person_from_handle(child_ref.ref),
-                        num_generations - 1,
-                        person_handles)
+                # Add every child
+                if num_generations > 1:
+                    for child_ref in family.get_child_ref_list():
+                        queue.append((child_ref.ref, num_generations - 1))
 
                 # Add spouse
-                if person.handle == family.get_father_handle():
+                if person_handle == family.get_father_handle():
                     spouse_handle = family.get_mother_handle()
                 else:
                     spouse_handle = family.get_father_handle()
 
-                if spouse_handle and spouse_handle not in person_handles:
-                    person_handles.append(spouse_handle)
+                if spouse_handle:
+                    spouses.add(spouse_handle)
+        return spouses.union(depth)
 
     def find_ancestors(self, active_person):
-        "Spider the database from the active person"
-        person = self.database.get_person_from_handle(active_person)
-        person_handles = []
-        self.add_ancestor(person, self.ancestor_generations, person_handles)
-        return person_handles
-
-    def add_ancestor(self, person, num_generations, person_handles):
-        "Include an ancestor in the list of people to graph"
-        if not person:
-            return
-
-        if num_generations <= 0:
-            return
-
-        # Add self
-        if person.handle not in person_handles:
-            person_handles.append(person.handle)
-
-            for family_handle in person.get_parent_family_handle_list():
-                family = self.database.get_family_from_handle(family_handle)
-
-                # Add every parent recursively
-                self.add_ancestor(
-                        self.database.get_person_from_handle(family.get_father_handle()),
-                        num_generations - 1,
-                        person_handles)
-                self.add_ancestor(
-                        self.database.get_person_from_handle(family.get_mother_handle()),
-                        num_generations - 1,
-                        person_handles)
+        """
+        Spider the database from the active person, a generation at a time.
+        Returns the set of ancestors within range.
+        """
+        depth = {}
+        queue = deque([(active_person, self.ancestor_generations)])
+        while queue:
+            person_handle, num_generations = queue.popleft()
+            if num_generations <= depth.get(person_handle, 0):
+                continue
+            person = self.get_person(person_handle)
+            if not person:
+                continue
+            depth[person_handle] = num_generations
+
+            if num_generations > 1:
+                for family_handle in person.get_parent_family_handle_list():
+                    family = self.get_family(family_handle)
+
+                    # Add every parent
+                    for parent_handle in (family.get_father_handle(),
+                                          family.get_mother_handle()):
+                        if parent_handle:
+                            queue.append((parent_handle, num_generations - 1))
+        return set(depth)
 
     def add_child_links_to_families(self):
         "returns string of GraphViz edges linking parents to families or \
          children"
-        # Hash people in a dictionary for faster inclusion checking
-        person_dict = dict([handle, 1] for handle in self.person_handles)
-
         for person_handle in self.person_handles:
-            person = self.database.get_person_from_handle(person_handle)
+            person = self.get_person(person_handle)
             for fam_handle in person.get_parent_family_handle_list():
-                family = self.database.get_family_from_handle(fam_handle)
+                family = self.get_family(fam_handle)
                 father_handle = family.get_father_handle()
                 mother_handle = family.get_mother_handle()
                 for child_ref in family.get_child_ref_list():
@@ -1175,15 +1414,15 @@ class DotGenerator(object):
                         frel = child_ref.frel
                         mrel = child_ref.mrel
                         break
-                if ((father_handle and father_handle in person_dict) or
-                    (mother_handle and mother_handle in person_dict)):
+                if ((father_handle and father_handle in self.person_handles) or
+                    (mother_handle and mother_handle in self.person_handles)):
                     # Link to the family node if either parent is in graph
                     self.add_family_link(person_handle, family, frel, mrel)
                 else:
                     # Link to the parents' nodes directly, if they are in graph
-                    if father_handle and father_handle in person_dict:
+                    if father_handle and father_handle in self.person_handles:
                         self.add_parent_link(person_handle, father_handle, frel)
-                    if mother_handle and mother_handle in person_dict:
+                    if mother_handle and mother_handle in self.person_handles:
                         self.add_parent_link(person_handle, mother_handle, mrel)
 
     def add_family_link(self, p_id, family, frel, mrel):
@@ -1215,28 +1454,33 @@ class DotGenerator(object):
         self.is_html_output = False
         url = ""
 
-        # The list of families for which we have output the node,
+        # The families for which we have output the node,
         # so we don't do it twice
-        families_done = {}
-        for person_handle in self.person_handles:
-            self.is_html_output = True
-            person = self.database.get_person_from_handle(person_handle)
-            # Output the person's node
-            label = self.get_person_label(person)
-            (shape, style, color, fill) = self.get_gender_style(person)
-
-            self.add_node(person_handle, label, shape, color, style, fill, url)
-
-            # Output families where person is a parent
-            family_list = person.get_family_handle_list()
-            for fam_handle in family_list:
-                if fam_handle not in families_done:
-                    families_done[fam_handle] = 1
-                    self.__add_family(fam_handle)
+        families_done = set()
+        # __add_family brings in spouses from other marriages, so keep
+        # going until there is nobody left without a node
+        persons_done = set()
+        while len(persons_done) < len(self.person_handles):
+            for person_handle in self.person_handles - persons_done:
+                persons_done.add(person_handle)
+                self.is_html_output = True
+                person = self.get_person(person_handle)
+                # Output the person's node
+                label = self.get_person_label(person)
+                (shape, style, color, fill) = self.get_gender_style(person)
+
+                self.add_node(person_handle, label, shape, color, style, fill, url)
+
+                # Output families where person is a parent
+                family_list = person.get_family_handle_list()
+                for fam_handle in family_list:
+                    if fam_handle not in families_done:
+                        families_done.add(fam_handle)
+                        self.__add_family(fam_handle)
 
     def __add_family(self, fam_handle):
         """Add a node for a family and optionally link the spouses to it"""
-        fam = self.database.get_family_from_handle(fam_handle)
+        fam = self.get_family(fam_handle)
 
         label = ""
         for event_ref in fam.get_event_ref_list():
@@ -1297,6 +1541,21 @@ class DotGenerator(object):
         return(shape, style, color, fill)
 
     def get_person_label(self, person):
+        """
+        return person label string, reusing the one made before if the
+        person has not changed since
+        """
+        change = person.get_change_time()
+        cached = self.label_cache.get(person.handle)
+        if cached and cached[0] == change:
+            return cached[2]
+        label = self.make_person_label(person)
+        media_list = person.get_media_list()
+        media_handle = media_list[0].get_reference_handle() if media_list else None
+        self.label_cache[person.handle] = (change, media_handle, label)
+        return label
+
+    def make_person_label(self, person):
         "return person label string"
         # see if we have an image to use for this person
         image_path = None
@@ -1446,6 +1705,7 @@ class DotGenerator(object):
         to be prefixed with an underscore because Graphviz does not like IDs
         that begin with a number.
         """
+        self.links.add((id1, id2, style))
         self.write('  _%s -> _%s' % (id1, id2))
 
         if style or head or tail:
@@ -1475,6 +1735,7 @@ class DotGenerator(object):
         Gramps handles are used as nodes but need to be prefixed with an
         underscore because Graphviz does not like IDs that begin with a number.
         """
+        self.nodes[node_id] = (label, shape, color, style, fillcolor)
         text = '['
 
         if shape:
@@ -1503,6 +1764,10 @@ class DotGenerator(object):
         text += " ]"
         self.write('  _%s %s;\n' % (node_id, text))
 
+    def get_topology(self):
+        "Returns the nodes and links of the graph, without their labels"
+        return (frozenset(self.nodes), frozenset(self.links))
+
     def start_subgraph(self, graph_id):
         """ Opens a subgraph which is used to keep together related nodes on the graph """
         self.write('  subgraph cluster_%s\n' % graph_id)
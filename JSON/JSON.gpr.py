@@ -2,7 +2,7 @@ register(EXPORT,
          id    = 'JSON Export',
          name  = _('JSON Export'),
          description =  _('This is a JSON export'),
-         version = '1.0.5',
+         version = '1.0.7',
          gramps_target_version = "5.0",
          status = STABLE,
          fname = 'JSONExport.py',
@@ -16,7 +16,7 @@ register(IMPORT,
          id    = 'JSON Import',
          name  = _('JSON Import'),
          description =  _('This is a JSON import'),
-         version = '1.0.5',
+         version = '1.0.6',
          gramps_target_version = "5.0",
          status = STABLE,
          fname = 'JSONImport.py',
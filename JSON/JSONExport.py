@@ -23,7 +23,14 @@
 # Python modules
 #
 #------------------------------------------------------------------------
+import os
 import sys
+import multiprocessing
+from collections import deque
+try:
+    import ujson as json
+except ImportError:
+    import json
 
 #------------------------------------------------------------------------
 #
@@ -36,6 +43,70 @@ from gramps.gen.lib import (Note, Person, Event, Family,
                             Repository, Place, Media,
                             Source, Tag, Citation)
 
+#------------------------------------------------------------------------
+#
+# JSON Lines format: a header line, then one object per line
+#
+#------------------------------------------------------------------------
+JSONL_VERSION = 1
+HEADER = {"_class": "Header", "format": "JSONL", "version": JSONL_VERSION}
+
+# The tables to export, in order, with their object classes:
+CLASSES = [("note_map", Note),
+           ("event_map", Event),
+           ("person_map", Person),
+           ("family_map", Family),
+           ("repository_map", Repository),
+           ("place_map", Place),
+           ("source_map", Source),
+           ("citation_map", Citation),
+           ("media_map", Media),
+           ("tag_map", Tag)]
+CHUNK_SIZE = 500
+
+def read_chunks(database):
+    """
+    Read the raw serialized objects, table by table, in chunks of
+    (table index, [serial, ...]).
+    """
+    for index, (map_name, cls) in enumerate(CLASSES):
+        table = getattr(database, map_name)
+        chunk = []
+        for handle in table.keys():
+            chunk.append(table[handle])
+            if len(chunk) == CHUNK_SIZE:
+                yield (index, chunk)
+                chunk = []
+        if chunk:
+            yield (index, chunk)
+
+def convert_chunk(item):
+    """
+    Turn a chunk of serialized objects into JSON lines. Runs in the worker
+    processes.
+    """
+    index, chunk = item
+    cls = CLASSES[index][1]
+    return (len(chunk),
+            "".join([json.dumps(cls.create(serial).to_struct(),
+                                ensure_ascii=False) + "\n"
+                     for serial in chunk]))
+
+def convert_in_pool(pool, chunks, window):
+    """
+    Convert the chunks in the pool, yielding the results in the order the
+    chunks were read. The chunks are read in this thread, as the database
+    may only be used from the thread that opened it, and at most window
+    chunks are waiting to be written at any time.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(convert_chunk, (chunk,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
 def exportData(database, filename,
                error_dialog=None, option_box=None, callback=None):
     if not callable(callback):
@@ -43,112 +114,29 @@ def exportData(database, filename,
 
     with OpenFileOrStdout(filename, encoding="utf-8") as fp:
 
-        total = (len(database.note_map) +
-                 len(database.person_map) +
-                 len(database.event_map) +
-                 len(database.family_map) +
-                 len(database.repository_map) +
-                 len(database.place_map) +
-                 len(database.media_map) +
-                 len(database.citation_map) +
-                 len(database.source_map) +
-                 len(database.tag_map))
+        total = sum(len(getattr(database, map_name))
+                    for (map_name, cls) in CLASSES)
         count = 0.0
-
-        # ---------------------------------
-        # Notes
-        # ---------------------------------
-        for handle in database.note_map.keys():
-            serial = database.note_map[handle]
-            write_line(fp, Note.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Event
-        # ---------------------------------
-        for handle in database.event_map.keys():
-            serial = database.event_map[handle]
-            write_line(fp, Event.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Person
-        # ---------------------------------
-        for handle in database.person_map.keys():
-            serial = database.person_map[handle]
-            write_line(fp, Person.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Family
-        # ---------------------------------
-        for handle in database.family_map.keys():
-            serial = database.family_map[handle]
-            write_line(fp, Family.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Repository
-        # ---------------------------------
-        for handle in database.repository_map.keys():
-            serial = database.repository_map[handle]
-            write_line(fp, Repository.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Place
-        # ---------------------------------
-        for handle in database.place_map.keys():
-            serial = database.place_map[handle]
-            write_line(fp, Place.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Source
-        # ---------------------------------
-        for handle in database.source_map.keys():
-            serial = database.source_map[handle]
-            write_line(fp, Source.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Citation
-        # ---------------------------------
-        for handle in database.citation_map.keys():
-            serial = database.citation_map[handle]
-            write_line(fp, Citation.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Media
-        # ---------------------------------
-        for handle in database.media_map.keys():
-            serial = database.media_map[handle]
-            write_line(fp, Media.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Tag
-        # ---------------------------------
-        for handle in database.tag_map.keys():
-            serial = database.tag_map[handle]
-            write_line(fp, Tag.create(serial))
-            count += 1
-            callback(100 * count/total)
+        fp.write(json.dumps(HEADER) + "\n")
+
+        # Convert in a process pool when it is worth it; the results are
+        # written in the order the chunks were read, so the output is the
+        # same.
+        processes = os.cpu_count() or 1
+        pool = None
+        if processes > 1 and total > 2 * CHUNK_SIZE:
+            pool = multiprocessing.Pool(processes)
+            results = convert_in_pool(pool, read_chunks(database),
+                                      2 * processes)
+        else:
+            results = map(convert_chunk, read_chunks(database))
+        try:
+            for (size, lines) in results:
+                fp.write(lines)
+                count += size
+                callback(100 * count/total)
+        finally:
+            if pool:
+                pool.terminate()
 
     return True
-
-def write_line(fp, obj):
-    """
-    Write a single object to the file.
-    """
-    fp.write(str(obj.to_struct()) + "\n")
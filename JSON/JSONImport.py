@@ -26,6 +26,9 @@
 #
 #-------------------------------------------------------------------------
 import ast
+import json
+import time
+from itertools import chain, islice
 
 #------------------------------------------------------------------------
 #
@@ -47,41 +50,77 @@ from gramps.gen.plug.utils import OpenFileOrStdin
 from gramps.gen.config import config
 from gramps.gen.lib.struct import Struct
 
+#-------------------------------------------------------------------------
+#
+# JSON Lines format: a header line, then one object per line. Files
+# written before the header was added hold Python reprs instead.
+#
+#-------------------------------------------------------------------------
+JSONL_VERSION = 1
+BATCH_SIZE = 1000
+
+def restore_tuples(struct):
+    """
+    Object hook turning back into tuples the lists that were tuples
+    before going through JSON.
+    """
+    _class = struct.get("_class")
+    if _class == "Date":
+        struct["dateval"] = tuple(struct["dateval"])
+    elif _class == "MediaRef" and struct.get("rect"):
+        struct["rect"] = tuple(struct["rect"])
+    elif _class == "StyledTextTag":
+        struct["ranges"] = [tuple(r) for r in struct["ranges"]]
+    return struct
+
+def parse_json(line):
+    return json.loads(line, object_hook=restore_tuples)
+
 def importData(dbase, filename, user):
     """Function called by Gramps to import data on persons in CSV format."""
+    add = {"Person": dbase.add_person,
+           "Family": dbase.add_family,
+           "Event": dbase.add_event,
+           "Media": dbase.add_media,
+           "Repository": dbase.add_repository,
+           "Tag": dbase.add_tag,
+           "Source": dbase.add_source,
+           "Citation": dbase.add_citation,
+           "Note": dbase.add_note,
+           "Place": dbase.add_place}
+    count = 0
+    start = time.time()
     dbase.disable_signals()
     try:
         with DbTxn(_("JSON import"), dbase, batch=True) as trans:
             with OpenFileOrStdin(filename, encoding="utf-8") as fp:
-                line = fp.readline()
-                while line:
-                    json = ast.literal_eval(line)
-                    obj = Struct.instance_from_struct(json)
-                    if json["_class"] == "Person":
-                        dbase.add_person(obj, trans)
-                    elif json["_class"] == "Family":
-                        dbase.add_family(obj, trans)
-                    elif json["_class"] == "Event":
-                        dbase.add_event(obj, trans)
-                    elif json["_class"] == "Media":
-                        dbase.add_media(obj, trans)
-                    elif json["_class"] == "Repository":
-                        dbase.add_repository(obj, trans)
-                    elif json["_class"] == "Tag":
-                        dbase.add_tag(obj, trans)
-                    elif json["_class"] == "Source":
-                        dbase.add_source(obj, trans)
-                    elif json["_class"] == "Citation":
-                        dbase.add_citation(obj, trans)
-                    elif json["_class"] == "Note":
-                        dbase.add_note(obj, trans)
-                    elif json["_class"] == "Place":
-                        dbase.add_place(obj, trans)
-                    else:
-                        LOG.warn("ignored: " + json)
-                    line = fp.readline()
+                first = fp.readline()
+                parse = ast.literal_eval
+                lines = chain([first], fp)
+                if first.startswith('{"'):
+                    parse = parse_json
+                    header = parse_json(first)
+                    if header.get("_class") == "Header":
+                        if header.get("version", 0) > JSONL_VERSION:
+                            LOG.warning("JSON file version %s is newer than %s",
+                                        header.get("version"), JSONL_VERSION)
+                        lines = fp
+                while True:
+                    chunk = list(islice(lines, BATCH_SIZE))
+                    if not chunk:
+                        break
+                    for struct in [parse(line) for line in chunk if line.strip()]:
+                        if struct["_class"] in add:
+                            obj = Struct.instance_from_struct(struct)
+                            add[struct["_class"]](obj, trans)
+                            count += 1
+                        else:
+                            LOG.warning("ignored: %s", struct["_class"])
     except EnvironmentError as err:
         user.notify_error(_("%s could not be opened\n") % filename, str(err))
 
     dbase.enable_signals()
     dbase.request_rebuild()
+    elapsed = time.time() - start
+    LOG.info("Imported %d objects in %.1f seconds (%d objects/second)",
+             count, elapsed, count / elapsed if elapsed else 0)
@@ -0,0 +1,85 @@
+"""
+Time the JSON import of a generated file, in JSON Lines and in the older
+format of Python reprs, and print the objects imported per second.
+
+Run with Gramps on the path, e.g.:
+
+    python JSON/benchmark_import.py 100000
+"""
+import os
+import sys
+import time
+import json
+import tempfile
+
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Person, Name, Surname, Event, EventRef, Date
+from gramps.cli.user import User
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from JSONImport import importData as importJSON, JSONL_VERSION
+
+HEADER = {"_class": "Header", "format": "JSONL", "version": JSONL_VERSION}
+
+def make_structs(count):
+    """
+    Generate the structs of count objects: people, each with a birth
+    event.
+    """
+    for i in range(count // 2):
+        event = Event()
+        event.set_handle("E%07d" % i)
+        event.set_gramps_id("E%07d" % i)
+        event.set_date_object(Date(1800 + i % 200, 1 + i % 12, 1 + i % 28))
+        yield event.to_struct()
+        ref = EventRef()
+        ref.set_reference_handle(event.get_handle())
+        person = Person()
+        person.set_handle("P%07d" % i)
+        person.set_gramps_id("I%07d" % i)
+        name = Name()
+        name.set_first_name("Given%d" % i)
+        surname = Surname()
+        surname.set_surname("Surname%d" % (i % 1000))
+        name.add_surname(surname)
+        person.set_primary_name(name)
+        person.add_event_ref(ref)
+        person.set_birth_ref(ref)
+        yield person.to_struct()
+
+def make_files(jsonl_filename, repr_filename, count):
+    """
+    Write the same objects in both formats.
+    """
+    with open(jsonl_filename, "w", encoding="utf-8") as jsonl_file, \
+         open(repr_filename, "w", encoding="utf-8") as repr_file:
+        jsonl_file.write(json.dumps(HEADER) + "\n")
+        for struct in make_structs(count):
+            jsonl_file.write(json.dumps(struct, ensure_ascii=False) + "\n")
+            repr_file.write(str(struct) + "\n")
+
+def time_import(filename, path):
+    database = DbState().make_database("bsddb")
+    os.mkdir(path)
+    database.write_version(path)
+    database.load(path)
+    start = time.time()
+    importJSON(database, filename, User())
+    elapsed = time.time() - start
+    count = (database.get_number_of_people() +
+             database.get_number_of_events())
+    database.close()
+    return count, elapsed
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tmpdir = tempfile.mkdtemp()
+    jsonl_filename = os.path.join(tmpdir, "benchmark.json")
+    repr_filename = os.path.join(tmpdir, "benchmark_repr.json")
+    make_files(jsonl_filename, repr_filename, count)
+    for (label, filename, path) in [
+            ("JSON Lines", jsonl_filename, os.path.join(tmpdir, "jsonl")),
+            ("repr", repr_filename, os.path.join(tmpdir, "repr"))]:
+        imported, elapsed = time_import(filename, path)
+        print("%s import of %d objects: %.1f seconds, %d objects/second" %
+              (label, imported, elapsed, imported / elapsed))
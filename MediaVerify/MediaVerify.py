@@ -28,7 +28,12 @@
 #-------------------------------------------------------------------------
 import os
 import io
+import json
+import time
 import hashlib
+from functools import partial
+from concurrent.futures import (ThreadPoolExecutor, wait, FIRST_COMPLETED,
+                                ALL_COMPLETED)
 
 #-------------------------------------------------------------------------
 #
@@ -52,6 +57,7 @@ from gramps.gui.dialog import WarningDialog
 from gramps.gui.editors import EditMedia
 from gramps.gen.errors import WindowActiveError
 from gramps.gen.constfunc import conv_to_unicode
+from gramps.gen.const import HOME_DIR
 
 #------------------------------------------------------------------------
 #
@@ -65,6 +71,109 @@ except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
+#-------------------------------------------------------------------------
+#
+# Constants
+#
+#-------------------------------------------------------------------------
+CHUNK_SIZE = 1024 * 1024
+HASH_THREADS = 4
+CACHE_FILE = os.path.join(HOME_DIR, 'mediaverify_cache.json')
+CACHE_SAVE_INTERVAL = 60 # seconds
+
+#-------------------------------------------------------------------------
+#
+# Hashing
+#
+#-------------------------------------------------------------------------
+def md5_file(full_path):
+    """
+    Return the md5 hash of a file, reading it in chunks.
+    """
+    md5 = hashlib.md5()
+    with io.open(full_path, 'rb') as media_file:
+        for chunk in iter(partial(media_file.read, CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def scan_files(top):
+    """
+    Generate the paths of the files in a directory tree, in a single walk.
+    Like os.walk, symbolic links to directories are not followed and
+    directories that cannot be read are skipped.
+    """
+    dirs = [top]
+    while dirs:
+        try:
+            entries = list(os.scandir(dirs.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():
+                    dirs.append(entry.path)
+            else:
+                yield entry.path
+
+class HashCache(object):
+    """
+    A persistent cache of md5 hashes, keyed by the path, size and
+    modification time of each file.
+
+    New hashes are saved every CACHE_SAVE_INTERVAL seconds, so that an
+    interrupted run can carry on from where it stopped.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.hashes = {}
+        self.changed = 0
+        self.saved = time.time()
+        try:
+            with io.open(filename, 'r', encoding='utf-8') as cache_file:
+                self.hashes = json.load(cache_file)
+        except (IOError, ValueError):
+            pass
+
+    def lookup(self, full_path, stat):
+        """
+        Return the cached hash of a file, or None if the file is not in the
+        cache or has changed since it was hashed.
+        """
+        entry = self.hashes.get(full_path)
+        if (entry and entry[0] == stat.st_size and
+                entry[1] == stat.st_mtime_ns):
+            return entry[2]
+        return None
+
+    def store(self, full_path, stat, md5sum):
+        """
+        Add the hash of a file to the cache.
+        """
+        self.hashes[full_path] = [stat.st_size, stat.st_mtime_ns, md5sum]
+        self.changed += 1
+        if time.time() - self.saved >= CACHE_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        Write the cache to disk, if it has changed.
+        """
+        if not self.changed:
+            return
+        temp_name = self.filename + '.temp'
+        try:
+            with io.open(temp_name, 'w', encoding='utf-8') as cache_file:
+                cache_file.write(json.dumps(self.hashes))
+            os.replace(temp_name, self.filename)
+        except IOError:
+            return
+        self.changed = 0
+        self.saved = time.time()
+
 #-------------------------------------------------------------------------
 #
 # Media Verify
@@ -81,6 +190,7 @@ class MediaVerify(tool.Tool, ManagedWindow):
 
         self.dbstate = dbstate
         self.moved_files = []
+        self.cache = HashCache(CACHE_FILE)
         self.titles = [_('Moved/Renamed Files'), _('Missing Files'),
                        _('Duplicate Files'), _('Extra Files'),
                        _('No md5 Generated'), _('Errors')]
@@ -247,6 +357,55 @@ class MediaVerify(tool.Tool, ManagedWindow):
         for model in self.models:
             model.clear()
 
+    def hash_files(self, paths):
+        """
+        Generate (full_path, md5sum, error) for each of the given files.
+        Hashes are taken from the cache where possible, and the other files
+        are hashed in a pool of threads, so the results are not in the order
+        of the given paths.
+        """
+        pool = ThreadPoolExecutor(max_workers=HASH_THREADS)
+        pending = {}
+        try:
+            for full_path in paths:
+                try:
+                    stat = os.stat(full_path)
+                except IOError as err:
+                    yield full_path, None, err
+                    continue
+                md5sum = self.cache.lookup(full_path, stat)
+                if md5sum is not None:
+                    yield full_path, md5sum, None
+                    continue
+                future = pool.submit(md5_file, full_path)
+                pending[future] = (full_path, stat)
+                if len(pending) >= HASH_THREADS * 4:
+                    for result in self.hash_results(pending, FIRST_COMPLETED):
+                        yield result
+            for result in self.hash_results(pending, ALL_COMPLETED):
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+            self.cache.save()
+
+    def hash_results(self, pending, return_when):
+        """
+        Wait for the hashing jobs, and generate the results of those that
+        have finished.
+        """
+        done = wait(pending, return_when=return_when)[0]
+        for future in done:
+            full_path, stat = pending.pop(future)
+            try:
+                md5sum = future.result()
+            except IOError as err:
+                yield full_path, None, err
+                continue
+            self.cache.store(full_path, stat, md5sum)
+            yield full_path, md5sum, None
+
     def generate_md5(self, button):
         """
         Generate md5 hashes for media files.
@@ -256,26 +415,28 @@ class MediaVerify(tool.Tool, ManagedWindow):
         progress = ProgressMeter(self.window_name, can_cancel=True,
                                  parent=self.window)
 
-        length = self.db.get_number_of_media()
-        progress.set_pass(_('Generating media hashes'), length)
+        media_files = {}
+        for handle in self.db.get_media_handles():
+            media = self.db.get_media_from_handle(handle)
+            full_path = media_path_full(self.db, media.get_path())
+            media_files.setdefault(full_path, []).append(handle)
 
-        with DbTxn(_("Set media hashes"), self.db, batch=True) as trans:
+        progress.set_pass(_('Generating media hashes'), len(media_files))
 
-            for handle in self.db.get_media_handles():
-                media = self.db.get_media_from_handle(handle)
+        with DbTxn(_("Set media hashes"), self.db, batch=True) as trans:
 
-                full_path = media_path_full(self.db, media.get_path())
-                try:
-                    with io.open(full_path, 'rb') as media_file:
-                        md5sum = hashlib.md5(media_file.read()).hexdigest()
-                except IOError as err:
+            for full_path, md5sum, err in self.hash_files(media_files):
+                if err:
                     error_msg = '%s: %s' % (err.strerror, full_path)
                     self.models[5].append((error_msg, None))
                     progress.step()
                     continue
 
-                media.set_checksum(md5sum)
-                self.db.commit_media(media, trans)
+                for handle in media_files[full_path]:
+                    media = self.db.get_media_from_handle(handle)
+                    if media.get_checksum() != md5sum:
+                        media.set_checksum(md5sum)
+                        self.db.commit_media(media, trans)
 
                 progress.step()
                 if progress.get_cancelled():
@@ -304,44 +465,38 @@ class MediaVerify(tool.Tool, ManagedWindow):
         progress = ProgressMeter(self.window_name, can_cancel=True,
                                  parent=self.window)
 
-        length = 0
-        for root, dirs, files in os.walk(media_path):
-            length += len(files)
-        progress.set_pass(_('Finding files'), length)
+        # The files are hashed as they are found, so their number is not
+        # known in advance
+        progress.set_pass(_('Finding files'), mode=ProgressMeter.MODE_ACTIVITY)
 
         all_files = {}
-        for root, dirs, files in os.walk(media_path):
-            for file_name in files:
-                full_path = os.path.join(root, file_name)
-                try:
-                    with io.open(full_path, 'rb') as media_file:
-                        md5sum = hashlib.md5(media_file.read()).hexdigest()
-                except IOError as err:
-                    error_msg = '%s: %s' % (err.strerror, full_path)
-                    self.models[5].append((error_msg, None))
-                    progress.step()
-                    continue
+        for full_path, md5sum, err in self.hash_files(scan_files(media_path)):
+            if err:
+                error_msg = '%s: %s' % (err.strerror, full_path)
+                self.models[5].append((error_msg, None))
+                progress.step()
+                continue
 
-                rel_path = relative_path(full_path, media_path)
-                if md5sum in all_files:
-                    all_files[md5sum].append(rel_path)
-                else:
-                    all_files[md5sum] = [rel_path]
+            rel_path = relative_path(full_path, media_path)
+            if md5sum in all_files:
+                all_files[md5sum].append(rel_path)
+            else:
+                all_files[md5sum] = [rel_path]
 
-                progress.step()
-                if progress.get_cancelled():
-                    break
+            progress.step()
+            if progress.get_cancelled():
+                break
 
         length = self.db.get_number_of_media()
         progress.set_pass(_('Checking paths'), length)
 
-        in_gramps = []
+        in_gramps = set()
         for handle in self.db.get_media_handles():
             handle = handle.decode('utf-8')
             media = self.db.get_media_from_handle(handle)
 
             md5sum = media.get_checksum()
-            in_gramps.append(md5sum)
+            in_gramps.add(md5sum)
 
             # Moved files
             gramps_path = media.get_path()
@@ -0,0 +1,109 @@
+"""
+Time the Media Verify tool on a generated media directory.
+
+Run with Gramps on the path, e.g.:
+
+    python MediaVerify/benchmark_verify.py 100000
+
+The tool is run twice: the first run hashes every file, the second finds
+the hashes in the cache. To compare with another version of the tool,
+give the directory holding its MediaVerify.py, e.g. a git worktree:
+
+    python MediaVerify/benchmark_verify.py 100000 /tmp/old/MediaVerify
+"""
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import importlib.util
+
+from gramps.gen.dbstate import DbState
+from gramps.gen.db import DbTxn
+from gramps.gen.lib import Media
+
+class Progress(object):
+    """
+    Stands for the progress window, which needs a display.
+    """
+    MODE_ACTIVITY = 1
+    def __init__(self, *args, **kwargs):
+        pass
+    def set_pass(self, *args, **kwargs):
+        pass
+    def step(self):
+        pass
+    def get_cancelled(self):
+        return False
+    def close(self):
+        pass
+
+def load_tool(directory):
+    """
+    Load MediaVerify.py from the given directory.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "MediaVerify", os.path.join(directory, "MediaVerify.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.ProgressMeter = Progress
+    return module
+
+def make_media(database, media_path, count):
+    """
+    Write count small files in 500 directories, with a media object for
+    nine files in ten. One file in twenty has the same contents as another
+    one, and one media object in seven has an old path.
+    """
+    with DbTxn("Add media", database, batch=True) as trans:
+        for i in range(count):
+            path = os.path.join("d%03d" % (i % 500), "f%d.jpg" % i)
+            full_path = os.path.join(media_path, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            data = b"%d" % (i % (count - count // 20)) * 10
+            with open(full_path, "wb") as media_file:
+                media_file.write(data)
+            if i % 10 == 9:
+                continue
+            media = Media()
+            media.set_path(path if i % 7 else os.path.join("old", path))
+            media.set_mime_type("image/jpeg")
+            media.set_checksum(hashlib.md5(data).hexdigest())
+            database.add_media(media, trans)
+    database.set_mediapath(media_path)
+
+def time_verify(module, database, cache_file):
+    """
+    Run the tool's verification without its window, and return the time it
+    took and the number of rows in each of its lists.
+    """
+    tool = module.MediaVerify.__new__(module.MediaVerify)
+    tool.db = database
+    tool.window = None
+    tool.window_name = "Media Verify Tool"
+    tool.models = [[] for i in range(6)]
+    tool.show_tabs = lambda: None
+    if hasattr(module, "HashCache"):
+        tool.cache = module.HashCache(cache_file)
+    start = time.time()
+    tool.verify_media(None)
+    return time.time() - start, [len(model) for model in tool.models]
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = (sys.argv[2] if len(sys.argv) > 2 else
+                 os.path.dirname(os.path.abspath(__file__)))
+    module = load_tool(directory)
+    tmpdir = tempfile.mkdtemp()
+    database = DbState().make_database("bsddb")
+    path = os.path.join(tmpdir, "tree")
+    os.mkdir(path)
+    database.write_version(path)
+    database.load(path)
+    make_media(database, os.path.join(tmpdir, "media"), count)
+    cache_file = os.path.join(tmpdir, "mediaverify_cache.json")
+    for run in ["first", "second"]:
+        seconds, rows = time_verify(module, database, cache_file)
+        print("%s run on %d files: %.1f seconds, rows %s" %
+              (run, count, seconds, rows))
+    database.close()
@@ -0,0 +1,157 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2011 Nick Hall
+#           (C) 2011 Doug Blank <doug.blank@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+# $Id: $
+
+"""Tools/Utilities/Batch Face Detection"""
+
+#-------------------------------------------------------------------------
+#
+# Standard python modules
+#
+#-------------------------------------------------------------------------
+
+import sys
+import os
+import multiprocessing
+
+#-------------------------------------------------------------------------
+#
+# Gramps modules
+#
+#-------------------------------------------------------------------------
+
+from gramps.gui.plug import tool
+from gramps.gui.utils import ProgressMeter
+from gramps.gui.dialog import WarningDialog
+from gramps.gen.utils.file import media_path_full
+from gramps.gen.config import config
+
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+try:
+    _ = glocale.get_addon_translator(__file__).gettext
+except ValueError:
+    _ = glocale.translation.gettext
+
+#-------------------------------------------------------------------------
+#
+# face detection module
+#
+#-------------------------------------------------------------------------
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+import facedetection
+
+#-------------------------------------------------------------------------
+#
+# configuration
+#
+#-------------------------------------------------------------------------
+
+# The minimum face size is set in the Photo Tagging gramplet, whose settings
+# are used if it has been loaded
+GRAMPLET_CONFIG_NAME = "phototagginggramplet"
+if config.has_manager(GRAMPLET_CONFIG_NAME):
+    CONFIG = config.get_manager(GRAMPLET_CONFIG_NAME)
+else:
+    CONFIG = config.register_manager(GRAMPLET_CONFIG_NAME)
+    CONFIG.register("detection.box_size", (50,50))
+    CONFIG.load()
+
+#-------------------------------------------------------------------------
+#
+# Face Detection Tool
+#
+#-------------------------------------------------------------------------
+
+class FaceDetectionTool(tool.Tool):
+    """
+    Find the faces in all of the images, and keep them in the face cache used
+    by the Photo Tagging and Face Detection gramplets.
+    """
+    def __init__(self, dbstate, user, options_class, name, callback=None):
+        uistate = user.uistate
+
+        tool.Tool.__init__(self, dbstate, options_class, name)
+
+        self.db = dbstate.db
+        if not facedetection.computer_vision_available:
+            WarningDialog(_('Batch Face Detection'),
+                          _('The OpenCV python module is required.'))
+            return
+
+        min_face_size = tuple(CONFIG.get("detection.box_size"))
+        cache = facedetection.get_cache()
+
+        progress = ProgressMeter(_('Batch Face Detection'), can_cancel=True)
+
+        length = self.db.get_number_of_media()
+        progress.set_pass(_('Finding images'), length)
+        jobs = {}
+        for media in self.db.iter_media():
+            full_path = media_path_full(self.db, media.get_path())
+            if (media.get_mime_type().startswith('image/') and
+                    os.path.isfile(full_path)):
+                checksum = facedetection.media_checksum(full_path,
+                                                        media.get_checksum())
+                if (checksum and checksum not in jobs and
+                        cache.lookup(checksum, min_face_size) is None):
+                    jobs[checksum] = (checksum, full_path, min_face_size)
+            progress.step()
+            if progress.get_cancelled():
+                progress.close()
+                return
+
+        progress.set_pass(_('Detecting faces'), len(jobs))
+
+        # Each worker process loads the classifier once
+        processes = os.cpu_count() or 1
+        pool = None
+        if processes > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(facedetection.detect_job,
+                                          jobs.values())
+        else:
+            results = map(facedetection.detect_job, jobs.values())
+        try:
+            for (checksum, faces) in results:
+                if faces is not None:
+                    cache.store(checksum, min_face_size, faces)
+                progress.step()
+                if progress.get_cancelled():
+                    break
+        finally:
+            if pool:
+                pool.terminate()
+            cache.save()
+
+        progress.close()
+
+#------------------------------------------------------------------------
+#
+# Face Detection Tool Options
+#
+#------------------------------------------------------------------------
+class FaceDetectionToolOptions(tool.ToolOptions):
+    """
+    Defines options and provides handling interface.
+    """
+    def __init__(self, name, person_id=None):
+        tool.ToolOptions.__init__(self, name, person_id)
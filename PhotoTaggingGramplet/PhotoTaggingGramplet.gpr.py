@@ -2,7 +2,7 @@ register(GRAMPLET,
          id="Photo Tagging",
          name=_("Photo Tagging"),
          description = _("Gramplet for tagging people in photos"),
-         version = '1.0.13',
+         version = '1.0.16',
          gramps_target_version="5.0",
          status = STABLE,
          fname="PhotoTaggingGramplet.py",
@@ -11,3 +11,17 @@ register(GRAMPLET,
          gramplet_title=_("Photo Tagging"),
          navtypes=["Media"],
          )
+
+register(TOOL,
+         id="batchfacedetection",
+         name=_("Batch Face Detection"),
+         description = _("Find the faces in all images, for the Photo Tagging gramplet"),
+         version = '1.0.16',
+         gramps_target_version="5.0",
+         status = STABLE,
+         fname="FaceDetectionTool.py",
+         category = TOOL_UTILS,
+         toolclass = 'FaceDetectionTool',
+         optionclass = 'FaceDetectionToolOptions',
+         tool_modes = [TOOL_MODE_GUI],
+         )
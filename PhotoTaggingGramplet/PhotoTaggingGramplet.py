@@ -724,8 +724,9 @@ class PhotoTaggingGramplet(Gramplet):
         self.uistate.push_message(self.dbstate, _("Detecting faces..."))
         media = self.get_current_object()
         image_path = media_path_full(self.dbstate.db, media.get_path())
-        faces = facedetection.detect_faces(image_path, MIN_FACE_SIZE)
-        for ((x, y, width, height), neighbors) in faces:
+        faces = facedetection.find_faces(image_path, media.get_checksum(),
+                                         MIN_FACE_SIZE)
+        for (x, y, width, height) in faces:
             region = Region(x - DETECTED_REGION_PADDING,
                             y - DETECTED_REGION_PADDING,
                             x + width + DETECTED_REGION_PADDING,
@@ -28,6 +28,11 @@
 #-------------------------------------------------------------------------
 
 import os
+import io
+import json
+import time
+import hashlib
+from functools import partial
 
 #-------------------------------------------------------------------------
 #
@@ -41,6 +46,14 @@ try:
 except ImportError:
     computer_vision_available = False
 
+#-------------------------------------------------------------------------
+#
+# Gramps modules
+#
+#-------------------------------------------------------------------------
+
+from gramps.gen.const import HOME_DIR
+
 #-------------------------------------------------------------------------
 #
 # constants
@@ -50,20 +63,173 @@ except ImportError:
 path, filename = os.path.split(__file__)
 HAARCASCADE_PATH = os.path.join(path, 'haarcascade_frontalface_alt.xml')
 
+# Faces found in each image, by media checksum.  Also read by the Face
+# Detection gramplet.
+CACHE_PATH = os.path.join(HOME_DIR, 'facedetection_cache.json')
+CACHE_SAVE_INTERVAL = 60 # seconds
+
+# Images are scaled down to this size (in pixels) before detection
+MAX_IMAGE_SIZE = 1024
+
+CHUNK_SIZE = 1024 * 1024
+
 #-------------------------------------------------------------------------
 #
 # face detection functions
 #
 #-------------------------------------------------------------------------
 
+_classifier = None
+
+def get_classifier():
+    """
+    Return the face classifier, loading it the first time it is used.
+    """
+    global _classifier
+    if _classifier is None:
+        _classifier = cv2.CascadeClassifier(HAARCASCADE_PATH)
+    return _classifier
+
 def detect_faces(image_path, min_face_size):
+    """
+    Return the (x, y, width, height) rectangles of the faces in an image,
+    in pixels of the full size image, or None if the image can't be read.
+    Large images are scaled down to MAX_IMAGE_SIZE first, which makes
+    detection much faster.
+    """
     cv_image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    o_width, o_height = cv_image.shape[0], cv_image.shape[1]
+    if cv_image is None:
+        return None
+    height, width = cv_image.shape[:2]
+    scale = min(1.0, float(MAX_IMAGE_SIZE) / max(width, height))
+    if scale < 1.0:
+        cv_image = cv2.resize(cv_image,
+                              (int(width * scale), int(height * scale)),
+                              interpolation=cv2.INTER_AREA)
     cv2.equalizeHist(cv_image, cv_image)
-    cascade = cv2.CascadeClassifier(HAARCASCADE_PATH)
-    # ???
-    faces = cv2.HaarDetectObjects(cv_image, cascade,
-                                 cv2.CreateMemStorage(0),
-                                 1.2, 2, cv2.CV_HAAR_DO_CANNY_PRUNING,
-                                 min_face_size)
+    min_size = (max(1, int(min_face_size[0] * scale)),
+                max(1, int(min_face_size[1] * scale)))
+    faces = get_classifier().detectMultiScale(cv_image, 1.2, 2,
+                                              cv2.CASCADE_DO_CANNY_PRUNING,
+                                              min_size)
+    return [tuple(int(round(value / scale)) for value in face)
+            for face in faces]
+
+def detect_job(job):
+    """
+    Detect the faces in an image, for a pool of worker processes.
+    Each process loads the classifier once.
+    """
+    checksum, image_path, min_face_size = job
+    try:
+        faces = detect_faces(image_path, min_face_size)
+    except cv2.error:
+        faces = None
+    return checksum, faces
+
+def media_checksum(full_path, checksum):
+    """
+    Return the checksum of a media object, or the md5 hash of its file if the
+    checksum has not been generated.
+    """
+    if checksum:
+        return checksum
+    md5 = hashlib.md5()
+    try:
+        with io.open(full_path, 'rb') as media_file:
+            for chunk in iter(partial(media_file.read, CHUNK_SIZE), b''):
+                md5.update(chunk)
+    except IOError:
+        return None
+    return md5.hexdigest()
+
+def find_faces(image_path, checksum, min_face_size):
+    """
+    Return the faces in an image, from the cache if they have already been
+    found.  An image that can't be read has no faces, but is not cached as
+    such, since its file may be restored.
+    """
+    cache = get_cache()
+    checksum = media_checksum(image_path, checksum)
+    faces = cache.lookup(checksum, min_face_size)
+    if faces is None:
+        faces = detect_faces(image_path, min_face_size)
+        if faces is None:
+            return []
+        if checksum:
+            cache.store(checksum, min_face_size, faces)
+            cache.save()
     return faces
+
+#-------------------------------------------------------------------------
+#
+# face cache
+#
+#-------------------------------------------------------------------------
+
+_cache = None
+
+def get_cache():
+    """
+    Return the face cache, loading it the first time it is used.
+    """
+    global _cache
+    if _cache is None:
+        _cache = FaceCache(CACHE_PATH)
+    return _cache
+
+class FaceCache(object):
+    """
+    A persistent cache of the faces found in images, keyed by the checksum of
+    the media object.  Only the face rectangles are kept, not the people
+    they have been assigned to.
+
+    New faces are saved every CACHE_SAVE_INTERVAL seconds, so that an
+    interrupted batch can carry on from where it stopped.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.faces = {}
+        self.changed = 0
+        self.saved = time.time()
+        try:
+            with io.open(filename, 'r', encoding='utf-8') as cache_file:
+                self.faces = json.load(cache_file)
+        except (IOError, ValueError):
+            pass
+
+    def lookup(self, checksum, min_face_size):
+        """
+        Return the faces found in an image, or None if the image has not been
+        searched with the given minimum face size.
+        """
+        entry = self.faces.get(checksum)
+        if entry and entry['min_size'] == list(min_face_size):
+            return [tuple(face) for face in entry['faces']]
+        return None
+
+    def store(self, checksum, min_face_size, faces):
+        """
+        Add the faces found in an image to the cache.
+        """
+        self.faces[checksum] = {'min_size': list(min_face_size),
+                                'faces': [list(face) for face in faces]}
+        self.changed += 1
+        if time.time() - self.saved >= CACHE_SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        Write the cache to disk, if it has changed.
+        """
+        if not self.changed:
+            return
+        temp_name = self.filename + '.temp'
+        try:
+            with io.open(temp_name, 'w', encoding='utf-8') as cache_file:
+                cache_file.write(json.dumps(self.faces))
+            os.replace(temp_name, self.filename)
+        except IOError:
+            return
+        self.changed = 0
+        self.saved = time.time()
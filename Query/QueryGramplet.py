@@ -22,6 +22,7 @@
 # $Id$
 
 #import os
+import itertools
 
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 try:
@@ -37,6 +38,8 @@ from gramps.gui.plug.quick import run_quick_report_by_name
 from gramps.gen.plug import Gramplet
 import gramps.gen
 
+from QueryQuickview import DBI, TABLES
+
 #------------------------------------------------------------------------
 #
 # Gramplet class
@@ -174,18 +177,96 @@ class PythonGramplet(Gramplet):
         return False
 
 class QueryGramplet(PythonGramplet):
+    """
+    Runs the queries typed in, and shows their results a page at a time in
+    the Query quick view; an empty line shows the next page. A query is
+    stopped when the database is edited, as its next rows could be wrong.
+    """
+    PAGE_SIZE = 50
+
     def init(self):
         self.prompt = "$"
+        self.dbi = None
+        self.cursor = None
+        self.query = None
+        self.first = 1
+        self.fetching = False
+        self.interrupted = False
         self.set_tooltip(_("Enter SQL query"))
         # GUI setup:
         self.gui.textview.set_editable(True)
         self.set_text("Structured Query Language\n%s " % self.prompt)
         self.gui.textview.connect('key-press-event', self.on_key_press)
 
+    def db_changed(self):
+        self.close_cursor()
+        for table in TABLES:
+            for action in ["add", "update", "delete"]:
+                self.connect(self.dbstate.db, "%s-%s" % (table, action),
+                             self.db_edited)
+
+    def db_edited(self, *args):
+        # An UPDATE or DELETE query edits the database while its rows are
+        # being fetched
+        if not self.fetching and self.cursor is not None:
+            self.close_cursor()
+            self.interrupted = True
+
+    def close_cursor(self):
+        """
+        Stop the query being shown.
+        """
+        if self.cursor is not None:
+            self.cursor.close()
+        self.dbi = None
+        self.cursor = None
+
     def process_command(self, command):
-        retval = run_quick_report_by_name(self.gui.dbstate,
-                                          self.gui.uistate,
-                                          'Query Quickview',
-                                          command)
-        return retval
+        if not command.strip():
+            return self.next_page()
+        self.close_cursor()
+        self.interrupted = False
+        self.dbi = DBI(self.gui.dbstate.db)
+        try:
+            self.dbi.parse(command)
+        except AttributeError as msg:
+            self.dbi = None
+            return msg
+        if self.dbi.explain:
+            return self.dbi.explain_plan()
+        self.cursor = self.dbi.execute()
+        self.query = command
+        self.first = 1
+        return self.next_page()
 
+    def next_page(self):
+        """
+        Fetch the next page of rows from the query being run, and show them
+        in the Query quick view.
+        """
+        if self.cursor is None:
+            if self.interrupted:
+                self.interrupted = False
+                return _("The database was edited; run the query again "
+                         "for the next rows")
+            return None
+        dbi = self.dbi
+        self.fetching = True
+        try:
+            rows = list(itertools.islice(self.cursor, self.PAGE_SIZE))
+        except AttributeError as msg:
+            self.close_cursor()
+            return str(msg)
+        finally:
+            self.fetching = False
+        if rows:
+            run_quick_report_by_name(self.gui.dbstate, self.gui.uistate,
+                                     'Query Quickview', self.query,
+                                     dbi=dbi, rows=rows, first=self.first)
+            self.first += len(rows)
+        if len(rows) == self.PAGE_SIZE:
+            return _("(press Enter for more rows)")
+        self.close_cursor()
+        if dbi.dry_run:
+            return _("%d rows would be changed (dry run)") % dbi.select
+        return _("%d rows") % dbi.select
@@ -60,6 +60,423 @@ import re
 import traceback
 import itertools
 import time
+import ast
+import operator
+import heapq
+
+# table: (class name, SimpleAccess method for a full scan)
+TABLES = {
+    "person": ("Person", "all_people"),
+    "family": ("Family", "all_families"),
+    "event": ("Event", "all_events"),
+    "source": ("Source", "all_sources"),
+    "tag": ("Tag", "all_tags"),
+    "citation": ("Citation", "all_citations"),
+    "media": ("Media", "all_media"),
+    "place": ("Place", "all_places"),
+    "repository": ("Repository", "all_repositories"),
+    "note": ("Note", "all_notes"),
+}
+
+# Position of the change time in the serialized (raw) data of each table:
+CHANGE_INDEX = {
+    "person": 17,
+    "family": 12,
+    "event": 10,
+    "source": 8,
+    "tag": 4,
+    "citation": 9,
+    "media": 9,
+    "place": 15,
+    "repository": 7,
+    "note": 5,
+}
+
+SURNAME = "primary_name.surname_list[0].surname"
+
+def raw_surname(data):
+    """
+    primary_name.surname_list[0].surname from raw person data.
+    """
+    surname_list = data[3][5]
+    return surname_list[0][0] if surname_list else None
+
+def raw_surname_test(test, value):
+    """
+    Return a test of raw person data comparing the surname with value.
+    People without a surname, or with a surname that can't be compared
+    with value, don't pass: the WHERE clause would fail on them.
+    """
+    def surname_test(data):
+        surname = raw_surname(data)
+        if surname is None:
+            return False
+        try:
+            return test(surname, value)
+        except TypeError:
+            return False
+    return surname_test
+
+OPERATORS = {
+    ast.Eq: (operator.eq, "=="),
+    ast.NotEq: (operator.ne, "!="),
+    ast.Lt: (operator.lt, "<"),
+    ast.LtE: (operator.le, "<="),
+    ast.Gt: (operator.gt, ">"),
+    ast.GtE: (operator.ge, ">="),
+}
+
+# The operator to use when the literal is on the left: 5 < change
+MIRRORED = {
+    ast.Eq: ast.Eq,
+    ast.NotEq: ast.NotEq,
+    ast.Lt: ast.Gt,
+    ast.LtE: ast.GtE,
+    ast.Gt: ast.Lt,
+    ast.GtE: ast.LtE,
+}
+
+def path_of(node):
+    """
+    Return the dotted path of an expression such as
+    primary_name.surname_list[0].surname, or None if it is something else.
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        path = path_of(node.value)
+        if path is not None:
+            return "%s.%s" % (path, node.attr)
+    elif isinstance(node, ast.Subscript):
+        path = path_of(node.value)
+        index = node.slice
+        if hasattr(ast, "Index") and isinstance(index, ast.Index):
+            index = index.value
+        try:
+            index = ast.literal_eval(index)
+        except ValueError:
+            return None
+        if path is not None and isinstance(index, int):
+            return "%s[%d]" % (path, index)
+    return None
+
+def find_predicates(node):
+    """
+    Yield (path, op, value) for each simple comparison of a path with a
+    literal that must hold for the whole expression to be true; that is,
+    the expression itself or a term of a top-level "and".
+    """
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        for value in node.values:
+            for predicate in find_predicates(value):
+                yield predicate
+    elif (isinstance(node, ast.Compare) and len(node.ops) == 1 and
+          type(node.ops[0]) in OPERATORS):
+        op = type(node.ops[0])
+        left, right = node.left, node.comparators[0]
+        for (path_node, value_node, path_op) in [(left, right, op),
+                                                 (right, left, MIRRORED[op])]:
+            path = path_of(path_node)
+            if path is None:
+                continue
+            try:
+                value = ast.literal_eval(value_node)
+            except ValueError:
+                continue
+            yield (path, path_op, value)
+            break
+
+# Layouts of the serialized data of gramps.gen.lib classes, by class name:
+LAYOUTS = {}
+SCALAR = "scalar"
+
+def get_layout(class_name):
+    """
+    Return {field: (position, kind)} describing the serialized data of a
+    gramps.gen.lib class, or None if it can't be worked out. The kind is
+    SCALAR for a plain value, a class name for an object, [class name]
+    for a list of objects, or None for anything else (handles, lists of
+    handles, ...), which is left to Struct.
+    """
+    if class_name not in LAYOUTS:
+        LAYOUTS[class_name] = make_layout(class_name)
+    return LAYOUTS[class_name]
+
+def make_layout(class_name):
+    """
+    Work out the layout of a class from an empty instance. The position
+    of each field in the serialized data is found by changing that field
+    alone and seeing which position of serialize() changes, since the
+    order of to_struct() need not follow serialize(). Fields that can't
+    be found this way are left to Struct.
+    """
+    cls = getattr(gramps.gen.lib, class_name, None)
+    try:
+        obj = cls()
+        data = obj.serialize()
+        struct = obj.to_struct()
+    except Exception:
+        return None
+    if not isinstance(data, (tuple, list)):
+        return None
+    try:
+        schema = cls.get_schema()
+    except Exception:
+        schema = {}
+    layout = {}
+    positions = set()
+    for field in struct:
+        if field == "_class":
+            continue
+        value = struct[field]
+        element = schema.get(field)
+        if not (isinstance(element, list) and len(element) == 1 and
+                isinstance(element[0], type) and
+                hasattr(gramps.gen.lib, element[0].__name__)):
+            element = None
+        position = find_position(cls, field, data, element)
+        if position is None or position in positions:
+            layout[field] = (None, None)
+            continue
+        positions.add(position)
+        if field.endswith("handle"):
+            kind = None
+        elif type(value) in (str, int, float, bool):
+            kind = SCALAR
+        elif (isinstance(value, dict) and "_class" in value and
+              isinstance(data[position], (tuple, list))):
+            kind = value["_class"]
+        elif isinstance(value, list) and element is not None:
+            kind = [element[0].__name__]
+        else:
+            kind = None
+        layout[field] = (position, kind)
+    return layout
+
+def find_position(cls, field, data, element):
+    """
+    Return the position of a field in the serialized data of an empty
+    instance of a class, or None if it can't be found.
+    """
+    for value in changed_values(getattr(cls(), field, None), element):
+        obj = cls()
+        try:
+            setattr(obj, field, value)
+            changed = [position for (position, (old, new))
+                       in enumerate(zip(data, obj.serialize()))
+                       if old != new]
+        except Exception:
+            continue
+        if len(changed) == 1:
+            return changed[0]
+    return None
+
+def changed_values(value, element):
+    """
+    Yield values that differ from the given value of a field, and are of
+    a type that the field can hold.
+    """
+    if value is None:
+        yield "?"
+    elif isinstance(value, bool):
+        yield not value
+    elif isinstance(value, (int, float)):
+        yield value + 1
+    elif isinstance(value, str):
+        yield value + "?"
+    elif isinstance(value, list):
+        if element is not None:
+            yield [element[0]()]
+        yield ["?"]
+    elif hasattr(value, "serialize"):
+        # change one of the values in the serialized data of the object
+        data = value.serialize()
+        for (position, item) in enumerate(data):
+            for new_item in changed_values(item, None):
+                obj = value.__class__()
+                try:
+                    obj.unserialize(tuple(data[:position]) + (new_item,) +
+                                    tuple(data[position + 1:]))
+                    if obj.serialize() != data:
+                        yield obj
+                except Exception:
+                    pass
+
+def lazy_value(value, kind, database):
+    """
+    Wrap a value of the serialized data according to its kind.
+    """
+    if kind == SCALAR:
+        return value
+    elif isinstance(kind, list):
+        return LazyList(value, kind[0], database)
+    layout = get_layout(kind)
+    if layout is None:
+        obj = getattr(gramps.gen.lib, kind)()
+        obj.unserialize(value)
+        return Struct(obj.to_struct(), database)
+    return LazyStruct(value, kind, layout, database)
+
+def as_struct(lazy):
+    """
+    The Struct that a LazyStruct or LazyList stands for.
+    """
+    return Struct(lazy.struct, lazy.db)
+
+class LazyBase(object):
+    """
+    Compares, tests membership and iterates like the Struct it stands for.
+    """
+    def __eq__(self, other):
+        return as_struct(self) == other
+
+    def __ne__(self, other):
+        return as_struct(self) != other
+
+    def __lt__(self, other):
+        return as_struct(self) < other
+
+    def __le__(self, other):
+        return as_struct(self) <= other
+
+    def __gt__(self, other):
+        return as_struct(self) > other
+
+    def __ge__(self, other):
+        return as_struct(self) >= other
+
+    def __len__(self):
+        return len(as_struct(self))
+
+    def __contains__(self, item):
+        return item in as_struct(self)
+
+    def __iter__(self):
+        return iter(as_struct(self))
+
+    def __str__(self):
+        return str(self.struct)
+
+class LazyStruct(LazyBase):
+    """
+    Stands for a Struct over the serialized data of an object, decoding
+    only the fields that are looked up. The full struct is only built
+    when it is needed, for instance to display the whole object.
+    """
+    def __init__(self, data, class_name, layout, database):
+        self.data = data
+        self.class_name = class_name
+        self.layout = layout
+        self.db = database
+        self._struct = None
+
+    @property
+    def struct(self):
+        if self._struct is None:
+            obj = getattr(gramps.gen.lib, self.class_name)()
+            obj.unserialize(self.data)
+            self._struct = obj.to_struct()
+        return self._struct
+
+    def __getitem__(self, key):
+        if key not in self.layout:
+            raise KeyError(key)
+        position, kind = self.layout[key]
+        if kind is not None:
+            return lazy_value(self.data[position], kind, self.db)
+        return as_struct(self)[key]
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        if attr in self.layout:
+            position, kind = self.layout[attr]
+            if kind is not None:
+                return lazy_value(self.data[position], kind, self.db)
+        return getattr(as_struct(self), attr)
+
+class LazyList(LazyBase):
+    """
+    Stands for a Struct over a serialized list of objects.
+    """
+    def __init__(self, data, class_name, database):
+        self.data = data
+        self.class_name = class_name
+        self.db = database
+        self._struct = None
+
+    @property
+    def struct(self):
+        if self._struct is None:
+            self._struct = [item.struct for item in self]
+        return self._struct
+
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            return lazy_value(self.data[index], self.class_name, self.db)
+        return as_struct(self)[index]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        for value in self.data:
+            yield lazy_value(value, self.class_name, self.db)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(as_struct(self), attr)
+
+class SortKey(object):
+    """
+    A sort key for values of any type: None sorts last, and values that
+    can't be compared sort by their string form.
+    """
+    def __init__(self, value, reverse):
+        self.value = value
+        self.reverse = reverse
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        if self.value is None or other.value is None:
+            return other.value is None and self.value is not None
+        first, second = self.value, other.value
+        if self.reverse:
+            first, second = second, first
+        try:
+            return first < second
+        except TypeError:
+            return str(first) < str(second)
+
+class Row(object):
+    """
+    An object of the queried table. When read from the serialized data,
+    the object itself is only created if it is needed.
+    """
+    def __init__(self, class_name, handle, data=None, obj=None):
+        self.class_name = class_name
+        self.handle = handle
+        self.data = data
+        self.obj = obj
+
+    def get_object(self):
+        if self.obj is None:
+            self.obj = getattr(gramps.gen.lib, self.class_name).create(self.data)
+        return self.obj
+
+    def get_struct(self, database, lazy):
+        """
+        A LazyStruct over the serialized data if lazy and possible,
+        otherwise a Struct of the whole object.
+        """
+        if lazy and self.data is not None:
+            layout = get_layout(self.class_name)
+            if layout is not None:
+                return LazyStruct(self.data, self.class_name, layout, database)
+        return Struct(self.get_object().to_struct(), database)
 
 class Environment(dict):
     """
@@ -70,6 +487,7 @@ class Environment(dict):
     def __init__(self, *args, **kwargs):
         """ Initialize environment as a regular dict """
         dict.__init__(self, *args, **kwargs)
+        self.row = None
 
     def __getitem__(self, key):
         """
@@ -79,7 +497,9 @@ class Environment(dict):
         try:
             return self.struct[key]
         except:
-            if key in self:
+            if key == "object" and self.row is not None:
+                return self.row.get_object()
+            elif key in self:
                 return dict.__getitem__(self, key)
             else:
                 raise NameError("name '%s' is not defined" % key)
@@ -90,6 +510,12 @@ class Environment(dict):
         """
         self.struct = struct
 
+    def set_row(self, row):
+        """
+        Set the Row whose object is "object" in the Environment.
+        """
+        self.row = row
+
 class DBI(object):
     """
     The SQL-like interface to the database and document instances.
@@ -101,6 +527,7 @@ class DBI(object):
         self.select = 0
         self.flat = False
         self.raw = False
+        self.lazy = False
         if self.database:
             for name in self.database.get_table_names():
                 d = self.database._tables[name]["class_func"]().to_struct()
@@ -126,6 +553,126 @@ class DBI(object):
                 self.columns.extend(self.get_columns(self.table))
                 # otherwise remove metadata:
                 #self.columns.extend([col for col in self.get_columns(self.table) if not col.startswith("_"))
+        self.compile()
+        self.plan = self.choose_plan()
+
+    def compile_expression(self, expression):
+        """
+        Compile an expression once for all the rows; None if it is not
+        valid Python, which (as before) gives no value for any row.
+        """
+        try:
+            return compile(expression, expression, "eval")
+        except SyntaxError:
+            return None
+
+    def compile(self):
+        """
+        Compile the columns, the WHERE clause and the SET values.
+        """
+        self.code_columns = [self.compile_expression(col)
+                             for col in self.columns]
+        if self.where:
+            self.code_where = self.compile_expression(self.where)
+        else:
+            self.code_where = None
+        self.code_values = [self.compile_expression(value)
+                            for value in self.values]
+        self.code_order = [(self.compile_expression(expression), reverse)
+                           for (expression, reverse) in self.order]
+
+    def choose_plan(self):
+        """
+        Decide how to find the candidate rows, from the WHERE clause:
+
+        * ("gramps_id", value) or ("handle", value): an index lookup
+        * ("raw", description, test): a scan of the serialized data, only
+          creating the objects for which test(data) is true
+        * ("scan",): a scan of all the objects
+
+        The whole WHERE clause is still evaluated on every candidate.
+        """
+        if self.where is None or self.table not in TABLES:
+            return ("scan",)
+        try:
+            tree = ast.parse(self.where.strip(), mode="eval")
+        except SyntaxError:
+            return ("scan",)
+        predicates = list(find_predicates(tree.body))
+        for (path, op, value) in predicates:
+            if op is ast.Eq and isinstance(value, str):
+                if path == "gramps_id" and self.table != "tag":
+                    return ("gramps_id", value)
+                elif path == "handle":
+                    return ("handle", value)
+        for (path, op, value) in predicates:
+            test, symbol = OPERATORS[op]
+            description = "%s %s %r" % (path, symbol, value)
+            if path == "change" and isinstance(value, int):
+                index = CHANGE_INDEX[self.table]
+                return ("raw", description,
+                        lambda data: test(data[index], value))
+            elif path == SURNAME and self.table == "person":
+                return ("raw", description, raw_surname_test(test, value))
+        return ("scan",)
+
+    def explain_plan(self):
+        """
+        Describe the plan chosen for the query.
+        """
+        if self.plan[0] in ["gramps_id", "handle"]:
+            retval = _("lookup of %(table)s by %(index)s %(value)r") % {
+                "table": self.table, "index": self.plan[0],
+                "value": self.plan[1]}
+        elif self.plan[0] == "raw":
+            retval = _("scan of raw %(table)s data where %(test)s") % {
+                "table": self.table, "test": self.plan[1]}
+        else:
+            retval = _("scan of all %(table)s objects") % {
+                "table": self.table}
+        if self.where:
+            retval += _(", then WHERE %s") % self.where.strip()
+        if self.order:
+            retval += _(", ORDER BY %s") % ", ".join(
+                expression + (" DESC" if reverse else "")
+                for (expression, reverse) in self.order)
+            if self.limit:
+                retval += _(" (keeping the best %d rows)") % self.limit[1]
+        if self.limit:
+            retval += _(", LIMIT %d, %d") % self.limit
+        return retval + "\n"
+
+    def get_items(self):
+        """
+        Return an iterator over the candidate Rows, following the plan.
+        """
+        class_name, all_method = TABLES[self.table]
+        if self.plan[0] in ["gramps_id", "handle"]:
+            find = getattr(self.database,
+                           "get_%s_from_%s" % (self.table, self.plan[0]))
+            try:
+                obj = find(self.plan[1])
+            except Exception:
+                obj = None
+            if obj is None:
+                return iter([])
+            return iter([Row(class_name, obj.handle, obj=obj)])
+        elif self.plan[0] == "raw":
+            return self.iter_raw(class_name, self.plan[2])
+        elif self.lazy:
+            return self.iter_raw(class_name, lambda data: True)
+        return (Row(class_name, obj.handle, obj=obj)
+                for obj in getattr(self.sdb, all_method)() if obj is not None)
+
+    def iter_raw(self, class_name, test):
+        """
+        Yield Rows for the serialized data passing test.
+        """
+        get_raw = getattr(self.database, "get_raw_%s_data" % self.table)
+        for handle in getattr(self.database, "iter_%s_handles" % self.table)():
+            data = get_raw(handle)
+            if data is not None and test(data):
+                yield Row(class_name, handle, data=data)
 
     def lexer(self, string):
         """
@@ -227,6 +774,9 @@ class DBI(object):
         self.aliases = {}
         self.limit = None
         self.where = None
+        self.order = []
+        self.explain = False
+        self.dry_run = False
         self.index = 0
         while self.index < len(lex):
             symbol = lex[self.index]
@@ -285,6 +835,22 @@ class DBI(object):
                 else:
                     self.limit = (0, int(number))
                     self.index -= 1
+            elif symbol.upper() == "ORDER":
+                # order by expr [desc], expr [asc], ...
+                self.index += 1 # BY
+                while True:
+                    self.index += 1
+                    expression = lex[self.index]
+                    reverse = False
+                    if (self.index + 1 < len(lex) and
+                        lex[self.index + 1].upper() in ["ASC", "DESC"]):
+                        self.index += 1
+                        reverse = lex[self.index].upper() == "DESC"
+                    self.order.append((expression, reverse))
+                    if self.index + 1 < len(lex) and lex[self.index + 1] == ",":
+                        self.index += 1
+                    else:
+                        break
             elif symbol.upper() == "WHERE":
                 # how can we get all of Python expressions?
                 # this assumes all by ;
@@ -306,6 +872,14 @@ class DBI(object):
                 self.raw = True
             elif symbol.upper() == "NORAW":
                 self.raw = False
+            elif symbol.upper() == "LAZY":
+                self.lazy = True
+            elif symbol.upper() == "NOLAZY":
+                self.lazy = False
+            elif symbol.upper() == "EXPLAIN":
+                self.explain = True
+            elif symbol.upper() == "DRYRUN":
+                self.dry_run = True
             else:
                 raise AttributeError("invalid SQL expression: '... %s ...'" % symbol)
             self.index += 1
@@ -335,13 +909,17 @@ class DBI(object):
         self.select = 0
         start_time = time.time()
         class Table():
-            results = []
+            def __init__(self):
+                self.results = []
             def row(self, *args, **kwargs):
                 self.results.append([args, kwargs])
             def get_rows(self):
                 return [list(item[0]) for item in self.results]
         table = Table()
         self.sdb = SimpleAccess(self.database)
+        if self.explain:
+            print(self.explain_plan())
+            return table
         self.process_table(table) # a class that has .row(1, 2, 3, ...)
         print(_("%d rows processed in %s seconds.\n") % (self.select, time.time() - start_time))
         return table
@@ -351,6 +929,8 @@ class DBI(object):
         Execute the query.
         """
         self.sdb = SimpleAccess(self.database)
+        if self.explain:
+            return self.explain_plan()
         self.stab = QuickTable(self.sdb)
         self.select = 0
         start_time = time.time()
@@ -363,8 +943,30 @@ class DBI(object):
             self.sdoc.paragraph("%d rows processed in %s seconds.\n" % (self.select, time.time() - start_time))
             self.stab.write(self.sdoc)
             self.sdoc.paragraph("")
+        if self.dry_run:
+            return _("%d rows would be changed (dry run).\n") % self.select
         return _("%d rows processed in %s seconds.\n") % (self.select, time.time() - start_time)
 
+    def write_page(self, document, rows, first):
+        """
+        Write a page of result rows, as (cells, link) pairs from execute(),
+        in a table whose rows link to their objects.
+        """
+        stab = QuickTable(SimpleAccess(self.database))
+        for (cells, link) in rows:
+            if link:
+                stab.row(*cells, link=link)
+            else:
+                stab.row(*cells)
+        stab.columns(*self.clean_titles(self.columns))
+        sdoc = SimpleDoc(document)
+        sdoc.title(self.query_text)
+        sdoc.paragraph("\n")
+        sdoc.paragraph(_("Rows %(first)d to %(last)d.\n") %
+                       {"first": first, "last": first + len(rows) - 1})
+        stab.write(sdoc)
+        sdoc.paragraph("")
+
     def get_columns(self, table):
         """
         Get the columns for the given table.
@@ -383,28 +985,11 @@ class DBI(object):
         # 'Person', 'Family', 'Source', 'Citation', 'Event', 'Media',
         # 'Place', 'Repository', 'Note', 'Tag'
         # table: a class that has .row(1, 2, 3, ...)
-        if self.table == "person":
-            self.do_query(self.sdb.all_people(), table)
-        elif self.table == "family":
-            self.do_query(self.sdb.all_families(), table)
-        elif self.table == "event":
-            self.do_query(self.sdb.all_events(), table)
-        elif self.table == "source":
-            self.do_query(self.sdb.all_sources(), table)
-        elif self.table == "tag":
-            self.do_query(self.sdb.all_tags(), table)
-        elif self.table == "citation":
-            self.do_query(self.sdb.all_citations(), table)
-        elif self.table == "media":
-            self.do_query(self.sdb.all_media(), table)
-        elif self.table == "place":
-            self.do_query(self.sdb.all_places(), table)
-        elif self.table == "repository":
-            self.do_query(self.sdb.all_repositories(), table)
-        elif self.table == "note":
-            self.do_query(self.sdb.all_notes(), table)
-        else:
-            raise AttributeError("no such table: '%s'" % self.table)
+        for (cells, link) in self.execute():
+            if link:
+                table.row(*cells, link=link)
+            else:
+                table.row(*cells)
 
     def get_tag(self, name):
         tag = self.database.get_tag_from_name(name)
@@ -441,7 +1026,7 @@ class DBI(object):
         """
         if self.raw:
             return value
-        if isinstance(value, Struct):
+        if isinstance(value, (Struct, LazyStruct, LazyList)):
             return self.stringify(value.struct)
         elif isinstance(value, (list, tuple)):
             if len(value) == 0 and not self.flat:
@@ -470,95 +1055,213 @@ class DBI(object):
                 retval.append(self.stringify(values[i]))
         return retval
 
-    def do_query(self, items, table):
+    def execute(self):
         """
-        Perform the query on the items in the named table.
+        Run the parsed query, returning an iterator over the result rows,
+        each a (cells, link) pair. Rows are made while the table is being
+        scanned, so nothing is held in memory; a LIMIT stops the scan, and
+        an ORDER BY with a LIMIT only keeps the best rows, in a heap.
         """
-        # table: a class that has .row(1, 2, 3, ...)
-        with self.database.get_transaction_class()("QueryQuickview", self.database, batch=True) as trans:
-            ROWNUM = 0
-            env = self.make_env()
-            for item in items:
-                if item is None:
-                    continue
-                row = []
-                row_env = []
-                # "col[0]" in WHERE clause will return first column of selection:
-                env["col"] = row_env
-                env["ROWNUM"] = ROWNUM
-                env["object"] = item
-                struct = Struct(item.to_struct(), self.database)
-                env.set_struct(struct)
-                for col in self.columns:
-                    try:
-                        value = eval(col, env)
-                    except:
-                        value = None
-                    row.append(value)
-                    # allow col[#] reference:
-                    row_env.append(value)
-                    # an alias?
-                    if col in self.aliases:
-                        env[self.aliases[col]] = value
-                # Should we include this row?
-                if self.where:
-                    try:
-                        result = eval(self.where, env)
-                    except:
+        if self.table not in TABLES:
+            raise AttributeError("no such table: '%s'" % self.table)
+        if self.action not in ["SELECT", "UPDATE", "DELETE"]:
+            raise AttributeError("unknown command: '%s'" % self.action)
+        if self.order and self.action != "SELECT":
+            raise AttributeError("ORDER BY only works with SELECT")
+        self.sdb = SimpleAccess(self.database)
+        matches = self.match(self.get_items())
+        if self.order:
+            matches = self.sort(matches)
+        if self.action == "SELECT":
+            for (item, row, struct, env, key) in matches:
+                for result in self.output(item, row):
+                    yield result
+            return
+        # UPDATE and DELETE: find all the rows first, then change them
+        # together, unless this is a dry run
+        results = []
+        changes = []
+        for (item, row, struct, env, key) in matches:
+            values = []
+            if self.action == "UPDATE" and not self.dry_run:
+                values = [eval(code, env) for code in self.code_values]
+            changes.append((item.handle, values))
+            self.select += 1
+            if self.action == "UPDATE":
+                results.append((self.clean(row, self.columns),
+                                (item.class_name, item.handle)))
+            else:
+                results.append((self.clean(row, self.columns), None))
+        if not self.dry_run:
+            self.apply(changes)
+        for result in results:
+            yield result
+
+    def apply(self, changes):
+        """
+        Carry out an UPDATE or DELETE on the (handle, values) changes, in
+        a single batch transaction with the signals off.
+        """
+        if not changes:
+            return
+        get_object = getattr(self.database, "get_%s_from_handle" % self.table)
+        self.database.disable_signals()
+        try:
+            with self.database.get_transaction_class()("QueryQuickview", self.database, batch=True) as trans:
+                for (handle, values) in changes:
+                    obj = get_object(handle)
+                    if obj is None:
                         continue
+                    if self.action == "UPDATE":
+                        # update table set col=val, col=val where expr;
+                        struct = Struct(obj.to_struct(), self.database)
+                        for i in range(len(self.setcolumns)):
+                            struct.setitem(self.setcolumns[i], values[i], trans=trans)
+                    elif self.action == "DELETE":
+                        self.database.remove_instance(obj, trans)
+        finally:
+            self.database.enable_signals()
+            self.database.request_rebuild()
+
+    def match(self, items):
+        """
+        Evaluate the columns and WHERE clause on the items, and yield
+        (item, row, struct, env, sort key) for the items that match,
+        within the LIMIT unless the rows are to be sorted.
+        """
+        limit = None if self.order else self.limit
+        ROWNUM = 0
+        env = self.make_env()
+        for item in items:
+            if item is None:
+                continue
+            row = []
+            row_env = []
+            # "col[0]" in WHERE clause will return first column of selection:
+            env["col"] = row_env
+            env["ROWNUM"] = ROWNUM
+            env.set_row(item)
+            struct = item.get_struct(self.database, self.lazy)
+            env.set_struct(struct)
+            for col, code in zip(self.columns, self.code_columns):
+                try:
+                    value = eval(code, env)
+                except:
+                    value = None
+                row.append(value)
+                # allow col[#] reference:
+                row_env.append(value)
+                # an alias?
+                if col in self.aliases:
+                    env[self.aliases[col]] = value
+            # Should we include this row?
+            if self.where:
+                try:
+                    result = eval(self.code_where, env)
+                except:
+                    continue
+            else:
+                if self.action in ["DELETE", "UPDATE"]:
+                    result = True
                 else:
-                    if self.action in ["DELETE", "UPDATE"]:
-                        result = True
-                    else:
-                        result = any([col != None for col in row]) # are they all None?
-                # If result, then append the row
-                if result:
-                    if (self.limit is None) or (self.limit[0] <= ROWNUM < self.limit[1]):
-                        if self.action == "SELECT":
-                            if not self.flat:
-                                # Join by rows:
-                                products = []
-                                columns = []
-                                count = 0
-                                for col in row:
-                                    if ((isinstance(col, Struct) and isinstance(col.struct, list) and len(col.struct) > 0) or
-                                        (isinstance(col, list) and len(col) > 0)):
-                                        products.append(col)
-                                        columns.append(count)
-                                    count += 1
-                                if len(products) > 0:
-                                    current = self.clean(row, self.columns)
-                                    for items in itertools.product(*products):
-                                        for i in range(len(items)):
-                                            current[columns[i]] = self.stringify(items[i])
-                                        table.row(*current, link=(item.__class__.__name__, item.handle))
-                                        self.select += 1
-                                else:
-                                    table.row(*self.clean(row, self.columns), link=(item.__class__.__name__, item.handle))
-                                    self.select += 1
-                            else:
-                                table.row(*self.clean(row, self.columns), link=(item.__class__.__name__, item.handle))
-                                self.select += 1
-                        elif self.action == "UPDATE":
-                            # update table set col=val, col=val where expr;
-                            table.row(*self.clean(row, self.columns), link=(item.__class__.__name__, item.handle))
-                            self.select += 1
-                            for i in range(len(self.setcolumns)):
-                                struct.setitem(self.setcolumns[i], eval(self.values[i], env), trans=trans)
-                        elif self.action == "DELETE":
-                            table.row(*self.clean(row, self.columns))
-                            self.select += 1
-                            self.database.remove_instance(item, trans)
-                        else:
-                            raise AttributeError("unknown command: '%s'", self.action)
-                    ROWNUM += 1
-                    if (self.limit is not None) and (ROWNUM >= self.limit[1]):
-                        break
+                    result = any([col != None for col in row]) # are they all None?
+            # If result, then pass the row on
+            if result:
+                if (limit is None) or (limit[0] <= ROWNUM < limit[1]):
+                    key = None
+                    if self.order:
+                        key = tuple(SortKey(self.eval_code(code, env), reverse)
+                                    for (code, reverse) in self.code_order)
+                    yield (item, row, struct, env, key)
+                ROWNUM += 1
+                if (limit is not None) and (ROWNUM >= limit[1]):
+                    break
+
+    def eval_code(self, code, env):
+        try:
+            return eval(code, env)
+        except:
+            return None
+
+    def sort(self, matches):
+        """
+        Sort the matches on their keys, applying the LIMIT.
+        """
+        if self.limit is None:
+            return iter(sorted(matches, key=operator.itemgetter(4)))
+        best = heapq.nsmallest(self.limit[1], matches,
+                               key=operator.itemgetter(4))
+        return iter(best[self.limit[0]:])
+
+    def output(self, item, row):
+        """
+        Yield the result rows of a SELECT for a matching item.
+        """
+        link = (item.class_name, item.handle)
+        if not self.flat:
+            # Join by rows:
+            products = []
+            columns = []
+            count = 0
+            for col in row:
+                if ((isinstance(col, Struct) and isinstance(col.struct, list) and len(col.struct) > 0) or
+                    (isinstance(col, LazyList) and len(col) > 0) or
+                    (isinstance(col, list) and len(col) > 0)):
+                    products.append(col)
+                    columns.append(count)
+                count += 1
+            if len(products) > 0:
+                current = self.clean(row, self.columns)
+                for items in itertools.product(*products):
+                    for i in range(len(items)):
+                        current[columns[i]] = self.stringify(items[i])
+                    self.select += 1
+                    yield (list(current), link)
+            else:
+                self.select += 1
+                yield (self.clean(row, self.columns), link)
+        else:
+            self.select += 1
+            yield (self.clean(row, self.columns), link)
+
+def benchmark(database, query):
+    """
+    Run a SELECT with the Struct and the LazyStruct rows, and return the
+    time and peak memory each took. For example, from the Python Gramplet:
+
+        benchmark(db, "select gramps_id, SURNAME from person")
+    """
+    import tracemalloc
+    class Counter():
+        count = 0
+        def row(self, *args, **kwargs):
+            self.count += 1
+    retval = ""
+    for lazy in [False, True]:
+        dbi = DBI(database)
+        dbi.parse(query)
+        dbi.lazy = lazy
+        dbi.sdb = SimpleAccess(database)
+        counter = Counter()
+        tracemalloc.start()
+        start_time = time.time()
+        dbi.process_table(counter)
+        seconds = time.time() - start_time
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        retval += "%s: %d rows in %.2f seconds, peak memory %.1f MB\n" % (
+            "LazyStruct" if lazy else "Struct", counter.count, seconds,
+            peak / (1024 * 1024))
+    return retval
 
-def run(database, document, query):
+def run(database, document, query, dbi=None, rows=None, first=1):
     """
-    Run the query
+    Run the query; or, from the Query gramplet, show a page of the rows
+    of the query being run by dbi, starting at row number first.
     """
+    if rows is not None:
+        dbi.write_page(document, rows, first)
+        return None
     retval = ""
     dbi = DBI(database, document)
     try:
@@ -0,0 +1,76 @@
+from gramps.gen.dbstate import DbState
+from gramps.gen.db import DbTxn
+from gramps.gen.lib import Person
+from gramps.plugins.importer.importxml import importData as importXML
+from gramps.cli.user import User
+
+from ..QueryQuickview import DBI
+
+import unittest
+import os
+
+dbstate = DbState()
+gramps_path = os.environ["GRAMPS_RESOURCES"]
+
+class LazyQueryTestCase (unittest.TestCase):
+
+    def setUp(self):
+        self.database = dbstate.make_database("bsddb")
+        try:
+            os.mkdir("/tmp/bsddb_query")
+        except:
+            pass
+        self.database.write_version("/tmp/bsddb_query")
+        self.database.load("/tmp/bsddb_query")
+        importXML(self.database, gramps_path + "/example/gramps/example.gramps", User())
+
+    def tearDown(self):
+        self.database.close()
+
+    def run_query(self, query, lazy):
+        dbi = DBI(self.database)
+        dbi.parse(query)
+        dbi.lazy = lazy
+        return list(dbi.execute())
+
+    def assert_same_results(self, query):
+        results = self.run_query(query, False)
+        self.assertTrue(results)
+        self.assertEqual(self.run_query(query, True), results)
+
+    def test_surname(self):
+        self.assert_same_results(
+            "select gramps_id, SURNAME from person "
+            "where 'Gar' in primary_name.surname_list[0].surname")
+
+    def test_name(self):
+        self.assert_same_results(
+            "select gramps_id, primary_name.first_name, SURNAME from person "
+            "where primary_name.first_name.startswith('L') and "
+            "len(primary_name.surname_list) == 1")
+
+    def test_surname_list(self):
+        self.assert_same_results(
+            "select gramps_id, SURNAME from person "
+            "where primary_name.surname_list[0] == "
+            "primary_name.surname_list[-1]")
+
+    def test_surname_compare(self):
+        # A person without a surname is skipped, not an error
+        person = Person()
+        person.set_gramps_id("I9999")
+        person.get_primary_name().set_first_name("Nobody")
+        person.get_primary_name().set_surname_list([])
+        with DbTxn("Add person", self.database) as trans:
+            self.database.add_person(person, trans)
+        dbi = DBI(self.database)
+        dbi.parse("select gramps_id, SURNAME from person where SURNAME < 'C'")
+        self.assertEqual(dbi.plan[0], "raw")
+        results = list(dbi.execute())
+        self.assertTrue(results)
+        for (cells, link) in results:
+            self.assertNotEqual(cells[0], "I9999")
+            self.assertLess(cells[1], "C")
+
+if __name__ == "__main__":
+    unittest.main()
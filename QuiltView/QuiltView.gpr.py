@@ -23,7 +23,7 @@ id = 'QuiltView',
 name = _('Quilt Chart'),
 category = ('Ancestry', _('Charts')),
 description =  _('The view shows a quilt chart visualisation of a family tree'),
-version = '1.0',
+version = '1.0.3',
 gramps_target_version = '5.0',
 status = STABLE,
 fname = 'QuiltView.py',
@@ -25,7 +25,8 @@
 #
 #-------------------------------------------------------------------------
 import math
-from time import clock
+import logging
+from time import perf_counter
 
 #------------------------------------------------------------------------
 #
@@ -48,6 +49,7 @@ _ = _trans.gettext
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import Pango, PangoCairo
+from gi.repository import GLib
 
 #-------------------------------------------------------------------------
 #
@@ -64,8 +66,54 @@ from gramps.gui.views.bookmarks import PersonBookmarks
 from gramps.gen.const import CUSTOM_FILTERS
 from gramps.gui.dialog import RunDatabaseRepair, ErrorDialog
 
+LOG = logging.getLogger(".QuiltView")
+
 BORDER = 10
 HEIGHT = 18
+# size of the cells of the spatial index
+GRID = 256
+# how long to gather database changes before applying them, in ms
+COALESCE = 200
+
+class GridIndex(object):
+    """
+    Spatial index of rectangles, kept in the cells of a grid that each
+    rectangle overlaps.
+    """
+    def __init__(self, width=GRID, height=GRID):
+        self.width = width
+        self.height = height
+        self.cells = {}
+
+    def get_cells(self, x1, y1, x2, y2):
+        for i in range(int(x1 // self.width), int(x2 // self.width) + 1):
+            for j in range(int(y1 // self.height), int(y2 // self.height) + 1):
+                yield (i, j)
+
+    def insert(self, obj, x1, y1, x2, y2):
+        entry = (x1, y1, x2, y2, obj)
+        for cell in self.get_cells(x1, y1, x2, y2):
+            if cell in self.cells:
+                self.cells[cell].append(entry)
+            else:
+                self.cells[cell] = [entry]
+
+    def query(self, x1, y1, x2, y2):
+        """
+        Return the objects with a rectangle overlapping the given one.
+        """
+        found = set()
+        for cell in self.get_cells(x1, y1, x2, y2):
+            for (ex1, ey1, ex2, ey2, obj) in self.cells.get(cell, []):
+                if ex1 <= x2 and x1 <= ex2 and ey1 <= y2 and y1 <= ey2:
+                    found.add(obj)
+        return found
+
+    def at(self, x, y):
+        """
+        Return the objects with a rectangle holding the point.
+        """
+        return self.query(x, y, x, y)
 
 class Node(object):
     def __init__(self, handle, layer):
@@ -75,6 +123,7 @@ class Node(object):
         self.y = None
         self.width = 18
         self.height = 18
+        self.measured = False
 
     def set_position(self, x, y):
         self.x = x
@@ -104,7 +153,7 @@ class PersonNode(Node):
     def add_family(self, family):
         self.children.append(family)
 
-    def draw(self, canvas, cr):
+    def get_label(self):
         if self.sex == Person.MALE:
             label = '\u2642 ' + self.name
             bg_color = (0.72, 0.81, 0.90)
@@ -114,12 +163,24 @@ class PersonNode(Node):
         else:
             label = '\u2650 ' + self.name
             bg_color = (0.95, 0.86, 0.71)
+        return label, bg_color
 
+    def get_layout(self, canvas):
+        label, bg_color = self.get_label()
         layout = canvas.create_pango_layout(label)
         font = Pango.FontDescription('Sans')
         layout.set_font_description(font)
-        width, height = layout.get_size()
-        self.width = width / 1024
+        return layout
+
+    def measure(self, canvas):
+        if not self.measured:
+            width, height = self.get_layout(canvas).get_size()
+            self.width = width / 1024
+            self.measured = True
+
+    def draw(self, canvas, cr):
+        label, bg_color = self.get_label()
+        layout = self.get_layout(canvas)
 
         cr.set_source_rgb(*bg_color)
         cr.rectangle(self.x + 1, self.y + 1, self.width - 2, self.height - 2)
@@ -197,6 +258,16 @@ class QuiltView(NavigationView):
         self._in_move = False
         self.layers = None
         self.paths = []
+        # where the nodes and the lines linking families are drawn
+        self.index = None
+        self.link_index = None
+        self.size = (0, 0)
+        self.frame_count = 0
+        self.frame_time = 0
+        # database changes waiting to be applied
+        self.changed_people = set()
+        self.changed_families = set()
+        self.change_timer = None
 
     def get_stock(self):
         """
@@ -321,13 +392,13 @@ class QuiltView(NavigationView):
         is no need to store the database, since we will get the value
         from self.state.db
         """
-        db.connect('person-add', self.person_rebuild)
-        db.connect('person-update', self.person_rebuild)
-        db.connect('person-delete', self.person_rebuild)
+        db.connect('person-add', self.person_changed)
+        db.connect('person-update', self.person_changed)
+        db.connect('person-delete', self.person_changed)
         db.connect('person-rebuild', self.person_rebuild_bm)
-        db.connect('family-update', self.person_rebuild)
-        db.connect('family-add', self.person_rebuild)
-        db.connect('family-delete', self.person_rebuild)
+        db.connect('family-update', self.family_changed)
+        db.connect('family-add', self.family_changed)
+        db.connect('family-delete', self.family_changed)
         db.connect('family-rebuild', self.person_rebuild)
         self.bookmarks.update_bookmarks()
         if self.active:
@@ -378,16 +449,115 @@ class QuiltView(NavigationView):
     def person_rebuild(self, dummy=None):
         self.rebuild()
 
-    def read_data(self, handle):
+    def person_changed(self, handles):
+        self.changed_people.update(handles)
+        self.schedule_changes()
+
+    def family_changed(self, handles):
+        self.changed_families.update(handles)
+        self.schedule_changes()
+
+    def schedule_changes(self):
+        """
+        Gather the changes signalled over a short while, so that a batch of
+        edits is applied in one go.
+        """
+        if self.change_timer is None:
+            self.change_timer = GLib.timeout_add(COALESCE, self.apply_changes)
 
-        c = clock()
+    def apply_changes(self):
+        """
+        Patch the nodes touched by the gathered changes. Links that have
+        gone can split the chart, so they need the full walk again; new
+        links are followed from where they join the chart.
+        """
+        self.change_timer = None
+        people, self.changed_people = self.changed_people, set()
+        families, self.changed_families = self.changed_families, set()
+        if self.layers is None:
+            return False
+        todo = []
+        try:
+            for handle in people:
+                if handle in self.people:
+                    todo.extend(self.patch_person(self.people[handle]))
+            for handle in families:
+                if handle in self.families:
+                    todo.extend(self.patch_family(self.families[handle]))
+        except KeyError:
+            self.rebuild()
+            return False
+        self.walk(todo, self.people, self.families, self.layers)
+        self.layout()
+        self.canvas.queue_draw()
+        return False
+
+    def patch_person(self, node):
+        """
+        Bring a person node up to date. Returns the new links to follow,
+        and raises KeyError if a link has gone.
+        """
+        if not self.dbstate.db.has_person_handle(node.handle):
+            raise KeyError(node.handle)
+        person = self.dbstate.db.get_person_from_handle(node.handle)
+        node.name = name_displayer.display(person)
+        node.sex = person.get_gender()
+        node.measured = False
+        todo = []
+        for (old, new, layer) in (
+                (node.parents, person.get_family_handle_list(), node.layer + 1),
+                (node.children, person.get_parent_family_handle_list(),
+                 node.layer - 1)):
+            if set(old) - set(new):
+                raise KeyError(node.handle)
+            for fhandle in new:
+                if fhandle not in old:
+                    old.append(fhandle)
+                    if fhandle not in self.families:
+                        todo.append((fhandle, layer))
+        return todo
+
+    def patch_family(self, node):
+        """
+        Bring a family node up to date. Returns the new links to follow,
+        and raises KeyError if a link has gone.
+        """
+        if not self.dbstate.db.has_family_handle(node.handle):
+            raise KeyError(node.handle)
+        family = self.dbstate.db.get_family_from_handle(node.handle)
+        node.rel_type = family.get_relationship()
+        parents = [handle for handle in (family.get_father_handle(),
+                                         family.get_mother_handle())
+                   if handle is not None]
+        children = [child_ref.ref for child_ref in family.get_child_ref_list()]
+        todo = []
+        for (old, new, layer) in ((node.parents, parents, node.layer - 1),
+                                  (node.children, children, node.layer + 1)):
+            if set(old) - set(new):
+                raise KeyError(node.handle)
+            for handle in new:
+                if handle not in old:
+                    old.append(handle)
+                    if handle not in self.people:
+                        todo.append((handle, layer))
+        return todo
+
+    def read_data(self, handle):
         people = {}
         families = {}
         layers = {}
+        self.walk([(handle, 0)], people, families, layers)
+        return people, families, layers
 
-        todo = [(handle, 0)]
+    def walk(self, todo, people, families, layers):
+        """
+        Walk the tree from the (handle, layer) pairs in todo, adding the
+        people and families found that are not already in the chart.
+        """
         while todo:
             handle, layer = todo.pop()
+            if handle in people or handle in families:
+                continue
             if layer not in layers:
                 layers[layer] = [(0, handle)]
             else:
@@ -403,6 +573,8 @@ class QuiltView(NavigationView):
                     name = "???"
                     sex = Person.UNKNOWN
                 people[handle] = PersonNode(handle, layer, name, sex)
+                if person is None:
+                    continue
 
                 for fhandle in person.get_family_handle_list():
                     people[handle].add_main_family(fhandle)
@@ -435,8 +607,6 @@ class QuiltView(NavigationView):
                     if parent not in people:
                         todo.append((parent, layer - 1))
 
-        return people, families, layers
-
     def rebuild(self):
         """
         Rebuild.
@@ -444,22 +614,21 @@ class QuiltView(NavigationView):
         active = self.get_active()
         if active != "":
             self.people, self.families, self.layers = self.read_data(active)
+            self.layout()
             self.canvas.queue_draw()
             self.center_on_node(active)
 
-    def on_draw(self, canvas, cr):
+    def layout(self):
         """
-        Draw.
+        Work out where every node goes, and index the nodes and the lines
+        linking the families by where they are drawn.
         """
-        if self.layers is None:
-            return
-        #c = clock()
-
-        cr.scale(self.scale, self.scale)
+        self.index = GridIndex()
+        # linking lines are long and thin, so use tall cells for them
+        self.link_index = GridIndex(GRID, GRID * 16)
 
         x = BORDER
         y = BORDER
-        # Draw person and family nodes
         for layer in sorted(self.layers.keys()):
             nodes = self.layers[layer]
             layer_width = 0
@@ -469,7 +638,8 @@ class QuiltView(NavigationView):
                     # person
                     p = self.people[handle]
                     p.set_position(x, y)
-                    item = p.draw(canvas, cr)
+                    p.measure(self.canvas)
+                    self.index.insert(p, x, y, x + p.width, y + p.height)
                     if p.get_width() > layer_width:
                         layer_width = p.get_width()
                     y += HEIGHT
@@ -477,7 +647,7 @@ class QuiltView(NavigationView):
                     # family
                     f = self.families[handle]
                     f.set_position(x, y)
-                    item = f.draw(canvas, cr)
+                    self.index.insert(f, x, y, x + f.width, y + f.height)
                     x += HEIGHT
             if layer % 2 == 0:
                 # person
@@ -485,77 +655,48 @@ class QuiltView(NavigationView):
             else:
                 # family
                 y += HEIGHT
+        self.size = (x + BORDER, y + BORDER)
 
-        # Draw linking lines
+        # Index each stretch of the linking lines separately, as together
+        # they can span a large part of the chart
         for family in self.families.values():
-            miny = None
+            top = family.y
             for phandle in family.parents:
                 parent = self.people[phandle]
-                x1 = parent.x + parent.width
-                x2 = family.x + HEIGHT
-                y1 = parent.y
-                y2 = parent.y + HEIGHT
-                if miny is None or y1 < miny:
-                    miny = y1
-
-                cr.set_source_rgb(0.50, 0.50, 0.50)
-                cr.move_to(x1, y1)
-                cr.line_to(x2, y1)
-                cr.stroke()
-                cr.move_to(x1, y2)
-                cr.line_to(x2, y2)
-                cr.stroke()
-
-                cr.set_source_rgb(0.25, 0.25, 0.25)
-                if parent.sex == Person.MALE:
-                    cr.rectangle(family.x + 4, y1 + 4, 10, 10)
-                else:
-                    cr.arc((family.x + x2) / 2, (y1 + y2) / 2,
-                           5, 0, 2 * math.pi)
-                cr.fill()
-
-            if miny is not None:
-                cr.set_source_rgb(0.50, 0.50, 0.50)
-                cr.move_to(family.x, miny)
-                cr.line_to(family.x, family.y)
-                cr.stroke()
-                cr.move_to(x2, miny)
-                cr.line_to(x2, family.y)
-                cr.stroke()
-
-            maxy = None
+                self.link_index.insert(family, parent.x + parent.width,
+                                       parent.y, family.x + HEIGHT,
+                                       parent.y + HEIGHT)
+                top = min(top, parent.y)
+            self.link_index.insert(family, family.x, top,
+                                   family.x + HEIGHT, family.y)
+            bottom = family.y + HEIGHT
             for phandle in family.children:
                 child = self.people[phandle]
-                x1 = family.x
-                x2 = child.x
-                y1 = child.y
-                y2 = child.y + HEIGHT
-                if maxy is None or y2 > maxy:
-                    maxy = y2
-                cr.set_source_rgb(0.50, 0.50, 0.50)
-                cr.move_to(x1, y1)
-                cr.line_to(x2, y1)
-                cr.stroke()
-                cr.move_to(x1, y2)
-                cr.line_to(x2, y2)
-                cr.stroke()
-
-                cr.set_source_rgb(0.25, 0.25, 0.25)
-                if child.sex == Person.MALE:
-                    cr.rectangle(x1 + 4, y1 + 4, 10, 10)
-                else:
-                    cr.arc((x1 + family.x + HEIGHT) / 2, (y1 + y2) / 2,
-                           5, 0, 2 * math.pi)
-                cr.fill()
-
-            if maxy is not None:
-                cr.set_source_rgb(0.50, 0.50, 0.50)
-                cr.move_to(family.x, family.y + HEIGHT)
-                cr.line_to(family.x, maxy)
-                cr.stroke()
-                cr.move_to(family.x + HEIGHT, family.y + HEIGHT)
-                cr.line_to(family.x + HEIGHT, maxy)
-                cr.stroke()
+                self.link_index.insert(family, family.x, child.y,
+                                       child.x, child.y + HEIGHT)
+                bottom = max(bottom, child.y + HEIGHT)
+            self.link_index.insert(family, family.x, family.y + HEIGHT,
+                                   family.x + HEIGHT, bottom)
+
+    def on_draw(self, canvas, cr):
+        """
+        Draw the nodes and lines in the area being redrawn.
+        """
+        if self.index is None:
+            return
+        start = perf_counter()
+
+        cr.scale(self.scale, self.scale)
+        x1, y1, x2, y2 = cr.clip_extents()
+
+        # Draw person and family nodes
+        nodes = self.index.query(x1, y1, x2, y2)
+        for node in nodes:
+            node.draw(canvas, cr)
+
+        # Draw linking lines
+        for family in self.link_index.query(x1, y1, x2, y2):
+            self.draw_links(cr, family)
 
         for path in self.paths:
             x1, y1, x2, y2 = path
@@ -565,10 +706,93 @@ class QuiltView(NavigationView):
             cr.line_to(x2 - HEIGHT/2, y2+HEIGHT)
             cr.stroke()
 
-        self.canvas.set_size_request((x + BORDER) * self.scale,
-                                     (y + BORDER) * self.scale)
+        self.canvas.set_size_request(self.size[0] * self.scale,
+                                     self.size[1] * self.scale)
 
-        #print ('draw time', clock()- c)
+        self.count_frame(perf_counter() - start, len(nodes))
+
+    def draw_links(self, cr, family):
+        """
+        Draw the lines linking a family to its parents and children.
+        """
+        miny = None
+        for phandle in family.parents:
+            parent = self.people[phandle]
+            x1 = parent.x + parent.width
+            x2 = family.x + HEIGHT
+            y1 = parent.y
+            y2 = parent.y + HEIGHT
+            if miny is None or y1 < miny:
+                miny = y1
+
+            cr.set_source_rgb(0.50, 0.50, 0.50)
+            cr.move_to(x1, y1)
+            cr.line_to(x2, y1)
+            cr.stroke()
+            cr.move_to(x1, y2)
+            cr.line_to(x2, y2)
+            cr.stroke()
+
+            cr.set_source_rgb(0.25, 0.25, 0.25)
+            if parent.sex == Person.MALE:
+                cr.rectangle(family.x + 4, y1 + 4, 10, 10)
+            else:
+                cr.arc((family.x + x2) / 2, (y1 + y2) / 2,
+                       5, 0, 2 * math.pi)
+            cr.fill()
+
+        if miny is not None:
+            cr.set_source_rgb(0.50, 0.50, 0.50)
+            cr.move_to(family.x, miny)
+            cr.line_to(family.x, family.y)
+            cr.stroke()
+            cr.move_to(x2, miny)
+            cr.line_to(x2, family.y)
+            cr.stroke()
+
+        maxy = None
+        for phandle in family.children:
+            child = self.people[phandle]
+            x1 = family.x
+            x2 = child.x
+            y1 = child.y
+            y2 = child.y + HEIGHT
+            if maxy is None or y2 > maxy:
+                maxy = y2
+            cr.set_source_rgb(0.50, 0.50, 0.50)
+            cr.move_to(x1, y1)
+            cr.line_to(x2, y1)
+            cr.stroke()
+            cr.move_to(x1, y2)
+            cr.line_to(x2, y2)
+            cr.stroke()
+
+            cr.set_source_rgb(0.25, 0.25, 0.25)
+            if child.sex == Person.MALE:
+                cr.rectangle(x1 + 4, y1 + 4, 10, 10)
+            else:
+                cr.arc((x1 + family.x + HEIGHT) / 2, (y1 + y2) / 2,
+                       5, 0, 2 * math.pi)
+            cr.fill()
+
+        if maxy is not None:
+            cr.set_source_rgb(0.50, 0.50, 0.50)
+            cr.move_to(family.x, family.y + HEIGHT)
+            cr.line_to(family.x, maxy)
+            cr.stroke()
+            cr.move_to(family.x + HEIGHT, family.y + HEIGHT)
+            cr.line_to(family.x + HEIGHT, maxy)
+            cr.stroke()
+
+    def count_frame(self, seconds, nodes):
+        """
+        Keep count of the time taken to draw each frame.
+        """
+        self.frame_count += 1
+        self.frame_time += seconds
+        LOG.debug("frame %d: %d nodes drawn in %.1f ms (average %.1f ms)",
+                  self.frame_count, nodes, seconds * 1000,
+                  self.frame_time * 1000 / self.frame_count)
 
     def home(self, menuitem):
         defperson = self.dbstate.db.get_default_person()
@@ -623,11 +847,14 @@ class QuiltView(NavigationView):
         self.set_preview_position()
 
     def get_object_at(self, x, y):
-        for p in self.people.values():
-            if p.is_at(x, y):
+        if self.index is None:
+            return None
+        nodes = self.index.at(x, y)
+        for p in nodes:
+            if isinstance(p, PersonNode) and p.is_at(x, y):
                 return p
-        for f in self.families.values():
-            if f.is_at(x, y):
+        for f in nodes:
+            if isinstance(f, FamilyNode) and f.is_at(x, y):
                 return f
         return None
 
@@ -0,0 +1,77 @@
+from gramps.gen.dbstate import DbState
+from gramps.gen.db import DbTxn
+from gramps.plugins.importer.importxml import importData as importXML
+from gramps.cli.user import User
+
+from ..QuiltView import QuiltView
+
+import unittest
+import os
+
+dbstate = DbState()
+gramps_path = os.environ["GRAMPS_RESOURCES"]
+
+class Canvas(object):
+    def queue_draw(self):
+        pass
+
+class QuiltViewChangeTestCase (unittest.TestCase):
+
+    def setUp(self):
+        self.database = dbstate.make_database("bsddb")
+        try:
+            os.mkdir("/tmp/bsddb_quiltview")
+        except:
+            pass
+        self.database.write_version("/tmp/bsddb_quiltview")
+        self.database.load("/tmp/bsddb_quiltview")
+        importXML(self.database, gramps_path + "/example/gramps/example.gramps", User())
+
+        # A view without its GUI, showing the chart of a person with a family
+        self.view = QuiltView.__new__(QuiltView)
+        self.view.dbstate = DbState()
+        self.view.dbstate.change_database(self.database)
+        self.view.canvas = Canvas()
+        self.view.changed_people = set()
+        self.view.changed_families = set()
+        self.view.change_timer = None
+        self.rebuilds = 0
+        self.view.rebuild = self.count_rebuild
+        self.view.layout = lambda: None
+        for person in self.database.iter_people():
+            if person.get_family_handle_list():
+                self.person = person
+                break
+        (self.view.people, self.view.families,
+         self.view.layers) = self.view.read_data(self.person.get_handle())
+
+    def tearDown(self):
+        self.database.close()
+
+    def count_rebuild(self):
+        self.rebuilds += 1
+
+    def test_update_person(self):
+        self.view.changed_people.add(self.person.get_handle())
+        self.view.apply_changes()
+        self.assertEqual(self.rebuilds, 0)
+
+    def test_delete_person(self):
+        handle = self.person.get_handle()
+        with DbTxn("Remove person", self.database) as trans:
+            self.database.remove_person(handle, trans)
+        self.view.changed_people.add(handle)
+        self.view.apply_changes()
+        self.assertEqual(self.rebuilds, 1)
+
+    def test_delete_family(self):
+        handle = self.person.get_family_handle_list()[0]
+        self.assertIn(handle, self.view.families)
+        with DbTxn("Remove family", self.database) as trans:
+            self.database.remove_family(handle, trans)
+        self.view.changed_families.add(handle)
+        self.view.apply_changes()
+        self.assertEqual(self.rebuilds, 1)
+
+if __name__ == "__main__":
+    unittest.main()
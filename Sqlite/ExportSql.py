@@ -34,8 +34,10 @@
 #
 #------------------------------------------------------------------------
 
+import os
 import sqlite3 as sqlite
 import time
+import itertools
 
 #------------------------------------------------------------------------
 #
@@ -144,9 +146,6 @@ def makeDB(db):
                   origin_type1 TEXT,
                   connector TEXT);""")
 
-    db.query("""CREATE INDEX idx_surname_handle ON 
-                  surname(handle);""")
-
     db.query("""CREATE TABLE date (
                   handle CHARACTER(25) PRIMARY KEY,
                   calendar INTEGER, 
@@ -270,9 +269,6 @@ def makeDB(db):
                  to_type CHARACTER(25), 
                  to_handle CHARACTER(25));""")
 
-    db.query("""CREATE INDEX idx_link_to ON 
-                  link(from_type, from_handle, to_type);""")
-
     db.query("""CREATE TABLE markup (
                  handle CHARACTER(25) PRIMARY KEY,
                  markup0 INTEGER, 
@@ -367,18 +363,95 @@ def makeDB(db):
                  change INTEGER);
                  """)
 
+def makeIndexes(db):
+    """
+    Create the indexes once the tables are loaded; building them at the
+    end is much faster than maintaining them on every insert.
+    """
+    db.query("""CREATE INDEX idx_surname_handle ON 
+                  surname(handle);""")
+
+    db.query("""CREATE INDEX idx_link_to ON 
+                  link(from_type, from_handle, to_type);""")
+
+    db.query("""CREATE INDEX idx_datamap_from_handle ON 
+                  datamap(from_handle);""")
+
+    db.query("""CREATE INDEX idx_place_name_from_handle ON 
+                  place_name(from_handle);""")
+
+    db.query("""CREATE INDEX idx_place_ref_from_place_handle ON 
+                  place_ref(from_place_handle);""")
+
 class Database(object):
     """
     The db connection.
+
+    While batch is set, inserts are buffered per statement and written
+    with executemany, batch_size rows at a time.
     """
-    def __init__(self, database):
+    def __init__(self, database, batch_size=10000):
         self.batch = False
+        self.batch_size = batch_size
+        self.pending = {}
         self.database = database
         self.db = sqlite.connect(self.database)
         self.cursor = self.db.cursor()
+        self.handle_prefix = create_id()
+        self.handle_count = itertools.count()
+        self.inserted = 0
+
+    def new_handle(self):
+        """
+        Return a handle for a new row; unique within this export, and
+        cheaper than a create_id() per row.
+        """
+        return "%s%x" % (self.handle_prefix, next(self.handle_count))
+
+    def tune(self, fast):
+        """
+        Turn the journal and syncing off for a bulk load, or back on.
+        """
+        if fast:
+            self.query("PRAGMA journal_mode = OFF;")
+            self.query("PRAGMA synchronous = OFF;")
+        else:
+            self.query("PRAGMA journal_mode = DELETE;")
+            self.query("PRAGMA synchronous = FULL;")
+
+    def flush(self, q=None):
+        """
+        Write out the buffered rows of one insert statement, or all of them.
+        """
+        for query in ([q] if q else list(self.pending)):
+            rows = self.pending.pop(query, None)
+            if rows:
+                try:
+                    self.cursor.executemany(query, rows)
+                except:
+                    print("ERROR: query :", query)
+                    raise
+
+    def delete(self, q, *args):
+        """
+        Run a delete statement, and return the number of rows deleted.
+        """
+        self.flush()
+        self.cursor.execute(q, args)
+        return self.cursor.rowcount
 
     def query(self, q, *args):
         args = list(args)
+        insert = q.lstrip()[:6].upper() == "INSERT"
+        if insert:
+            self.inserted += 1
+        if self.batch and insert:
+            rows = self.pending.setdefault(q, [])
+            rows.append(args)
+            if len(rows) >= self.batch_size:
+                self.flush(q)
+            return []
+        self.flush()
         if q.strip().upper().startswith("DROP"):
             try:
                 self.cursor.execute(q, args)
@@ -409,7 +482,7 @@ def export_alt_place_name_list(db, handle, alt_place_name_list):
 def export_place_name(db, handle, place_name):
     # alt_place_name_list = [('Ohio', None, ''), ...] [(value, date, lang)...]
     (value, date, lang) = place_name
-    ref_handle = create_id()
+    ref_handle = db.new_handle()
     db.query("""insert into place_name (handle, from_handle, value, lang) 
                    VALUES (?, ?, ?, ?)
     ;""", ref_handle, handle, value, lang)
@@ -422,7 +495,7 @@ def export_place_ref_list(db, handle, place_ref_list):
 
 def export_place_ref(db, handle, place_ref):
     (to_place_handle, date) = place_ref
-    ref_handle = create_id()
+    ref_handle = db.new_handle()
     db.query("""insert into place_ref (handle, from_place_handle, to_place_handle) 
                    VALUES (?, ?, ?)
     ;""", ref_handle, handle, to_place_handle)
@@ -436,7 +509,7 @@ def export_url_list(db, from_type, from_handle, urls):
     for url in urls:
         # (False, u'http://www.gramps-project.org/', u'loleach', (0, u'kaabgo'))
         (private, path, desc, type) = url
-        handle = create_id()
+        handle = db.new_handle()
         db.query("""insert INTO url (
                  handle,
                  path, 
@@ -477,7 +550,7 @@ def export_person_ref_list(db, from_type, from_handle, person_ref_list):
 def export_lds(db, from_type, from_handle, data):
     (lcitation_list, lnote_list, date, type, place,
      famc, temple, status, private) = data
-    lds_handle = create_id()
+    lds_handle = db.new_handle()
     db.query("""INSERT into lds (handle, type, place, famc, temple, status, private) 
              VALUES (?,?,?,?,?,?,?);""",
              lds_handle, type, place, famc, temple, status, private)
@@ -536,7 +609,7 @@ def export_note(db, data):
 
 def export_markup(db, from_type, from_handle,  markup_code0, markup_code1, value,
                   start_stop_list):
-    markup_handle = create_id()
+    markup_handle = db.new_handle()
     db.query("""INSERT INTO markup (
                  handle, 
                  markup0, 
@@ -577,7 +650,7 @@ def export_event(db, data):
 
 def export_event_ref(db, from_type, from_handle, event_ref):
     (private, note_list, attribute_list, ref, role) = event_ref
-    handle = create_id()
+    handle = db.new_handle()
     db.query("""insert INTO event_ref (
                  handle, 
                  ref, 
@@ -675,7 +748,7 @@ def export_date(db, from_type, from_handle, data):
         day1, month1, year1, slash1, day2, month2, year2, slash2 = dateval
     else:
         raise ("ERROR: date dateval format", dateval)
-    date_handle = create_id()
+    date_handle = db.new_handle()
     db.query("""INSERT INTO date (
                   handle,
                   calendar, 
@@ -720,7 +793,7 @@ def export_name(db, from_type, from_handle, primary, data):
          name_type,
          group_as, sort_as, display_as,
          call, nick, famnick) = data
-        handle = create_id()
+        handle = db.new_handle()
         db.query("""INSERT into name (
                   handle,
                   primary_name,
@@ -750,7 +823,7 @@ def export_name(db, from_type, from_handle, primary, data):
 
 def export_attribute(db, from_type, from_handle, attribute):
     (private, citation_list, note_list, the_type, value) = attribute
-    handle = create_id()
+    handle = db.new_handle()
     db.query("""INSERT INTO attribute (
                  handle,
                  the_type0, 
@@ -775,7 +848,7 @@ def export_media_ref(db, from_type, from_handle, media):
     (private, citation_list, note_list, attribute_list, ref, role) = media
     # handle is the media_ref handle
     # ref is the media handle
-    handle = create_id()
+    handle = db.new_handle()
     if role is None:
         role = (-1, -1, -1, -1)
     db.query("""INSERT into media_ref (
@@ -802,7 +875,7 @@ def export_child_ref_list(db, from_type, from_handle, to_type, ref_list):
         # family -> child_ref
         # (False, [], [], u'b305e96e39652d8f08c', (1, u''), (1, u''))
         (private, citation_list, note_list, ref, frel, mrel) = child_ref
-        handle = create_id()
+        handle = db.new_handle()
         db.query("""INSERT INTO child_ref (handle, 
                      ref, frel0, frel1, mrel0, mrel1, private)
                         VALUES (?, ?, ?, ?, ?, ?, ?);""",
@@ -839,7 +912,7 @@ def export_datamap_list(db, from_type, from_handle, datamap):
 
 def export_address(db, from_type, from_handle, address):
     (private, acitation_list, anote_list, date, location) = address
-    addr_handle = create_id()
+    addr_handle = db.new_handle()
     db.query("""INSERT INTO address (
                 handle,
                 private) VALUES (?, ?);""", addr_handle, private)
@@ -860,7 +933,7 @@ def export_location(db, from_type, from_handle, location):
     else:
         print("ERROR: what kind of location is this?", location)
         return
-    handle = create_id()
+    handle = db.new_handle()
     db.query("""INSERT INTO location (
                  handle,
                  street, 
@@ -883,7 +956,7 @@ def export_repository_ref_list(db, from_type, from_handle, reporef_list):
          call_number,
          source_media_type,
          private) = repo
-        handle = create_id()
+        handle = db.new_handle()
         db.query("""insert INTO repository_ref (
                      handle, 
                      ref, 
@@ -901,6 +974,273 @@ def export_repository_ref_list(db, from_type, from_handle, reporef_list):
         # finally, link this to parent
         export_link(db, from_type, from_handle, "repository_ref", handle)
 
+def export_family(db, data):
+    (handle, gid, father_handle, mother_handle,
+     child_ref_list, the_type, event_ref_list, media_list,
+     attribute_list, lds_seal_list, citation_list, note_list,
+     change, tag_list, private) = data
+    # father_handle and/or mother_handle can be None
+    db.query("""INSERT INTO family (
+             handle, 
+             gid, 
+             father_handle, 
+             mother_handle,
+             the_type0, 
+             the_type1, 
+             change, 
+             private) values (?,?,?,?,?,?,?,?);""",
+             handle, gid, father_handle, mother_handle,
+             the_type[0], the_type[1], change,
+             private)
+
+    export_child_ref_list(db, "family", handle, "child_ref", child_ref_list)
+    export_list(db, "family", handle, "note", note_list)
+    export_attribute_list(db, "family", handle, attribute_list)
+    export_citation_list(db, "family", handle, citation_list)
+    export_media_ref_list(db, "family", handle, media_list)
+    export_list(db, "family", handle, "tag", tag_list)
+
+    # Event Reference information
+    for event_ref in event_ref_list:
+        export_event_ref(db, "family", handle, event_ref)
+
+    # -------------------------------------
+    # LDS
+    # -------------------------------------
+    for ldsord in lds_seal_list:
+        export_lds(db, "family", handle, ldsord)
+
+def export_repository(db, data):
+    (handle, gid, the_type, name, note_list,
+     address_list, urls, change, tag_list, private) = data
+
+    db.query("""INSERT INTO repository (
+             handle, 
+             gid, 
+             the_type0, 
+             the_type1,
+             name, 
+             change, 
+             private) VALUES (?,?,?,?,?,?,?);""",
+             handle, gid, the_type[0], the_type[1],
+             name, change, private)
+
+    export_list(db, "repository", handle, "note", note_list)
+    export_url_list(db, "repository", handle, urls)
+    export_list(db, "repository", handle, "tag", tag_list)
+
+    for address in address_list:
+        export_address(db, "repository", handle, address)
+
+def export_place(db, data):
+    (handle, gid, title, long, lat,
+     place_ref_list,
+     place_name,
+     alt_place_name_list,
+     place_type,
+     code,
+     alt_location_list,
+     urls,
+     media_list,
+     citation_list,
+     note_list,
+     change, tag_list, private) = data
+
+    value, date, lang = place_name
+
+    db.query("""INSERT INTO place (
+             handle, 
+             gid, 
+             title, 
+             value,
+             the_type0,
+             the_type1,
+             code,
+             long, 
+             lat, 
+             lang,
+             change, 
+             private) values (?,?,?,?,?,?,?,?,?,?,?,?);""",
+             handle, gid, title, value,
+             place_type[0], place_type[1],
+             code,
+             long, lat,
+             lang,
+             change, private)
+
+    export_date(db, "place", handle, date)
+    export_url_list(db, "place", handle, urls)
+    export_media_ref_list(db, "place", handle, media_list)
+    export_citation_list(db, "place", handle, citation_list)
+    export_list(db, "place", handle, "note", note_list)
+    export_list(db, "place", handle, "tag", tag_list)
+
+    #1. alt_place_name_list = [('Ohio', None, ''), ...] [(value, date, lang)...]
+    #2. place_ref_list = Enclosed by:  [('4ECKQCWCLO5YIHXEXC', None)] [(handle, date)...]
+
+    export_alt_place_name_list(db, handle, alt_place_name_list)
+    export_place_ref_list(db, handle, place_ref_list)
+
+    # But we need to link these:
+    export_location_list(db, "place_alt", handle, alt_location_list)
+
+def export_citation(db, data):
+    (handle,                           #  0
+     gid,                        #  1
+     date, #  2
+     page,                    #  3
+     confidence,                       #  4
+     source_handle,                    #  5
+     note_list,              #  6
+     media_list,             #  7
+     datamap,                          #  8
+     change,                           #  9
+     tag_list,
+     private) = data
+    db.query("""INSERT into citation (
+             handle, 
+             gid, 
+             confidence,
+             page,
+             source_handle,
+             change,
+             private
+             ) VALUES (?,?,?,?,?,?,?);""",
+             handle,
+             gid,
+             confidence,
+             page,
+             source_handle,
+             change,
+             private)
+    export_datamap_list(db, "citation", handle, datamap)
+    export_date(db, "citation", handle, date)
+    export_list(db, "citation", handle, "note", note_list)
+    export_media_ref_list(db, "citation", handle, media_list)
+    export_list(db, "citation", handle, "tag", tag_list)
+
+def export_source_data(db, data):
+    (handle, gid, title,
+     author, pubinfo,
+     note_list,
+     media_list,
+     abbrev,
+     change, datamap,
+     reporef_list,
+     tag_list,
+     private) = data
+
+    export_source(db, handle, gid, title, author, pubinfo, abbrev, change, private)
+    export_list(db, "source", handle, "note", note_list)
+    export_list(db, "source", handle, "tag", tag_list)
+    export_media_ref_list(db, "source", handle, media_list)
+    export_datamap_list(db, "source", handle, datamap)
+    export_repository_ref_list(db, "source", handle, reporef_list)
+
+def export_media(db, data):
+    (handle, gid, path, mime, desc,
+     checksum,
+     attribute_list,
+     citation_list,
+     note_list,
+     change,
+     date,
+     tag_list,
+     private) = data
+
+    db.query("""INSERT INTO media (
+        handle, 
+        gid, 
+        path, 
+        mime, 
+        desc,
+        checksum,
+        change, 
+        private) VALUES (?,?,?,?,?,?,?,?);""",
+             handle, gid, path, mime, desc, checksum,
+             change, private)
+    export_date(db, "media", handle, date)
+    export_list(db, "media", handle, "note", note_list)
+    export_citation_list(db, "media", handle, citation_list)
+    export_attribute_list(db, "media", handle, attribute_list)
+    export_list(db, "media", handle, "tag", tag_list)
+
+def export_tag(db, data):
+    (handle, name, color, priority, change) = data
+    db.query("""INSERT INTO tag (
+        handle, 
+        name,
+        color,
+        priority,
+        change) VALUES (?,?,?,?,?);""",
+             handle, name, color, priority, change)
+
+# The primary tables, in export order, with the function writing each one:
+EXPORTERS = [("note", export_note),
+             ("event", export_event),
+             ("person", export_person),
+             ("family", export_family),
+             ("repository", export_repository),
+             ("place", export_place),
+             ("citation", export_citation),
+             ("source", export_source_data),
+             ("media", export_media),
+             ("tag", export_tag)]
+
+# Link targets that are rows owned by the object linking to them (as
+# opposed to references to other primary objects):
+OWNED = ["address", "attribute", "child_ref", "date", "event_ref", "lds",
+         "location", "markup", "media_ref", "name", "person_ref",
+         "repository_ref", "url"]
+
+def delete_rows(db, from_type, from_handle):
+    """
+    Delete the rows owned by an object, following its links down, and the
+    links themselves. Return the number of rows deleted.
+    """
+    count = 0
+    links = db.query("""select to_type, to_handle from link
+                        where from_type = ? and from_handle = ?;""",
+                     from_type, from_handle)
+    for (to_type, to_handle) in links:
+        if to_type in OWNED:
+            count += delete_rows(db, to_type, to_handle)
+            count += db.delete("delete from %s where handle = ?;" % to_type,
+                               to_handle)
+    count += db.delete("""delete from link
+                          where from_type = ? and from_handle = ?;""",
+                       from_type, from_handle)
+    if from_type == "name":
+        count += db.delete("delete from surname where handle = ?;",
+                           from_handle)
+    return count
+
+def delete_object(db, table, handle):
+    """
+    Delete a primary object and everything exported with it. Return the
+    number of rows deleted.
+    """
+    count = delete_rows(db, table, handle)
+    if table in ("citation", "source"):
+        count += db.delete("delete from datamap where from_handle = ?;",
+                           handle)
+    elif table == "place":
+        count += delete_rows(db, "place_alt", handle)
+        for (ref_handle,) in db.query(
+                "select handle from place_name where from_handle = ?;",
+                handle):
+            count += delete_rows(db, "place_name", ref_handle)
+        count += db.delete("delete from place_name where from_handle = ?;",
+                           handle)
+        for (ref_handle,) in db.query(
+                "select handle from place_ref where from_place_handle = ?;",
+                handle):
+            count += delete_rows(db, "place_ref", ref_handle)
+        count += db.delete(
+            "delete from place_ref where from_place_handle = ?;", handle)
+    count += db.delete("delete from %s where handle = ?;" % table, handle)
+    return count
+
 def exportData(database, filename, err_dialog=None, option_box=None,
                callback=None):
     if not callable(callback):
@@ -911,329 +1251,94 @@ def exportData(database, filename, err_dialog=None, option_box=None,
         database = option_box.get_filtered_database(database)
 
     start = time.time()
-    total = (len(database.get_note_handles()) +
-             len(database.get_person_handles()) +
-             len(database.get_event_handles()) +
-             len(database.get_family_handles()) +
-             len(database.get_repository_handles()) +
-             len(database.get_place_handles()) +
-             len(database.get_media_handles()) +
-             len(database.get_tag_handles()) +
-             len(database.get_citation_handles()) +
-             len(database.get_source_handles()))
+    total = sum(len(getattr(database, "get_%s_handles" % table)())
+                for (table, export) in EXPORTERS)
     count = 0.0
 
     db = Database(filename)
+    db.tune(True)
     makeDB(db)
 
     db.batch = True # don't commit till end
-    # ---------------------------------
-    # Notes
-    # ---------------------------------
-    for note_handle in database.iter_note_handles():
-        data = database.get_note_from_handle(note_handle)
-        if data is None:
-            continue
-        export_note(db, data.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Event
-    # ---------------------------------
-    for event_handle in database.iter_event_handles():
-        data = database.get_event_from_handle(event_handle)
-        if data is None:
-            continue
-        export_event(db, data.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Person
-    # ---------------------------------
-    for person_handle in database.iter_person_handles():
-        person = database.get_person_from_handle(person_handle)
-        if person is None:
-            continue
-        export_person(db, person.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Family
-    # ---------------------------------
-    for family_handle in database.iter_family_handles():
-        family = database.get_family_from_handle(family_handle)
-        if family is None:
-            continue
-        (handle, gid, father_handle, mother_handle,
-         child_ref_list, the_type, event_ref_list, media_list,
-         attribute_list, lds_seal_list, citation_list, note_list,
-         change, tag_list, private) = family.serialize()
-        # father_handle and/or mother_handle can be None
-        db.query("""INSERT INTO family (
-                 handle, 
-                 gid, 
-                 father_handle, 
-                 mother_handle,
-                 the_type0, 
-                 the_type1, 
-                 change, 
-                 private) values (?,?,?,?,?,?,?,?);""",
-                 handle, gid, father_handle, mother_handle,
-                 the_type[0], the_type[1], change,
-                 private)
+    for (table, export) in EXPORTERS:
+        get_object = getattr(database, "get_%s_from_handle" % table)
+        for handle in getattr(database, "iter_%s_handles" % table)():
+            obj = get_object(handle)
+            if obj is None:
+                continue
+            export(db, obj.serialize())
+            count += 1
+            callback(100 * count/total)
 
-        export_child_ref_list(db, "family", handle, "child_ref", child_ref_list)
-        export_list(db, "family", handle, "note", note_list)
-        export_attribute_list(db, "family", handle, attribute_list)
-        export_citation_list(db, "family", handle, citation_list)
-        export_media_ref_list(db, "family", handle, media_list)
-        export_list(db, "family", handle, "tag", tag_list)
+    db.batch = False # turn off batch processing
+    db.flush()
+    db.db.commit() # commit all changes
+    makeIndexes(db)
+    db.tune(False)
+    db.close()
 
-        # Event Reference information
-        for event_ref in event_ref_list:
-            export_event_ref(db, "family", handle, event_ref)
-
-        # -------------------------------------
-        # LDS
-        # -------------------------------------
-        for ldsord in lds_seal_list:
-            export_lds(db, "family", handle, ldsord)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Repository
-    # ---------------------------------
-    for repository_handle in database.iter_repository_handles():
-        repository = database.get_repository_from_handle(repository_handle)
-        if repository is None:
-            continue
-        (handle, gid, the_type, name, note_list,
-         address_list, urls, change, tag_list, private) = repository.serialize()
-
-        db.query("""INSERT INTO repository (
-                 handle, 
-                 gid, 
-                 the_type0, 
-                 the_type1,
-                 name, 
-                 change, 
-                 private) VALUES (?,?,?,?,?,?,?);""",
-                 handle, gid, the_type[0], the_type[1],
-                 name, change, private)
-
-        export_list(db, "repository", handle, "note", note_list)
-        export_url_list(db, "repository", handle, urls)
-        export_list(db, "repository", handle, "tag", tag_list)
-
-        for address in address_list:
-            export_address(db, "repository", handle, address)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Place
-    # ---------------------------------
-    for place_handle in database.iter_place_handles():
-        place = database.get_place_from_handle(place_handle)
-        if place is None:
-            continue
-        (handle, gid, title, long, lat,
-         place_ref_list,
-         place_name,
-         alt_place_name_list,
-         place_type,
-         code,
-         alt_location_list,
-         urls,
-         media_list,
-         citation_list,
-         note_list,
-         change, tag_list, private) = place.serialize()
+    total_time = time.time() - start
+    msg = ngettext('Export Complete: %d second','Export Complete: %d seconds', total_time ) % total_time
+    print(msg)
+    return True
 
-        value, date, lang = place_name
+def exportIncremental(database, filename, err_dialog=None, option_box=None,
+                      callback=None):
+    """
+    Bring an existing export up to date: only the objects whose change
+    time differs from the tree are deleted and written again, and objects
+    no longer in the tree are removed. Without a previous export, do a
+    full one.
+    """
+    if not os.path.exists(filename):
+        return exportData(database, filename, err_dialog, option_box,
+                          callback)
+    if not callable(callback):
+        callback = lambda percent: None # dummy
 
-        db.query("""INSERT INTO place (
-                 handle, 
-                 gid, 
-                 title, 
-                 value,
-                 the_type0,
-                 the_type1,
-                 code,
-                 long, 
-                 lat, 
-                 lang,
-                 change, 
-                 private) values (?,?,?,?,?,?,?,?,?,?,?,?);""",
-                 handle, gid, title, value,
-                 place_type[0], place_type[1],
-                 code,
-                 long, lat,
-                 lang,
-                 change, private)
-
-        export_date(db, "place", handle, date)
-        export_url_list(db, "place", handle, urls)
-        export_media_ref_list(db, "place", handle, media_list)
-        export_citation_list(db, "place", handle, citation_list)
-        export_list(db, "place", handle, "note", note_list)
-        export_list(db, "place", handle, "tag", tag_list)
-
-        #1. alt_place_name_list = [('Ohio', None, ''), ...] [(value, date, lang)...]
-        #2. place_ref_list = Enclosed by:  [('4ECKQCWCLO5YIHXEXC', None)] [(handle, date)...]
-
-        export_alt_place_name_list(db, handle, alt_place_name_list)
-        export_place_ref_list(db, handle, place_ref_list)
-
-        # But we need to link these:
-        export_location_list(db, "place_alt", handle, alt_location_list)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Citation
-    # ---------------------------------
-    for citation_handle in database.iter_citation_handles():
-        citation = database.get_citation_from_handle(citation_handle)
-        if citation is None:
-            continue
-        #(handle, gid, title,
-        # author, pubinfo,
-        # note_list,
-        # media_list,
-        # abbrev,
-        # change, datamap,
-        # reporef_list,
-        # private)
-        (handle,                           #  0
-         gid,                        #  1
-         date, #  2
-         page,                    #  3
-         confidence,                       #  4
-         source_handle,                    #  5
-         note_list,              #  6
-         media_list,             #  7
-         datamap,                          #  8
-         change,                           #  9
-         tag_list,
-         private) = citation.serialize()
-        db.query("""INSERT into citation (
-                 handle, 
-                 gid, 
-                 confidence,
-                 page,
-                 source_handle,
-                 change,
-                 private
-                 ) VALUES (?,?,?,?,?,?,?);""",
-                 handle,
-                 gid,
-                 confidence,
-                 page,
-                 source_handle,
-                 change,
-                 private)
-        export_datamap_list(db, "citation", handle, datamap)
-        export_date(db, "citation", handle, date)
-        export_list(db, "citation", handle, "note", note_list)
-        export_media_ref_list(db, "citation", handle, media_list)
-        export_list(db, "citation", handle, "tag", tag_list)
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Source
-    # ---------------------------------
-    for source_handle in database.iter_source_handles():
-        source = database.get_source_from_handle(source_handle)
-        if source is None:
-            continue
-        (handle, gid, title,
-         author, pubinfo,
-         note_list,
-         media_list,
-         abbrev,
-         change, datamap,
-         reporef_list,
-         tag_list,
-         private) = source.serialize()
-
-        export_source(db, handle, gid, title, author, pubinfo, abbrev, change, private)
-        export_list(db, "source", handle, "note", note_list)
-        export_list(db, "source", handle, "tag", tag_list)
-        export_media_ref_list(db, "source", handle, media_list)
-        export_datamap_list(db, "source", handle, datamap)
-        export_repository_ref_list(db, "source", handle, reporef_list)
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Media
-    # ---------------------------------
-    for media_handle in database.iter_media_handles():
-        media = database.get_media_from_handle(media_handle)
-        if media is None:
-            continue
-        (handle, gid, path, mime, desc,
-         checksum,
-         attribute_list,
-         citation_list,
-         note_list,
-         change,
-         date,
-         tag_list,
-         private) = media.serialize()
-
-        db.query("""INSERT INTO media (
-            handle, 
-            gid, 
-            path, 
-            mime, 
-            desc,
-            checksum,
-            change, 
-            private) VALUES (?,?,?,?,?,?,?,?);""",
-                 handle, gid, path, mime, desc, checksum,
-                 change, private)
-        export_date(db, "media", handle, date)
-        export_list(db, "media", handle, "note", note_list)
-        export_citation_list(db, "media", handle, citation_list)
-        export_attribute_list(db, "media", handle, attribute_list)
-        export_list(db, "media", handle, "tag", tag_list)
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Tags
-    # ---------------------------------
-    for tag_handle in database.iter_tag_handles():
-        tag_object = database.get_tag_from_handle(tag_handle)
-        if tag_object is None:
-            continue
-        (handle, name, color, priority, change) = tag_object.serialize()
-        db.query("""INSERT INTO tag (
-            handle, 
-            name,
-            color,
-            priority,
-            change) VALUES (?,?,?,?,?);""",
-                 handle, name, color, priority, change)
-        count += 1
-        callback(100 * count/total)
+    if option_box:
+        option_box.parse_options()
+        database = option_box.get_filtered_database(database)
 
-    db.batch = False # turn off batch processing
-    db.db.commit() # commit all changes
-    db.db.close()
+    start = time.time()
+    total = sum(len(getattr(database, "get_%s_handles" % table)())
+                for (table, export) in EXPORTERS)
+    count = 0.0
+
+    db = Database(filename)
+    changed = []
+    deleted = 0
+    for (table, export) in EXPORTERS:
+        exported = dict(db.query("select handle, change from %s;" % table))
+        get_object = getattr(database, "get_%s_from_handle" % table)
+        for handle in getattr(database, "iter_%s_handles" % table)():
+            obj = get_object(handle)
+            count += 1
+            callback(100 * count/total)
+            if obj is None:
+                continue
+            old_change = exported.pop(obj.handle, None)
+            if old_change != obj.get_change_time():
+                if old_change is not None:
+                    deleted += delete_object(db, table, obj.handle)
+                changed.append((export, obj.serialize()))
+        # whatever is left was deleted from the tree:
+        for handle in exported:
+            deleted += delete_object(db, table, handle)
+
+    db.batch = True
+    for (export, data) in changed:
+        export(db, data)
+    db.batch = False
+    db.flush()
+    db.db.commit()
+    db.close()
 
     total_time = time.time() - start
     msg = ngettext('Export Complete: %d second','Export Complete: %d seconds', total_time ) % total_time
     print(msg)
+    print(_("Updated %(objects)d objects: %(deleted)d rows deleted, "
+            "%(inserted)d rows inserted") %
+          {'objects': len(changed), 'deleted': deleted,
+           'inserted': db.inserted})
     return True
-
@@ -104,6 +104,25 @@ class Database(object):
                 raise
             return self.cursor.fetchall()
 
+    def group_by(self, table, columns, value=None):
+        """
+        Read a whole table in one pass, and return a dict mapping the
+        values of columns (a tuple of column names) to the list of rows
+        that share them, in table order. If value is given, only that
+        column is kept in each row.
+        """
+        self.cursor.execute("select * from %s;" % table)
+        names = [desc[0] for desc in self.cursor.description]
+        key_index = [names.index(column) for column in columns]
+        value_index = None if value is None else names.index(value)
+        groups = {}
+        for row in self.cursor:
+            key = tuple(row[i] for i in key_index)
+            if value_index is not None:
+                row = row[value_index]
+            groups.setdefault(key, []).append(row)
+        return groups
+
     def close(self):
         """ Closes and writes out tables """
         self.cursor.close()
@@ -115,13 +134,22 @@ class Database(object):
 #
 #-------------------------------------------------------------------------
 class SQLReader(object):
-    def __init__(self, db, filename, callback):
+    """
+    Rebuild the Gramps objects from the tables written by ExportSql.
+
+    In bulk mode (the default) each child table is read once, and its rows
+    are grouped in memory by the handle they hang off, instead of issuing
+    a separate select for every name, date, link, etc. of every object.
+    """
+    def __init__(self, db, filename, callback, bulk=True):
         if not callable(callback):
             callback = lambda percent: None # dummy
         self.db = db
         self.filename = filename
         self.callback = callback
         self.debug = 0
+        self.bulk = bulk
+        self.groups = {}
 
     def openSQL(self):
         try:
@@ -145,8 +173,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "address")
         retval = []
         for handle in results:
-            result = sql.query("select * from address where handle = ?;",
-                               handle)
+            result = self.get_rows(sql, "address", "handle", handle)
             retval.append(self.pack_address(sql, result[0], with_parish))
         return retval
 
@@ -154,8 +181,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "attribute")
         retval = []
         for handle in handles:
-            rows = sql.query("select * from attribute where handle = ?;",
-                             handle)
+            rows = self.get_rows(sql, "attribute", "handle", handle)
             for row in rows:
                 (handle,
                  the_type0,
@@ -172,8 +198,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "child_ref")
         retval = []
         for handle in results:
-            rows = sql.query("select * from child_ref where handle = ?;",
-                             handle)
+            rows = self.get_rows(sql, "child_ref", "handle", handle)
             for row in rows:
                 (handle, ref, frel0, frel1, mrel0, mrel1, private) = row
                 citation_list = self.get_citation_list(sql, "child_ref", handle)
@@ -184,8 +209,7 @@ class SQLReader(object):
 
     def get_datamap_list(self, sql, from_type, from_handle):
         datamap = []
-        rows = sql.query("select * from datamap where from_handle = ?;",
-                         from_handle)
+        rows = self.get_rows(sql, "datamap", "from_handle", from_handle)
         for row in rows:
             (from_handle,
              the_type0,
@@ -199,8 +223,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "event_ref")
         retval = []
         for handle in results:
-            result = sql.query("select * from event_ref where handle = ?;",
-                               handle)
+            result = self.get_rows(sql, "event_ref", "handle", handle)
             retval.append(self.pack_event_ref(sql, result[0]))
         return retval
 
@@ -214,8 +237,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "person_ref")
         retval = []
         for ref_handle in handles:
-            rows = sql.query("select * from person_ref where handle = ?;",
-                             ref_handle)
+            rows = self.get_rows(sql, "person_ref", "handle", ref_handle)
             for row in rows:
                 (handle,
                  description,
@@ -233,28 +255,25 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "location")
         results = []
         for handle in handles:
-            results += sql.query("""select * from location where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "location", "handle", handle)
         return [self.pack_location(sql, result, with_parish) for result in results]
 
     def get_lds_list(self, sql, from_type, from_handle):
         handles = self.get_links(sql, from_type, from_handle, "lds")
         results = []
         for handle in handles:
-            results += sql.query("""select * from lds where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "lds", "handle", handle)
         return [self.pack_lds(sql, result) for result in results]
 
     def get_media_list(self, sql, from_type, from_handle):
         handles = self.get_links(sql, from_type, from_handle, "media_ref")
         results = []
         for handle in handles:
-            results += sql.query("""select * from media_ref where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "media_ref", "handle", handle)
         return [self.pack_media_ref(sql, result) for result in results]
 
     def get_surname_list(self, sql, handle):
-        results = sql.query("""select * from surname where handle = ?;""", handle)
+        results = self.get_rows(sql, "surname", "handle", handle)
         return [self.pack_surnames(sql, result) for result in results]
 
     def get_note_list(self, sql, from_type, from_handle):
@@ -264,8 +283,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "repository_ref")
         results = []
         for handle in handles:
-            results += sql.query("""select * from repository_ref where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "repository_ref", "handle", handle)
         return [self.pack_repository_ref(sql, result) for result in results]
 
     def get_citation_list(self, sql, from_type, from_handle):
@@ -276,8 +294,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "url")
         results = []
         for handle in handles:
-            results += sql.query("""select * from url where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "url", "handle", handle)
         return [self.pack_url(sql, result) for result in results]
 
     # ---------------------------------
@@ -401,8 +418,7 @@ class SQLReader(object):
     def get_location(self, sql, from_type, from_handle, with_parish):
         handle = self.get_link(sql, from_type, from_handle, "location")
         if handle:
-            results = sql.query("""select * from location where handle = ?;""",
-                                handle)
+            results = self.get_rows(sql, "location", "handle", handle)
             if len(results) == 1:
                 return self.pack_location(sql, results[0], with_parish)
 
@@ -410,8 +426,8 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "name")
         names = []
         for handle in handles:
-            results = sql.query("""select * from name where handle = ? and primary_name = ?;""",
-                                handle, primary)
+            results = [row for row in self.get_rows(sql, "name", "handle", handle)
+                       if row[1] == primary]
             if len(results) > 0:
                 names += results
         result = [self.pack_name(sql, name) for name in names]
@@ -470,8 +486,7 @@ class SQLReader(object):
 
     def get_place_from_handle(self, sql, ref_handle):
         if ref_handle:
-            place_row = sql.query("select * from place where handle = ?;",
-                                  ref_handle)
+            place_row = self.get_rows(sql, "place", "handle", ref_handle)
             if len(place_row) == 1:
                 # return just the handle here:
                 return place_row[0][0]
@@ -482,7 +497,7 @@ class SQLReader(object):
         return ''
 
     def get_alt_place_name_list(self, sql, handle):
-        place_name_list = sql.query("""select * from place_name where from_handle = ?;""", handle)
+        place_name_list = self.get_rows(sql, "place_name", "from_handle", handle)
         retval = []
         for place_name_data in place_name_list:
             ref_handle, handle, value, lang = place_name_data
@@ -493,7 +508,7 @@ class SQLReader(object):
 
     def get_place_ref_list(self, sql, handle):
         # place_ref_list = Enclosed by:  [('4ECKQCWCLO5YIHXEXC', None)] [(handle, date)...]
-        place_ref_list = sql.query("""select * from place_ref where from_place_handle = ?;""", handle)
+        place_ref_list = self.get_rows(sql, "place_ref", "from_place_handle", handle)
         retval = []
         for place_ref_data in place_ref_list:
             ref_handle, handle, to_place_handle = place_ref_data
@@ -505,8 +520,7 @@ class SQLReader(object):
     def get_main_location(self, sql, from_handle, with_parish):
         ref_handle = self.get_link(sql, "place_main", from_handle, "location")
         if ref_handle:
-            place_row = sql.query("select * from location where handle = ?;",
-                                  ref_handle)
+            place_row = self.get_rows(sql, "location", "handle", ref_handle)
             if len(place_row) == 1:
                 return self.pack_location(sql, place_row[0], with_parish)
             elif len(place_row) == 0:
@@ -515,6 +529,18 @@ class SQLReader(object):
                 print("ERROR: get_main_location('%s') should be unique; returned %d records." % (ref_handle, len(place_row)))
         return gramps.gen.lib.Location().serialize()
 
+    def get_rows(self, sql, table, column, value):
+        """
+        Return the rows of table where column equals value.
+        """
+        if not self.bulk:
+            return sql.query("select * from %s where %s = ?;" % (table, column),
+                             value)
+        key = (table, column)
+        if key not in self.groups:
+            self.groups[key] = sql.group_by(table, (column,))
+        return self.groups[key].get((value,), [])
+
     def get_link(self, sql, from_type, from_handle, to_link):
         """
         Return a link, and return handle.
@@ -532,6 +558,14 @@ class SQLReader(object):
         """
         Return a list of handles (possibly none).
         """
+        if self.bulk:
+            key = ("link", "from_type", "from_handle", "to_type")
+            if key not in self.groups:
+                self.groups[key] = sql.group_by(
+                    "link", ("from_type", "from_handle", "to_type"),
+                    "to_handle")
+            return list(self.groups[key].get((from_type, from_handle, to_link),
+                                             []))
         results = sql.query("""select to_handle from link where from_type = ? and from_handle = ? and to_type = ?;""",
                             from_type, from_handle, to_link)
         return [result[0] for result in results]
@@ -539,7 +573,7 @@ class SQLReader(object):
     def get_date(self, sql, handle):
         assert type(handle) in [str, type(None)], "handle is wrong type: %s" % handle
         if handle:
-            rows = sql.query("select * from date where handle = ?;", handle)
+            rows = self.get_rows(sql, "date", "handle", handle)
             if len(rows) == 1:
                 (handle,
                  calendar,
@@ -595,11 +629,9 @@ class SQLReader(object):
                  change,
                  private) = note
                 styled_text = [text, []]
-                markups = sql.query("""select * from link where from_handle = ? and to_type = 'markup';""",
-                                    handle)
-                for markup_link in markups:
-                    from_type, from_handle, to_type, to_handle = markup_link
-                    markup_detail = sql.query("""select * from markup where handle = ?;""", to_handle)
+                markups = self.get_links(sql, "note", handle, "markup")
+                for to_handle in markups:
+                    markup_detail = self.get_rows(sql, "markup", "handle", to_handle)
                     for markup in markup_detail:
                         (mhandle,
                          markup0,
@@ -933,6 +965,7 @@ class SQLReader(object):
                                         color,
                                         priority,
                                         change)
+        self.groups = {}
         sql.db.commit()
         sql.db.close()
         return None
@@ -945,8 +978,8 @@ class SQLReader(object):
         print(msg)
 
 
-def importData(db, filename, callback=None):
-    g = SQLReader(db, filename, callback)
+def importData(db, filename, callback=None, bulk=True):
+    g = SQLReader(db, filename, callback, bulk)
     g.process()
     g.cleanup()
 
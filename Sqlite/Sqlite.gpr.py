@@ -2,7 +2,7 @@ register(IMPORT,
          id    = 'im_sqlite',
          name  = _('SQLite Import'),
          description =  _('SQLite is a common local database format'),
-         version = '1.0.28',
+         version = '1.0.29',
          gramps_target_version = "5.0",
          status = STABLE, # tested with python 3, need to review unicode usage
          fname = 'ImportSql.py',
@@ -14,7 +14,7 @@ register(EXPORT,
          id    = 'ex_sqlite',
          name  = _('SQLite Export'),
          description =  _('SQLite is a common local database format'),
-         version = '1.0.27',
+         version = '1.0.28',
          gramps_target_version = "5.0",
          status = STABLE, # tested with python 3 but still gives errors
          fname = 'ExportSql.py',
@@ -22,3 +22,17 @@ register(EXPORT,
          extension = "sql",
          export_options = 'WriterOptionBox'
 )
+
+register(EXPORT,
+         id    = 'ex_sqlite_incremental',
+         name  = _('SQLite Export (update existing)'),
+         description =  _('Update a previous SQLite export with the objects '
+                          'changed since it was made'),
+         version = '1.0.28',
+         gramps_target_version = "5.0",
+         status = STABLE,
+         fname = 'ExportSql.py',
+         export_function = 'exportIncremental',
+         extension = "sql",
+         export_options = 'WriterOptionBox'
+)
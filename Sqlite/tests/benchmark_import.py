@@ -0,0 +1,76 @@
+"""
+Time the SQLite import on a generated file, with and without bulk mode.
+
+Run from the addons-source directory with Gramps on the path, e.g.:
+
+    python -m Sqlite.tests.benchmark_import 100000
+"""
+import os
+import sys
+import time
+import tempfile
+
+from gramps.gen.dbstate import DbState
+from gramps.gen.lib import Person, Name, Surname, Event, EventRef, Date
+from gramps.cli.user import User
+
+from ..ImportSql import importData as importSQL
+from ..ExportSql import (Database, makeDB, makeIndexes, export_person,
+                         export_event)
+
+def make_sql(filename, count):
+    """
+    Write count people, each with a birth event, straight into an export
+    file.
+    """
+    db = Database(filename)
+    db.tune(True)
+    makeDB(db)
+    db.batch = True
+    for i in range(count):
+        event = Event()
+        event.set_handle("E%07d" % i)
+        event.set_gramps_id("E%07d" % i)
+        event.set_date_object(Date(1800 + i % 200, 1 + i % 12, 1 + i % 28))
+        export_event(db, event.serialize())
+        ref = EventRef()
+        ref.set_reference_handle(event.get_handle())
+        person = Person()
+        person.set_handle("P%07d" % i)
+        person.set_gramps_id("I%07d" % i)
+        name = Name()
+        name.set_first_name("Given%d" % i)
+        surname = Surname()
+        surname.set_surname("Surname%d" % (i % 1000))
+        name.add_surname(surname)
+        person.set_primary_name(name)
+        person.add_event_ref(ref)
+        person.set_birth_ref(ref)
+        export_person(db, person.serialize())
+    db.batch = False
+    db.flush()
+    db.db.commit()
+    makeIndexes(db)
+    db.close()
+
+def time_import(filename, path, bulk):
+    database = DbState().make_database("bsddb")
+    os.mkdir(path)
+    database.write_version(path)
+    database.load(path)
+    start = time.time()
+    importSQL(database, filename, User(), bulk=bulk)
+    elapsed = time.time() - start
+    database.close()
+    return elapsed
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, "benchmark.sql")
+    make_sql(filename, count)
+    bulk = time_import(filename, os.path.join(tmpdir, "bulk"), True)
+    print("bulk import of %d people: %.1f seconds" % (count, bulk))
+    rows = time_import(filename, os.path.join(tmpdir, "rows"), False)
+    print("row import of %d people: %.1f seconds" % (count, rows))
+    print("speedup: %.1fx" % (rows / bulk))
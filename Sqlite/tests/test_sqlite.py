@@ -1,12 +1,15 @@
 from gramps.gen.dbstate import DbState
+from gramps.gen.db import DbTxn
 from gramps.plugins.importer.importxml import importData as importXML
 from gramps.cli.user import User
 
 from ..ImportSql import importData as importSQL
 from ..ExportSql import exportData as exportSQL
+from ..ExportSql import exportIncremental as exportSQLIncremental
 
 import unittest
 import os
+import sqlite3
 
 dbstate = DbState()
 gramps_path = os.environ["GRAMPS_RESOURCES"]
@@ -37,4 +40,70 @@ class ExportSQLTestCase (unittest.TestCase):
     def test_export_sql(self):
         importSQL(self.database2, "/tmp/exported1.sql", User())
 
+    def test_bulk_import_matches_row_import(self):
+        importSQL(self.database2, "/tmp/exported1.sql", User(), bulk=False)
+        database3 = dbstate.make_database("bsddb")
+        try:
+            os.mkdir("/tmp/bsddb_exportsql_3")
+        except:
+            pass
+        database3.write_version("/tmp/bsddb_exportsql_3")
+        database3.load("/tmp/bsddb_exportsql_3")
+        importSQL(database3, "/tmp/exported1.sql", User(), bulk=True)
+        for handle in self.database2.get_person_handles():
+            self.assertEqual(
+                self.database2.get_raw_person_data(handle),
+                database3.get_raw_person_data(handle))
+        for handle in self.database2.get_family_handles():
+            self.assertEqual(
+                self.database2.get_raw_family_data(handle),
+                database3.get_raw_family_data(handle))
+        database3.close()
+
+
 
+    def test_incremental_export(self):
+        # Change a person and delete a note after the export in setUp
+        person = self.database1.get_person_from_gramps_id("I0044")
+        person.get_primary_name().set_first_name("Changed")
+        note_handle = self.database1.get_note_handles()[0]
+        with DbTxn("Edit", self.database1) as trans:
+            self.database1.commit_person(person, trans)
+            self.database1.remove_note(note_handle, trans)
+        person = self.database1.get_person_from_handle(person.handle)
+
+        exportSQLIncremental(self.database1, "/tmp/exported1.sql")
+
+        connection = sqlite3.connect("/tmp/exported1.sql")
+        self.assertEqual(
+            connection.execute("select gid, change from person "
+                               "where handle = ?;",
+                               (person.handle,)).fetchall(),
+            [(person.gramps_id, person.get_change_time())])
+        self.assertEqual(
+            connection.execute("select name.first_name from name, link "
+                               "where link.from_handle = ? and "
+                               "link.to_handle = name.handle and "
+                               "name.primary_name;",
+                               (person.handle,)).fetchall(),
+            [("Changed",)])
+        self.assertEqual(
+            connection.execute("select count(*) from note where handle = ?;",
+                               (note_handle,)).fetchone()[0], 0)
+        self.assertEqual(
+            connection.execute("select count(*) from link "
+                               "where from_handle = ?;",
+                               (note_handle,)).fetchone()[0], 0)
+        self.assertEqual(
+            connection.execute("select count(*) from note;").fetchone()[0],
+            self.database1.get_number_of_notes())
+        connection.close()
+
+        importSQL(self.database2, "/tmp/exported1.sql", User())
+        self.assertEqual(sorted(self.database1.get_person_handles()),
+                         sorted(self.database2.get_person_handles()))
+        self.assertEqual(
+            self.database2.get_person_from_handle(person.handle)
+            .get_primary_name().get_first_name(), "Changed")
+        self.assertEqual(self.database2.get_number_of_notes(),
+                         self.database1.get_number_of_notes())
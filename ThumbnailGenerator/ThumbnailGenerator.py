@@ -21,6 +21,23 @@
 
 """Tools/Utilities/Thumbnail Generator"""
 
+#-------------------------------------------------------------------------
+#
+# Python modules
+#
+#-------------------------------------------------------------------------
+import os
+import logging
+import multiprocessing
+from hashlib import md5
+
+#-------------------------------------------------------------------------
+#
+# GTK modules
+#
+#-------------------------------------------------------------------------
+from gi.repository import GdkPixbuf
+
 #-------------------------------------------------------------------------
 #
 # Gramps modules
@@ -28,8 +45,11 @@
 #-------------------------------------------------------------------------
 from gramps.gui.plug import tool
 from gramps.gui.utils import ProgressMeter
-from gramps.gen.utils.thumbnails import get_thumbnail_image, SIZE_NORMAL, SIZE_LARGE
+from gramps.gen.utils.thumbnails import (get_thumbnail_path, SIZE_NORMAL,
+                                         SIZE_LARGE)
 from gramps.gen.utils.file import media_path_full
+from gramps.gen.const import (THUMBSCALE, THUMBSCALE_LARGE, THUMB_NORMAL,
+                              THUMB_LARGE)
 
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 try:
@@ -38,6 +58,8 @@ except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
+LOG = logging.getLogger(".ThumbnailGenerator")
+
 #-------------------------------------------------------------------------
 #
 # Thumbnail Generator
@@ -52,82 +74,167 @@ class ThumbnailGenerator(tool.Tool):
         self.db = dbstate.db
         progress = ProgressMeter(_('Thumbnail Generator'), can_cancel=True)
 
-        length = self.db.get_number_of_media()
-        progress.set_pass(_('Generating media thumbnails'),
-                               length)
-        for media in dbstate.db.iter_media():
-            full_path = media_path_full(dbstate.db, media.get_path())
-            mime_type = media.get_mime_type()
-            generate_thumbnail(full_path, mime_type)
-            progress.step()
-            if progress.get_cancelled():
-                break
-
-        length = self.db.get_number_of_people()
-        progress.set_pass(_('Generating thumbnails for person references'),
-                               length)
-        for person in dbstate.db.iter_people():
-            self.generate_thumbnails(person)
-            progress.step()
-            if progress.get_cancelled():
-                break
+        # The rectangles to generate thumbnails for, by media file
+        self.thumbnails = {}
 
-        length = self.db.get_number_of_families()
-        progress.set_pass(_('Generating thumbnails for family references'),
-                               length)
-        for family in dbstate.db.iter_families():
-            self.generate_thumbnails(family)
-            progress.step()
-            if progress.get_cancelled():
-                break
-
-        length = self.db.get_number_of_events()
-        progress.set_pass(_('Generating thumbnails for event references'),
-                               length)
-        for event in dbstate.db.iter_events():
-            self.generate_thumbnails(event)
-            progress.step()
-            if progress.get_cancelled():
-                break
-
-        length = self.db.get_number_of_places()
-        progress.set_pass(_('Generating thumbnails for place references'),
-                               length)
-        for place in dbstate.db.iter_places():
-            self.generate_thumbnails(place)
-            progress.step()
-            if progress.get_cancelled():
-                break
-
-        length = self.db.get_number_of_sources()
-        progress.set_pass(_('Generating thumbnails for source references'),
-                               length)
-        for source in dbstate.db.iter_sources():
-            self.generate_thumbnails(source)
+        length = self.db.get_number_of_media()
+        progress.set_pass(_('Finding media'), length)
+        for media in self.db.iter_media():
+            self.add_thumbnail(media, None)
             progress.step()
             if progress.get_cancelled():
-                break
+                progress.close()
+                return
+
+        for (header, length, objects) in (
+                (_('Finding person references'),
+                 self.db.get_number_of_people(), self.db.iter_people),
+                (_('Finding family references'),
+                 self.db.get_number_of_families(), self.db.iter_families),
+                (_('Finding event references'),
+                 self.db.get_number_of_events(), self.db.iter_events),
+                (_('Finding place references'),
+                 self.db.get_number_of_places(), self.db.iter_places),
+                (_('Finding source references'),
+                 self.db.get_number_of_sources(), self.db.iter_sources)):
+            progress.set_pass(header, length)
+            for obj in objects():
+                self.add_references(obj)
+                progress.step()
+                if progress.get_cancelled():
+                    progress.close()
+                    return
+
+        jobs = [(full_path, mime_type, list(rectangles))
+                for (full_path, (mime_type, rectangles))
+                in self.thumbnails.items()]
+        progress.set_pass(_('Generating media thumbnails'), len(jobs))
+
+        # Each media file is decoded once, and the files are shared out
+        # between processes when it is worth it.
+        processes = os.cpu_count() or 1
+        pool = None
+        if processes > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(generate_thumbnails, jobs)
+        else:
+            results = map(generate_thumbnails, jobs)
+        try:
+            for result in results:
+                progress.step()
+                if progress.get_cancelled():
+                    break
+        finally:
+            if pool:
+                pool.terminate()
 
         progress.close()
 
-    def generate_thumbnails(self, obj):
+    def add_references(self, obj):
         """
-        Generate thumbnails for media references of a given object. 
+        Add the media references of a given object.
         """
         for media_ref in obj.get_media_list():
             handle = media_ref.get_reference_handle()
             media = self.db.get_media_from_handle(handle)
-            full_path = media_path_full(self.db, media.get_path())
-            mime_type = media.get_mime_type()
-            rectangle = media_ref.get_rectangle()
-            generate_thumbnail(full_path, mime_type, rectangle)
+            self.add_thumbnail(media, media_ref.get_rectangle())
+
+    def add_thumbnail(self, media, rectangle):
+        """
+        Add a rectangle of a media object to the thumbnails to generate.
+        """
+        full_path = media_path_full(self.db, media.get_path())
+        if full_path not in self.thumbnails:
+            self.thumbnails[full_path] = (media.get_mime_type(), set())
+        self.thumbnails[full_path][1].add(rectangle)
+
+def build_thumb_path(path, rectangle=None, size=SIZE_NORMAL):
+    """
+    Return the path of the thumbnail of a file, or of a subsection of it.
 
-def generate_thumbnail(full_path, mime_type, rectangle=None):
+    The thumbnails must be written where Gramps looks for them, so this
+    follows __build_thumb_path in gramps/gen/utils/thumbnails.py of
+    Gramps 5.0, which is private to that module.
+    """
+    extra = ""
+    if rectangle is not None:
+        extra = "?" + str(rectangle)
+    md5_hash = md5((path + extra).encode('utf-8'))
+    if size == SIZE_LARGE:
+        base_dir = THUMB_LARGE
+    else:
+        base_dir = THUMB_NORMAL
+    return os.path.join(base_dir, md5_hash.hexdigest() + ".png")
+
+def generate_thumbnails(job):
     """
-    Generate thumbnails for an image rectangle.
+    Generate the thumbnails of a media file that are missing or older than
+    the file, for the whole image and each of the given rectangles.
+    Images are decoded once, and all of their thumbnails are scaled from the
+    decoded image in the same way as Gramps does.
     """
-    get_thumbnail_image(full_path, mime_type, rectangle, SIZE_NORMAL)
-    get_thumbnail_image(full_path, mime_type, rectangle, SIZE_LARGE)
+    full_path, mime_type, rectangles = job
+    if not os.path.isfile(full_path):
+        return
+    mtime = os.path.getmtime(full_path)
+
+    needed = []
+    for rectangle in rectangles:
+        for size in (SIZE_NORMAL, SIZE_LARGE):
+            filename = build_thumb_path(full_path, rectangle, size)
+            if (not os.path.isfile(filename) or
+                    mtime > os.path.getmtime(filename)):
+                needed.append((rectangle, size, filename))
+    if not needed:
+        return
+
+    if mime_type and not mime_type.startswith('image/'):
+        # Not an image, so leave it to the thumbnailer
+        for (rectangle, size, filename) in needed:
+            get_thumbnail_path(full_path, mime_type, rectangle, size)
+        return
+
+    try:
+        image = GdkPixbuf.Pixbuf.new_from_file(full_path)
+    except Exception as err:
+        LOG.warning("Error loading image: %s", str(err))
+        return
+
+    for (rectangle, size, filename) in needed:
+        try:
+            pixbuf = image
+            width = pixbuf.get_width()
+            height = pixbuf.get_height()
+
+            if rectangle is not None:
+                upper_x = min(rectangle[0], rectangle[2])/100.
+                lower_x = max(rectangle[0], rectangle[2])/100.
+                upper_y = min(rectangle[1], rectangle[3])/100.
+                lower_y = max(rectangle[1], rectangle[3])/100.
+                sub_x = int(upper_x * width)
+                sub_y = int(upper_y * height)
+                sub_width = int((lower_x - upper_x) * width)
+                sub_height = int((lower_y - upper_y) * height)
+                if sub_width > 0 and sub_height > 0:
+                    pixbuf = pixbuf.new_subpixbuf(sub_x, sub_y,
+                                                  sub_width, sub_height)
+                    width = sub_width
+                    height = sub_height
+
+            if size == SIZE_LARGE:
+                thumbscale = THUMBSCALE_LARGE
+            else:
+                thumbscale = THUMBSCALE
+            scale = thumbscale / (float(max(width, height)))
+
+            scaled_width = int(width * scale)
+            scaled_height = int(height * scale)
+
+            pixbuf = pixbuf.scale_simple(scaled_width, scaled_height,
+                                         GdkPixbuf.InterpType.BILINEAR)
+            pixbuf.savev(filename, "png", "", "")
+        except Exception as err:
+            LOG.warning("Error scaling image down: %s", str(err))
 
 #------------------------------------------------------------------------
 #